@@ -1,4 +1,4 @@
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, jsonify, request
 from flask_migrate import Migrate
 from flask_cors import CORS
 from datetime import datetime, timedelta
@@ -22,6 +22,13 @@ from email.mime.multipart import MIMEMultipart
 from twilio.rest import Client
 import requests
 import json
+from app.services.notification_counters import register_unread_tracking
+from app.services.notification_stream import register_stream_publishing
+from app.services.notification_outbox import OutboxDispatcher, enqueue_notification_delivery
+from app.services.notification_coalescing import notify_coalesced, send_notification_digests
+from app.utils.downloads import send_stored_file
+from app.services.attachment_integrity import check_attachment_files
+from app.utils.work_queue import run_concurrently
 
 load_dotenv()
 
@@ -36,6 +43,8 @@ app.config['JSON_SORT_KEYS'] = False
 app.config['JWT_SECRET_KEY'] = app.config['SECRET_KEY']
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
 app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=7)
+app.config['DOWNLOAD_OFFLOAD'] = os.getenv('DOWNLOAD_OFFLOAD')
+app.config['DOWNLOAD_ACCEL_PREFIX'] = os.getenv('DOWNLOAD_ACCEL_PREFIX', '/protected-uploads/')
 
 # Mpesa configs
 MPESA_CONSUMER_KEY = os.getenv('MPESA_CONSUMER_KEY')
@@ -64,6 +73,10 @@ def send_notification(user_id, title, message, notification_type):
 
 db.init_app(app)
 migrate = Migrate(app, db)
+# Keep users.unread_notifications and the Redis badge counters in step, and
+# push new notifications to open SSE streams
+register_unread_tracking(Notification)
+register_stream_publishing(Notification)
 CORS(app)
 bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
@@ -73,6 +86,7 @@ app.register_blueprint(bid_routes_bp, url_prefix='')
 
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'txt'}
+PROJECT_UPLOAD_WORKERS = int(os.getenv('PROJECT_UPLOAD_WORKERS', 4))
 
 class FileHandler:
     @staticmethod
@@ -114,16 +128,12 @@ class NotificationService:
                 created_at=datetime.utcnow()
             )
             db.session.add(notification)
-            db.session.commit()
             
-            # Send email notification if user has email
+            # Email (and SMS, for users with email) go out through the outbox
             user = db.session.get(User, user_id)
             if user and user.email:
-                NotificationService._send_email(user.email, title, message)
-                
-                # Send SMS if user has phone
-                if user.phone:
-                    NotificationService._send_sms(user.phone, f"{title}: {message}")
+                enqueue_notification_delivery(db.session, notification, email=user.email, phone=user.phone)
+            db.session.commit()
                 
             return True
             
@@ -132,33 +142,28 @@ class NotificationService:
             db.session.rollback()
             return False
     
+    # Called by the outbox dispatcher, which retries on any exception
     @staticmethod
     def _send_email(to_email, subject, message):
-        try:
-            msg = MIMEMultipart()
-            msg['From'] = EMAIL_FROM
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            msg.attach(MIMEText(message, 'plain'))
-            
-            with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-                server.starttls()
-                server.login(SMTP_USERNAME, SMTP_PASSWORD)
-                server.send_message(msg)
-        except Exception as e:
-            print(f"Error sending email: {e}")
+        msg = MIMEMultipart()
+        msg['From'] = EMAIL_FROM
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(message, 'plain'))
+        
+        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+            server.starttls()
+            server.login(SMTP_USERNAME, SMTP_PASSWORD)
+            server.send_message(msg)
     
     @staticmethod
     def _send_sms(to_phone, message):
-        try:
-            client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-            client.messages.create(
-                body=message,
-                from_=TWILIO_PHONE_NUMBER,
-                to=to_phone
-            )
-        except Exception as e:
-            print(f"Error sending SMS: {e}")
+        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        client.messages.create(
+            body=message,
+            from_=TWILIO_PHONE_NUMBER,
+            to=to_phone
+        )
 
 class AccessControl:
     @staticmethod
@@ -631,7 +636,12 @@ def submit_bid(project_id):
             project.customer_id,
             "New Bid Received",
             f"A new bid has been submitted for your project: {project.title}",
-            "new_bid"
+            "new_bid",
+            group_key=f"project:{project.id}",
+            aggregate=lambda count: (
+                "New Bids Received",
+                f"{count} new bids have been submitted for your project: {project.title}"
+            )
         )
         
         bid_data = {
@@ -1058,18 +1068,26 @@ def create_project():
         db.session.flush()  
         
         if files:
-            file_handler = FileHandler()
-            for file in files:
-                if file and file.filename != '':
-                    _, file_path = file_handler.save_file(file, project.id)
-                    document = Attachment(
-                        job_id=project.id,
-                        filename=file.filename,
-                        file_url=file_path,
-                        uploaded_by=current_user.id,
-                        user_id=current_user.id
-                    )
-                    db.session.add(document)
+            # Files are written concurrently; the session stays on this thread
+            files = [file for file in files if file and file.filename != '']
+            saved = {}
+            def save(item):
+                index, file = item
+                saved[index] = FileHandler.save_file(file, project.id)[1]
+            _, failed = run_concurrently(list(enumerate(files)), save, max_workers=PROJECT_UPLOAD_WORKERS)
+            if failed:
+                raise failed[0][1]
+            for index, file in enumerate(files):
+                document = Attachment(
+                    job_id=project.id,
+                    filename=file.filename,
+                    file_url=saved[index],
+                    file_size=os.path.getsize(saved[index]),
+                    mime_type=FileHandler.get_mime_type(file.filename),
+                    uploaded_by=current_user.id,
+                    user_id=current_user.id
+                )
+                db.session.add(document)
         
         db.session.commit()
         
@@ -1136,21 +1154,28 @@ def has_document_access(user_id, attachment):
 def list_project_documents(project):
     """List all documents for a project"""
     try:
-        attachments = Attachment.query.filter_by(job_id=project.id).all()
+        # Served from attachment columns only; missing files are flagged by the integrity check
+        attachments = db.session.query(
+            Attachment.id,
+            Attachment.filename,
+            Attachment.uploaded_at,
+            Attachment.uploaded_by,
+            Attachment.mime_type,
+            Attachment.file_size,
+            Attachment.missing_at
+        ).filter_by(job_id=project.id).order_by(Attachment.uploaded_at, Attachment.id).all()
         current_user = get_current_user()
         
         result = []
         for attachment in attachments:
-            file_path = attachment.file_url
-            file_exists = os.path.exists(file_path)
-            
             result.append({
                 'id': attachment.id,
                 'filename': attachment.filename,
                 'uploaded_at': attachment.uploaded_at.isoformat(),
                 'uploaded_by': attachment.uploaded_by,
-                'file_type': FileHandler.get_mime_type(attachment.filename),
-                'size': os.path.getsize(file_path) if file_exists else 0,
+                'file_type': attachment.mime_type or FileHandler.get_mime_type(attachment.filename),
+                'size': attachment.file_size or 0,
+                'missing': attachment.missing_at is not None,
                 'is_owner': attachment.uploaded_by == current_user.id,
                 'file_url': f'/api/documents/{attachment.id}'
             })
@@ -1176,15 +1201,15 @@ def download_document(document_id):
         if not has_access:
             return jsonify({'error': message}), 403
     
-        if not os.path.exists(attachment.file_url):
+        try:
+            return send_stored_file(
+                attachment.file_url,
+                attachment.filename,
+                mimetype=FileHandler.get_mime_type(attachment.filename),
+                internal_path=os.path.relpath(attachment.file_url, UPLOAD_FOLDER)
+            )
+        except FileNotFoundError:
             return jsonify({'error': 'File not found'}), 404
-   
-        return send_file(
-            attachment.file_url,
-            as_attachment=True,
-            download_name=attachment.filename,
-            mimetype=FileHandler.get_mime_type(attachment.filename)
-        )
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -1409,6 +1434,8 @@ def upload_document(project):
         attachment = Attachment(
             file_url=filepath,
             filename=filename,
+            file_size=os.path.getsize(filepath),
+            mime_type=FileHandler.get_mime_type(filename),
             uploaded_by=current_user.id,
             user_id=current_user.id,
             job_id=project.id
@@ -1528,6 +1555,43 @@ def send_sms(to, message):
     print(f"[MOCK] SMS sent to {to}: {message}")
     return True
 
+def deliver_email(to, subject, body):
+    if SMTP_SERVER:
+        NotificationService._send_email(to, subject, body)
+    else:
+        send_email(to, subject, body)
+
+def deliver_sms(to, subject, body):
+    if TWILIO_ACCOUNT_SID:
+        NotificationService._send_sms(to, body)
+    else:
+        send_sms(to, body)
+
+outbox_dispatcher = OutboxDispatcher(
+    {'email': deliver_email, 'sms': deliver_sms},
+    interval=int(os.getenv('OUTBOX_DISPATCH_INTERVAL', 5)),
+    jobs=[(
+        int(os.getenv('NOTIFICATION_DIGEST_INTERVAL', 900)),
+        lambda session: send_notification_digests(session, Notification, User)
+    )]
+)
+
+@app.before_request
+def start_outbox_dispatcher():
+    outbox_dispatcher.ensure_running(app, db)
+
+@app.cli.command('check-attachment-integrity')
+def check_attachment_integrity():
+    """Flag attachments whose stored file is missing and backfill size and MIME type."""
+    # Stats every stored file, so it runs on its own (e.g. from cron) rather than
+    # on the outbox thread; attachment paths are relative to the working directory
+    report = check_attachment_files(
+        db.session, '',
+        batch_size=int(os.getenv('ATTACHMENT_INTEGRITY_BATCH_SIZE', 500)),
+        pause=float(os.getenv('ATTACHMENT_INTEGRITY_PAUSE', 0.1))
+    )
+    print(f"Attachment integrity check: {report}")
+
 def get_google_oauth2_token():
     """Get OAuth 2.0 token for Google APIs"""
     token_url = os.getenv('GOOGLE_TOKEN_URI')
@@ -1706,7 +1770,17 @@ def place_details(place_id):
     
     return jsonify(result)
 
-def send_notification(user_id, title, message, notification_type):
+def send_notification(user_id, title, message, notification_type, group_key=None, aggregate=None):
+    if group_key:
+        # Bursty notifications merge into one row and go out in the next digest
+        notify_coalesced(
+            db.session, Notification, user_id, notification_type, group_key, title, message,
+            aggregate=aggregate,
+            window=int(os.getenv('NOTIFICATION_COALESCE_WINDOW', 600))
+        )
+        db.session.commit()
+        return
+    
     content = message
     notification = Notification(
         user_id=user_id,
@@ -1717,14 +1791,16 @@ def send_notification(user_id, title, message, notification_type):
         read=False
     )
     db.session.add(notification)
-    db.session.commit()
     
-    # Optionally send email/SMS
+    # Email/SMS are queued in the same transaction and sent by the outbox dispatcher
     user = db.session.get(User, user_id)
-    if user and hasattr(user, 'email') and user.email:
-        send_email(user.email, title, message)
-    if user and hasattr(user, 'phone') and user.phone:
-        send_sms(user.phone, f"{title}: {message}")
+    if user:
+        enqueue_notification_delivery(
+            db.session, notification,
+            email=getattr(user, 'email', None),
+            phone=getattr(user, 'phone', None)
+        )
+    db.session.commit()
 
 def notify_status_change(project, old_status, new_status):
     try:
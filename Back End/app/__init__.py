@@ -5,6 +5,7 @@ from datetime import timedelta
 # Import extensions
 from .extensions import db, jwt, migrate, cache, cors, init_redis
 from .services.cloudinary_storage import cloudinary_storage
+from .services.image_variants import image_variants
 
 # Import CLI commands
 from commands import init_app as init_commands
@@ -69,6 +70,9 @@ def create_app(config_name=None):
     # Initialize payment service
     mpesa_service.init_app(app)
     
+    # Image variants are rendered in a process pool sized from config
+    image_variants.init_app(app)
+    
     # Initialize Cloudinary storage if configured
     if app.config.get('STORAGE_PROVIDER') == 'cloudinary':
         cloudinary_storage.init_app(app)
@@ -10,6 +10,7 @@ from flask_caching import Cache
 from flask_cors import CORS
 from datetime import timedelta
 import logging
+from .utils.token_blocklist import TokenBlocklist
 
 logger = logging.getLogger(__name__)
 
@@ -22,13 +23,14 @@ cors = CORS()
 
 def init_redis(app):
     """Initialize Redis connection with proper error handling"""
-    global redis_client, jwt_redis_blocklist
+    global redis_client, jwt_redis_blocklist, token_blocklist
     
     redis_url = app.config.get('REDIS_URL')
     if not redis_url:
         logger.warning("No REDIS_URL configured, Redis features will be disabled")
         redis_client = None
         jwt_redis_blocklist = None
+        token_blocklist = None
         return
 
     try:
@@ -37,26 +39,31 @@ def init_redis(app):
         redis_client.ping()
         logger.info("Successfully connected to Redis")
         jwt_redis_blocklist = redis_client
+        token_blocklist = TokenBlocklist(
+            redis_client,
+            capacity=app.config.get('JWT_BLOCKLIST_FILTER_CAPACITY', 100000),
+            error_rate=app.config.get('JWT_BLOCKLIST_FILTER_ERROR_RATE', 0.001)
+        )
     except (redis.RedisError, ConnectionError) as e:
         logger.warning(f"Failed to connect to Redis: {str(e)}. Redis features will be disabled")
         redis_client = None
         jwt_redis_blocklist = None
+        token_blocklist = None
 
 # Initialize Redis as None initially
 redis_client = None
 jwt_redis_blocklist = None
+token_blocklist = None
 
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload):
     """Check if a JWT exists in the redis blocklist"""
     if not current_app.config.get('JWT_BLOCKLIST_ENABLED', True):
         return False
-    if not jwt_redis_blocklist:
+    if not token_blocklist:
         return False
-    jti = jwt_payload["jti"]
-    # Use the same key structure as in the logout route
-    token_in_redis = jwt_redis_blocklist.get(f'jwt_blocklist:{jti}')
-    return token_in_redis is not None
+    # Only Bloom filter hits are confirmed against Redis
+    return token_blocklist.is_revoked(jwt_payload["jti"])
 
 @jwt.revoked_token_loader
 def handle_revoked_token(jwt_header, jwt_payload):
@@ -1,10 +1,62 @@
+import math
+import threading
 import time
+import uuid
 from functools import wraps
 from flask import request, jsonify, g
 import redis
-from .. import redis_client
+from .. import extensions
 import logging
 
+logger = logging.getLogger(__name__)
+
+# Sliding-window log kept in a sorted set scored by arrival time (ms).
+# Trimming, counting, admitting and computing the reset time happen in a
+# single server-side call, so concurrent requests can never overshoot the
+# limit the way a GET-then-INCR sequence could. Several keys (e.g. the IP,
+# user and role dimensions of one request) are checked together and the
+# request is only recorded against them if every one has room.
+#
+# KEYS[n]  - rate limit keys
+# ARGV[1]  - unique member, then ARGV[2n], ARGV[2n+1] - limit and window (s) of KEYS[n]
+# Returns {allowed, remaining_1, reset_after_ms_1, remaining_2, ...}
+SLIDING_WINDOW_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local allowed = 1
+local counts = {}
+
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 2])
+    local window = tonumber(ARGV[i * 2 + 1]) * 1000
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    counts[i] = redis.call('ZCARD', key)
+    if counts[i] >= limit then
+        allowed = 0
+    end
+end
+
+local result = {allowed}
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 2])
+    local window = tonumber(ARGV[i * 2 + 1]) * 1000
+    if allowed == 1 then
+        redis.call('ZADD', key, now, ARGV[1])
+        redis.call('PEXPIRE', key, window)
+        counts[i] = counts[i] + 1
+    end
+
+    local reset_after = window
+    local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+    if oldest[2] then
+        reset_after = tonumber(oldest[2]) + window - now
+    end
+    table.insert(result, math.max(0, limit - counts[i]))
+    table.insert(result, reset_after)
+end
+return result
+"""
+
 class RateLimitExceeded(Exception):
     """Exception raised when rate limit is exceeded."""
     def __init__(self, message, limit, remaining, reset_time):
@@ -14,6 +66,303 @@ class RateLimitExceeded(Exception):
         self.reset_time = reset_time
         super().__init__(self.message)
 
+def _combine_results(checks, allowed, per_check):
+    """
+    Reduce per-check (remaining, reset) pairs to the result reported to the client.
+    
+    When the request is denied the exhausted check is reported, otherwise the
+    check with the fewest remaining requests.
+    """
+    candidates = [
+        (remaining, reset, limit)
+        for (_, limit, _), (remaining, reset) in zip(checks, per_check)
+        if allowed or remaining <= 0
+    ]
+    remaining, reset, limit = min(candidates, key=lambda c: (c[0], -c[1]))
+    return {
+        'allowed': allowed,
+        'limit': limit,
+        'remaining': remaining,
+        'reset': reset
+    }
+
+class SlidingWindowLimiter:
+    """Redis-backed sliding-window limiter evaluated by a single Lua script."""
+    
+    def __init__(self, redis_client):
+        """
+        Initialize the limiter.
+        
+        Args:
+            redis_client: A Redis client instance
+        """
+        self.redis = redis_client
+        # register_script runs via EVALSHA and only falls back to loading
+        # the script when Redis reports NOSCRIPT (e.g. after a restart)
+        self.script = redis_client.register_script(SLIDING_WINDOW_SCRIPT)
+    
+    def preload(self):
+        """Load the script into the Redis script cache ahead of the first request."""
+        try:
+            self.redis.script_load(SLIDING_WINDOW_SCRIPT)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to preload rate limit script: {str(e)}")
+    
+    def hit(self, key, limit, per):
+        """
+        Record a request against a key and check it against the limit.
+        
+        Args:
+            key: The rate limit key
+            limit: Maximum number of requests allowed in the time window
+            per: Time window in seconds
+            
+        Returns:
+            dict: 'allowed', 'limit', 'remaining' and 'reset' (epoch seconds)
+        """
+        return self.hit_many([(key, limit, per)])
+    
+    def hit_many(self, checks):
+        """
+        Check several (key, limit, per) limits in one script call.
+        
+        The request is only counted if every limit has room.
+        
+        Returns:
+            dict: 'allowed', 'limit', 'remaining' and 'reset' of the tightest limit
+        """
+        args = [uuid.uuid4().hex]
+        for _, limit, per in checks:
+            args.extend([limit, per])
+        
+        result = self.script(keys=[key for key, _, _ in checks], args=args)
+        now = int(time.time())
+        per_check = [
+            (int(result[i]), now + math.ceil(int(result[i + 1]) / 1000))
+            for i in range(1, len(result), 2)
+        ]
+        return _combine_results(checks, bool(int(result[0])), per_check)
+
+class LocalTokenBucketLimiter:
+    """
+    In-process token-bucket limiter used when Redis is missing or unreachable.
+    
+    Buckets are spread over independently locked shards so concurrent request
+    threads rarely contend, and idle buckets are pruned periodically. Limits
+    are enforced per worker process, so they are approximate across a pool.
+    """
+    
+    def __init__(self, shards=16, prune_interval=60):
+        """
+        Initialize the limiter.
+        
+        Args:
+            shards: Number of independently locked bucket maps
+            prune_interval: Seconds between sweeps for idle buckets
+        """
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+        self.prune_interval = prune_interval
+        self._next_prune = time.monotonic() + prune_interval
+    
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+    
+    def hit(self, key, limit, per):
+        """
+        Take a token for a key if one is available.
+        
+        Args:
+            key: The rate limit key
+            limit: Bucket capacity (requests allowed per window)
+            per: Time window in seconds over which the bucket refills
+            
+        Returns:
+            dict: 'allowed', 'limit', 'remaining' and 'reset' (epoch seconds)
+        """
+        return self.hit_many([(key, limit, per)])
+    
+    def hit_many(self, checks):
+        """
+        Take a token from each (key, limit, per) bucket, but only if all have one.
+        
+        Returns:
+            dict: 'allowed', 'limit', 'remaining' and 'reset' of the tightest limit
+        """
+        now = time.monotonic()
+        # Lock the shards involved in a fixed order so concurrent multi-key
+        # checks cannot deadlock
+        shard_ids = sorted({hash(key) % len(self._shards) for key, _, _ in checks})
+        locks = [self._shards[i][1] for i in shard_ids]
+        
+        for lock in locks:
+            lock.acquire()
+        try:
+            levels = []
+            for key, limit, per in checks:
+                buckets = self._shard(key)[0]
+                tokens, updated, _ = buckets.get(key, (limit, now, per))
+                levels.append(min(limit, tokens + (now - updated) * limit / per))
+            
+            allowed = all(tokens >= 1 for tokens in levels)
+            if allowed:
+                levels = [tokens - 1 for tokens in levels]
+            for (key, _, per), tokens in zip(checks, levels):
+                self._shard(key)[0][key] = (tokens, now, per)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        
+        if now >= self._next_prune:
+            self.prune(now)
+        
+        # Denied callers wait for the next token; admitted ones see when the
+        # bucket is full again, mirroring the reset of the Redis window
+        wall = int(time.time())
+        per_check = []
+        for (_, limit, per), tokens in zip(checks, levels):
+            missing = (1 - tokens) if tokens < 1 else (limit - tokens)
+            per_check.append((int(tokens), wall + math.ceil(missing * per / limit)))
+        return _combine_results(checks, allowed, per_check)
+    
+    def prune(self, now=None):
+        """
+        Drop buckets that have been idle long enough to have refilled completely.
+        
+        Returns:
+            int: Number of buckets removed
+        """
+        now = now if now is not None else time.monotonic()
+        self._next_prune = now + self.prune_interval
+        removed = 0
+        
+        for buckets, lock in self._shards:
+            with lock:
+                idle = [key for key, (_, updated, per) in buckets.items() if now - updated >= per]
+                for key in idle:
+                    del buckets[key]
+                removed += len(idle)
+        return removed
+
+# Seconds to keep using the local limiter after a Redis error before retrying Redis
+REDIS_RETRY_INTERVAL = 30
+
+_limiter = None
+_local_limiter = LocalTokenBucketLimiter()
+_redis_retry_at = 0
+
+def get_limiter():
+    """Return the Redis limiter, or the in-process limiter if Redis is unavailable."""
+    global _limiter
+    
+    client = extensions.redis_client
+    if client is None or time.monotonic() < _redis_retry_at:
+        return _local_limiter
+    if _limiter is None or _limiter.redis is not client:
+        _limiter = SlidingWindowLimiter(client)
+    return _limiter
+
+def hit(key, limit, per):
+    """Record a request against a single key using the best available backend."""
+    return hit_many([(key, limit, per)])
+
+def hit_many(checks):
+    """
+    Record a request against several (key, limit, per) limits using the best available backend.
+    
+    Falls back to the in-process limiter when the Redis call fails, and keeps
+    using it for REDIS_RETRY_INTERVAL seconds so requests do not each pay
+    for a connection timeout while Redis is down.
+    """
+    global _redis_retry_at
+    
+    limiter = get_limiter()
+    if limiter is not _local_limiter:
+        try:
+            return limiter.hit_many(checks)
+        except (redis.RedisError, ConnectionError) as e:
+            logger.warning(f"Redis rate limiting failed: {str(e)}. Using in-process limiter")
+            _redis_retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+    return _local_limiter.hit_many(checks)
+
+class RateLimitPolicies:
+    """
+    RATE_LIMITS compiled into a longest-prefix table.
+    
+    Each pattern maps to a single limit dict or a list of them. A limit dict
+    holds 'limit' and 'per' plus an optional 'by' dimension: 'ip' (default),
+    'user' or 'role'. User and role limits only apply to authenticated
+    requests and may be restricted to certain roles with 'roles'. A trailing
+    '*' on a pattern is ignored, so 'api.v1.*' and 'api.v1.' are equivalent.
+    
+    Example:
+        RATE_LIMITS = {
+            'bid.': [
+                {'limit': 100, 'per': 60},
+                {'limit': 30, 'per': 60, 'by': 'user', 'roles': ['professional']},
+                {'limit': 1000, 'per': 60, 'by': 'role'},
+            ],
+        }
+    """
+    
+    DIMENSIONS = ('ip', 'user', 'role')
+    
+    def __init__(self, rate_limits):
+        table = []
+        for pattern, config in (rate_limits or {}).items():
+            policies = config if isinstance(config, (list, tuple)) else [config]
+            compiled = []
+            for policy in policies:
+                by = policy.get('by', 'ip')
+                if by not in self.DIMENSIONS:
+                    raise ValueError(f"Unknown rate limit dimension '{by}' for pattern '{pattern}'")
+                compiled.append({
+                    'limit': policy.get('limit', 100),
+                    'per': policy.get('per', 60),  # Default: 100 requests per minute
+                    'by': by,
+                    'roles': set(policy['roles']) if policy.get('roles') else None
+                })
+            table.append((pattern.rstrip('*'), compiled))
+        
+        # Longest prefix first, so the first match is the most specific one
+        self._table = sorted(table, key=lambda entry: len(entry[0]), reverse=True)
+        self._resolved = {}
+    
+    def resolve(self, endpoint):
+        """Return the policies for an endpoint, memoized since Flask endpoints are a finite set."""
+        try:
+            return self._resolved[endpoint]
+        except KeyError:
+            pass
+        
+        policies = []
+        for prefix, compiled in self._table:
+            if endpoint.startswith(prefix):
+                policies = compiled
+                break
+        self._resolved[endpoint] = policies
+        return policies
+    
+    def checks_for(self, endpoint, ip, user_id=None, roles=()):
+        """Build the (key, limit, per) checks that apply to a request."""
+        checks = []
+        for policy in self.resolve(endpoint):
+            if policy['by'] == 'ip':
+                checks.append((f"rate_limit:{endpoint}:{ip}", policy['limit'], policy['per']))
+                continue
+            
+            if user_id is None:
+                continue
+            matching_roles = [role for role in roles if policy['roles'] is None or role in policy['roles']]
+            if not matching_roles:
+                continue
+            
+            if policy['by'] == 'user':
+                checks.append((f"rate_limit:{endpoint}:user:{user_id}", policy['limit'], policy['per']))
+            else:
+                for role in matching_roles:
+                    checks.append((f"rate_limit:{endpoint}:role:{role}", policy['limit'], policy['per']))
+        return checks
+
 def get_remote_address():
     """Get the IP address of the client."""
     # Check for forwarded IP (if behind a proxy)
@@ -38,44 +387,20 @@ def get_rate_limit(limit, per):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            # Skip rate limiting if Redis is not available
-            if not redis_client:
-                return f(*args, **kwargs)
-                
-            key = get_rate_limit_key()
-            current = redis_client.get(key)
-            
-            # If the key doesn't exist, set it with an expiration time
-            if current is None:
-                redis_client.setex(key, per, 1)
-                current = 1
-            else:
-                current = int(current)
-                
-            # Check if the rate limit has been exceeded
-            if current >= limit:
-                # Get the time until the rate limit resets
-                ttl = redis_client.ttl(key)
+            result = hit(get_rate_limit_key(), limit, per)
+            if not result['allowed']:
                 raise RateLimitExceeded(
                     message="Rate limit exceeded. Please try again later.",
                     limit=limit,
                     remaining=0,
-                    reset_time=int(time.time()) + ttl
+                    reset_time=result['reset']
                 )
             
-            # Increment the counter
-            redis_client.incr(key)
-            
-            # Set the expiration time if this is the first increment in the window
-            if current == 0:
-                redis_client.expire(key, per)
-            
             # Add rate limit headers to the response
-            remaining = limit - current - 1
             g.rate_limit = {
                 'limit': limit,
-                'remaining': max(0, remaining),
-                'reset': int(time.time()) + (redis_client.ttl(key) or per)
+                'remaining': result['remaining'],
+                'reset': result['reset']
             }
             
             return f(*args, **kwargs)
@@ -83,8 +408,18 @@ def get_rate_limit(limit, per):
     return decorator
 
 def init_rate_limit(app):
-    """Initialize rate limiting for the application."""
-    logger = logging.getLogger(__name__)
+    """
+    Initialize rate limiting for the application.
+    
+    User and role limits read the identity loaded by the auth middleware, so
+    init_auth_middleware should be registered before this.
+    """
+    policies = RateLimitPolicies(app.config.get('RATE_LIMITS', {}))
+    app.extensions['rate_limit_policies'] = policies
+    
+    limiter = get_limiter()
+    if limiter is not _local_limiter:
+        limiter.preload()
     
     @app.before_request
     def check_rate_limit():
@@ -92,56 +427,40 @@ def init_rate_limit(app):
         # Skip rate limiting for certain endpoints
         if request.endpoint in ['static', 'auth.login', 'auth.register', 'health']:
             return
-            
-        # Get rate limit configuration for the current endpoint
-        rate_limits = app.config.get('RATE_LIMITS', {})
-        endpoint = request.endpoint or 'default'
-        
-        # Apply the most specific rate limit that matches the endpoint
-        limit_config = None
-        for pattern, config in rate_limits.items():
-            if endpoint.startswith(pattern):
-                limit_config = config
-                break
         
-        if not limit_config:
+        endpoint = request.endpoint or 'default'
+        checks = policies.checks_for(
+            endpoint,
+            get_remote_address(),
+            user_id=g.get('user_id'),
+            roles=g.get('roles') or ()
+        )
+        if not checks:
             return
-            
-        limit = limit_config.get('limit', 100)
-        per = limit_config.get('per', 60)  # Default: 100 requests per minute
         
         # Apply rate limiting
-        key = f"rate_limit:{endpoint}:{get_remote_address()}"
-        current = redis_client.get(key)
-        
-        if current is None:
-            redis_client.setex(key, per, 1)
-            current = 1
-        else:
-            current = int(current)
+        result = hit_many(checks)
             
-        if current >= limit:
-            ttl = redis_client.ttl(key)
+        if not result['allowed']:
+            reset_in = max(0, result['reset'] - int(time.time()))
             response = jsonify({
                 'success': False,
                 'error': 'Rate limit exceeded. Please try again later.',
-                'limit': limit,
+                'limit': result['limit'],
                 'remaining': 0,
-                'reset_in': ttl
+                'reset_in': reset_in
             })
-            response.headers['X-RateLimit-Limit'] = limit
+            response.headers['X-RateLimit-Limit'] = result['limit']
             response.headers['X-RateLimit-Remaining'] = 0
-            response.headers['X-RateLimit-Reset'] = int(time.time()) + ttl
+            response.headers['X-RateLimit-Reset'] = result['reset']
             response.status_code = 429
             return response
-            
-        redis_client.incr(key)
         
         # Add rate limit headers to the response
         g.rate_limit = {
-            'limit': limit,
-            'remaining': max(0, limit - current - 1),
-            'reset': int(time.time()) + (redis_client.ttl(key) or per)
+            'limit': result['limit'],
+            'remaining': result['remaining'],
+            'reset': result['reset']
         }
     
     @app.after_request
@@ -159,6 +478,7 @@ def init_rate_limit(app):
         response = jsonify({
             'success': False,
             'error': str(e),
+            'message': str(e),
             'limit': e.limit,
             'remaining': e.remaining,
             'reset_in': e.reset_time - int(time.time())
@@ -6,9 +6,10 @@ from .user import User, UserRole
 from .job import Job, JobStatus
 from .bid import Bid, BidStatus, BidTeamMember
 from .message import Message, Review
-from .notification import Notification, ProjectStatusHistory
+from .notification import Notification, NotificationArchive, OutboxMessage, ProjectStatusHistory
+from .email import EmailQueue
 from .category import Category, Skill, ProfessionalSkill
-from .attachment import Attachment
+from .attachment import Attachment, Blob, DocumentPage, UploadChunk, UploadSession
 from .payment import PaymentTransaction, PaymentStatus, PaymentMethod
 
 # Import enums
@@ -21,9 +22,10 @@ __all__ = [
     'Job', 'JobStatus',
     'Bid', 'BidStatus', 'BidTeamMember',
     'Message', 'Review',
-    'Notification', 'ProjectStatusHistory',
+    'Notification', 'NotificationArchive', 'OutboxMessage', 'ProjectStatusHistory',
+    'EmailQueue',
     'Category', 'Skill', 'ProfessionalSkill',
-    'Attachment',
+    'Attachment', 'Blob', 'DocumentPage', 'UploadChunk', 'UploadSession',
     'PaymentTransaction', 'PaymentStatus', 'PaymentMethod',
     'UserRole', 'JobStatus', 'BidStatus', 'NotificationType'
 ]
\ No newline at end of file
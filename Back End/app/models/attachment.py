@@ -1,7 +1,33 @@
 from .base import BaseModel
 from app import db
+from sqlalchemy import DDL, event
 from sqlalchemy.orm import validates
 
+class Blob(BaseModel):
+    """Stored file content, shared by every attachment with the same SHA-256."""
+    __tablename__ = 'blobs'
+    
+    sha256 = db.Column(db.String(64), nullable=False, unique=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    mime_type = db.Column(db.String(100), nullable=True)
+    storage_key = db.Column(db.String(255), nullable=False, comment='Cloudinary public_id or local file path')
+    public_url = db.Column(db.String(512), nullable=True, comment='Set once the content is held by a remote provider')
+    ref_count = db.Column(db.Integer, nullable=False, default=0, comment='Attachments referencing this blob')
+    page_count = db.Column(db.Integer, nullable=True, comment='Pages of a PDF, set once its text is being indexed')
+    text_indexed_at = db.Column(db.DateTime, nullable=True, comment='When every page of the text was indexed')
+    offload_attempts = db.Column(db.Integer, nullable=False, default=0, comment='Failed pushes of the staged copy to remote storage')
+    offload_next_at = db.Column(db.DateTime, nullable=True, comment='When the staged copy may next be pushed to remote storage')
+    offload_error = db.Column(db.Text, nullable=True)
+
+class DocumentPage(BaseModel):
+    """Text extracted from one page of a stored document, indexed for full-text search."""
+    __tablename__ = 'document_pages'
+    __table_args__ = (db.UniqueConstraint('blob_id', 'page_number', name='uq_document_pages_blob_page'),)
+    
+    blob_id = db.Column(db.Integer, db.ForeignKey('blobs.id', ondelete='CASCADE'), nullable=False)
+    page_number = db.Column(db.Integer, nullable=False, comment='1-based')
+    text = db.Column(db.Text, nullable=False, default='')
+
 class Attachment(BaseModel):
     __tablename__ = 'attachments'
     
@@ -10,14 +36,17 @@ class Attachment(BaseModel):
     filename = db.Column(db.String(255), nullable=False)
     mime_type = db.Column(db.String(100), nullable=True)
     file_size = db.Column(db.Integer, nullable=True, comment='File size in bytes')
+    missing_at = db.Column(db.DateTime, nullable=True, comment='When the integrity check last found the stored file missing')
     
     # Foreign keys
     uploaded_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     job_id = db.Column(db.Integer, db.ForeignKey('jobs.id'))
     bid_id = db.Column(db.Integer, db.ForeignKey('bids.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    blob_id = db.Column(db.Integer, db.ForeignKey('blobs.id'), index=True)
     
     # Relationships
+    blob = db.relationship('Blob')
     job = db.relationship('Job', foreign_keys=[job_id], back_populates='job_documents')
     bid = db.relationship('Bid', foreign_keys=[bid_id], back_populates='bid_attachments')
     uploader = db.relationship('User', foreign_keys=[uploaded_by], back_populates='uploaded_attachments')
@@ -38,6 +67,8 @@ class Attachment(BaseModel):
             'filename': self.filename,
             'mime_type': self.mime_type,
             'file_size': self.file_size,
+            'missing': self.missing_at is not None,
+            'thumbnail_url': self.get_variant_url('thumb'),
             'uploaded_at': self.created_at.isoformat() if self.created_at else None,
             'uploaded_by': self.uploader.to_dict() if self.uploader else None,
             'job_id': self.job_id,
@@ -58,3 +89,94 @@ class Attachment(BaseModel):
         # Fallback to local file URL
         from flask import url_for
         return url_for('document.download_document', attachment_id=self.id, _external=True)
+
+    def get_variant_url(self, size):
+        """Get the URL of a resized variant of this image, or None for other files."""
+        from app.services.image_variants import VARIANT_SIZES, VARIANT_SOURCE_TYPES
+        from flask import current_app, url_for
+        
+        if self.mime_type not in VARIANT_SOURCE_TYPES:
+            return None
+        
+        if current_app.config.get('STORAGE_PROVIDER') == 'cloudinary' and self.public_url:
+            # Cloudinary renders and caches its own derivatives
+            from app.services.cloudinary_storage import cloudinary_storage
+            edge = VARIANT_SIZES[size]
+            return cloudinary_storage.get_file_url(
+                self.file_url,
+                secure=True,
+                transformation={'width': edge, 'height': edge, 'crop': 'limit', 'fetch_format': 'auto', 'quality': 'auto'}
+            )
+        if self.blob_id is None:
+            return None
+        return url_for('document.get_image_variant', attachment_id=self.id, size=size)
+
+class UploadSession(BaseModel):
+    """A resumable upload in progress, received in numbered chunks."""
+    __tablename__ = 'upload_sessions'
+    
+    token = db.Column(db.String(32), nullable=False, unique=True, comment='Public ID of the upload')
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True, comment='Extended by every chunk received')
+    
+    # Attachment to create once the upload is complete
+    document_type = db.Column(db.String(20), nullable=False, default='other')
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    job_id = db.Column(db.Integer, db.ForeignKey('jobs.id'))
+    bid_id = db.Column(db.Integer, db.ForeignKey('bids.id'))
+    title = db.Column(db.String(255))
+    description = db.Column(db.Text)
+    
+    chunks = db.relationship('UploadChunk', cascade='all, delete-orphan', passive_deletes=True, lazy='dynamic')
+    
+    @property
+    def chunk_count(self):
+        return max(-(-self.total_size // self.chunk_size), 1)
+    
+    def chunk_length(self, index):
+        """Expected length in bytes of a chunk; only the last one may be short."""
+        return min(self.chunk_size, self.total_size - index * self.chunk_size)
+
+class UploadChunk(db.Model):
+    """A chunk of a resumable upload that has been written to its temporary file."""
+    __tablename__ = 'upload_chunks'
+    
+    session_id = db.Column(db.Integer, db.ForeignKey('upload_sessions.id', ondelete='CASCADE'), primary_key=True)
+    index = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+
+# Project document listings are served from this index alone
+db.Index('ix_attachments_job_created', Attachment.job_id, Attachment.created_at)
+
+# Full-text index over document_pages.text: an external-content FTS5 table kept
+# in sync by triggers on SQLite, a generated tsvector column with a GIN index on
+# Postgres. Migration d3a8e61f4b27 creates the same objects.
+DOCUMENT_SEARCH_DDL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE document_pages_fts USING fts5("
+        "text, content='document_pages', content_rowid='id', tokenize='porter unicode61')",
+        "CREATE TRIGGER document_pages_fts_insert AFTER INSERT ON document_pages BEGIN "
+        "INSERT INTO document_pages_fts(rowid, text) VALUES (new.id, new.text); END",
+        "CREATE TRIGGER document_pages_fts_delete AFTER DELETE ON document_pages BEGIN "
+        "INSERT INTO document_pages_fts(document_pages_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+        "CREATE TRIGGER document_pages_fts_update AFTER UPDATE OF text ON document_pages BEGIN "
+        "INSERT INTO document_pages_fts(document_pages_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+        "INSERT INTO document_pages_fts(rowid, text) VALUES (new.id, new.text); END",
+    ],
+    'postgresql': [
+        "ALTER TABLE document_pages ADD COLUMN search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', text)) STORED",
+        "CREATE INDEX ix_document_pages_search_vector ON document_pages USING gin (search_vector)",
+    ],
+}
+
+for _dialect, _statements in DOCUMENT_SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(DocumentPage.__table__, 'after_create', DDL(_statement).execute_if(dialect=_dialect))
+event.listen(
+    DocumentPage.__table__, 'before_drop',
+    DDL('DROP TABLE IF EXISTS document_pages_fts').execute_if(dialect='sqlite')
+)
@@ -0,0 +1,35 @@
+from app import db
+from .base import BaseModel
+
+
+class EmailQueue(BaseModel):
+    """An email waiting to be sent by the Celery email tasks, with its retry state."""
+    __tablename__ = 'email_queue'
+    
+    subject = db.Column(db.String(255), nullable=False)
+    recipient_email = db.Column(db.String(255), nullable=False)
+    recipient_name = db.Column(db.String(100))
+    sender_email = db.Column(db.String(255))
+    sender_name = db.Column(db.String(100))
+    # Rendered at send time when no body is given
+    template_name = db.Column(db.String(100))
+    context = db.Column(db.JSON)
+    text_body = db.Column(db.Text)
+    html_body = db.Column(db.Text)
+    priority = db.Column(db.String(10), nullable=False, default='normal')
+    # pending -> sending -> sent, or back to pending until it is failed
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    scheduled_at = db.Column(db.DateTime, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_attempt_at = db.Column(db.DateTime)
+    error = db.Column(db.Text)
+    last_error = db.Column(db.Text)
+    sent_at = db.Column(db.DateTime)
+    # Notification created for this user once the email is sent
+    notification_user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    notification_title = db.Column(db.String(200))
+    notification_message = db.Column(db.Text)
+    notification_data = db.Column(db.JSON)
+
+# Senders claim due emails by status and scheduled time
+db.Index('ix_email_queue_status_scheduled', EmailQueue.status, EmailQueue.scheduled_at)
@@ -1,6 +1,8 @@
 from .base import BaseModel
 from .enums import NotificationType
 from app import db
+from ..services.notification_counters import register_unread_tracking
+from ..services.notification_stream import register_stream_publishing
 
 class Notification(BaseModel):
     __tablename__ = 'notifications'
@@ -11,6 +13,11 @@ class Notification(BaseModel):
     title = db.Column(db.String(200), nullable=False)
     message = db.Column(db.Text, nullable=False)
     notification_type = db.Column(db.String(50))
+    # Coalesced notifications share a group key; group_count is how many were merged
+    group_key = db.Column(db.String(100))
+    group_count = db.Column(db.Integer, nullable=False, default=1)
+    # Waiting to go out in the next email/SMS digest
+    digest_pending = db.Column(db.Boolean, nullable=False, default=False, index=True)
     
     def to_dict(self):
         return {
@@ -20,10 +27,61 @@ class Notification(BaseModel):
             'content': self.content,
             'read': self.read,
             'notification_type': self.notification_type,
+            'group_count': self.group_count,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'user_id': self.user_id
         }
 
+# Keyset pagination of the inbox walks these newest-first, so neither deep
+# pages nor unread filtering need to scan a user's older notifications
+db.Index(
+    'ix_notifications_user_read_created',
+    Notification.user_id, Notification.read, Notification.created_at.desc(), Notification.id
+)
+db.Index(
+    'ix_notifications_user_created',
+    Notification.user_id, Notification.created_at.desc(), Notification.id
+)
+# Finding the open group a new notification is merged into
+db.Index(
+    'ix_notifications_user_group',
+    Notification.user_id, Notification.group_key, Notification.created_at
+)
+
+register_unread_tracking(Notification)
+register_stream_publishing(Notification)
+
+
+class NotificationArchive(db.Model):
+    """A notification moved out of the hot table by the retention job, stored as compressed JSON."""
+    __tablename__ = 'notifications_archive'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)
+
+
+class OutboxMessage(BaseModel):
+    """An email or SMS waiting to be delivered, written in the same transaction as its notification."""
+    __tablename__ = 'notification_outbox'
+    
+    channel = db.Column(db.String(20), nullable=False)
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255))
+    body = db.Column(db.Text, nullable=False)
+    dedupe_key = db.Column(db.String(255), unique=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False)
+    claimed_by = db.Column(db.String(32))
+    last_error = db.Column(db.Text)
+    sent_at = db.Column(db.DateTime)
+
+# The dispatcher polls for due pending messages
+db.Index('ix_notification_outbox_status_next_attempt', OutboxMessage.status, OutboxMessage.next_attempt_at)
+
 
 class ProjectStatusHistory(BaseModel):
     __tablename__ = 'project_status_history'
@@ -21,6 +21,8 @@ class User(BaseModel):
     total_bids = db.Column(db.Integer, default=0)
     is_active = db.Column(db.Boolean, default=True)
     is_verified = db.Column(db.Boolean, default=False)
+    last_active = db.Column(db.DateTime, index=True)
+    unread_notifications = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     business_name = db.Column(db.String(255))
     business_description = db.Column(db.Text)
     business_address = db.Column(db.String(500))
@@ -81,6 +83,11 @@ class User(BaseModel):
         """Check if the provided password matches the stored hash."""
         return check_password_hash(self._password, password)
     
+    def update_last_active(self):
+        """Record activity through the write-behind buffer instead of updating the row."""
+        from ..utils.activity import last_active_buffer
+        last_active_buffer.record(self.id)
+    
     @classmethod
     def create(cls, **kwargs):
         """Create a new user with hashed password."""
@@ -276,8 +276,9 @@ def logout():
         # Add the token to the blocklist with an expiration time (24 hours from now)
         expires_delta = timedelta(hours=24)
         
-        from app.extensions import redis_client
-        redis_client.set(f'jwt_blocklist:{jti}', 'true', ex=expires_delta)
+        # Stored in Redis and published so every worker's filter picks it up
+        from app.extensions import token_blocklist
+        token_blocklist.revoke(jti, expires_delta)
         
         return jsonify({
             'status': 'success',
@@ -2,14 +2,26 @@ from flask import Blueprint, request, jsonify, send_from_directory, current_app,
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
 import os
-import uuid
 from datetime import datetime
 from ..extensions import db
 
-from ..models import Attachment, Job, Bid, User, UserRole
+from ..models import Attachment, Job, Bid, User, UserRole, UploadSession
 from ..utils.decorators import role_required
+from ..utils.downloads import send_stored_file
 from ..utils.helpers import allowed_file
+from ..utils.storage import FileTooLargeError
+from ..utils.uploads import INCOMING_FOLDER, discard_upload, receive_upload
+from ..services.blob_storage import CloudinaryBlobStore, LocalBlobStore, release_blob, store_blob
+from ..services import document_index
 from ..services.cloudinary_storage import cloudinary_storage
+from ..services.storage_tiering import TieredBlobStore, get_provider
+from ..services.resumable_uploads import (
+    ResumableUploadError, close_upload_session, create_upload_session, finish_upload, stage_for_storage,
+    upload_status, write_chunk
+)
+from ..services.image_variants import (
+    VARIANT_FORMATS, VARIANT_SIZES, VARIANT_SOURCE_TYPES, VariantError, image_variants, variant_key
+)
 
 # Create document blueprint
 document_bp = Blueprint('document', __name__)
@@ -45,6 +57,113 @@ def check_document_permission(attachment, user):
     
     return False
 
+DOCUMENT_TYPES = ['profile', 'bid', 'job', 'other']
+
+def _allowed_extensions():
+    """All file extensions allowed by the ALLOWED_EXTENSIONS config groups."""
+    allowed_extensions = set()
+    for ext_group in current_app.config['ALLOWED_EXTENSIONS'].values():
+        allowed_extensions.update(ext_group)
+    return allowed_extensions
+
+def _save_attachment(upload, filename, current_user_id, user_id, document_type, job_id=None, bid_id=None,
+                     title='', description=''):
+    """Store a received upload and create its attachment; returns the response."""
+    file_size = upload.size
+    mime_type = upload.mime_type
+    
+    # Store the content once per SHA-256; a duplicate upload only adds a reference.
+    # With STORAGE_OFFLOAD, it is stored locally and pushed to the provider in the background
+    if current_app.config.get('STORAGE_PROVIDER') == 'cloudinary' and not current_app.config.get('STORAGE_OFFLOAD'):
+        # Set resource type based on file type
+        resource_type = 'auto'  # Let Cloudinary auto-detect
+        if mime_type.startswith('image/'):
+            resource_type = 'image'
+        elif mime_type.startswith('video/'):
+            resource_type = 'video'
+        elif mime_type.startswith('application/pdf'):
+            resource_type = 'raw'
+        
+        # Prepare context and tags for better organization in Cloudinary
+        context = {
+            'user_id': str(user_id),
+            'document_type': document_type,
+            'uploaded_at': datetime.utcnow().isoformat(),
+            'title': title,
+            'description': description
+        }
+        
+        # Upload to Cloudinary with error handling
+        try:
+            blob, stored = store_blob(db.session, upload, CloudinaryBlobStore(
+                filename,
+                resource_type=resource_type,
+                context=context,
+                tags=[f"user_{user_id}", f"type_{document_type}"]
+            ))
+        except Exception as upload_error:
+            current_app.logger.error(f'Cloudinary upload error: {str(upload_error)}')
+            discard_upload(upload)
+            return jsonify({
+                'success': False,
+                'error': 'Failed to upload file to cloud storage.',
+                'details': str(upload_error)
+            }), 500
+            
+    else:
+        # Fallback to local storage
+        try:
+            blob, stored = store_blob(db.session, upload, LocalBlobStore(current_app.config['UPLOAD_FOLDER']))
+        except Exception as local_error:
+            current_app.logger.error(f'Local file save error: {str(local_error)}')
+            discard_upload(upload)
+            
+            return jsonify({
+                'success': False,
+                'error': 'Failed to save file to local storage.',
+                'details': str(local_error)
+            }), 500
+    
+    if not stored:
+        current_app.logger.debug(f'Upload matches stored blob {blob.id}; skipped the write')
+    
+    # Log before creating attachment
+    current_app.logger.debug(f"Creating attachment with - uploaded_by: {current_user_id}, "
+                          f"user_id: {user_id}, job_id: {job_id}, bid_id: {bid_id}")
+    
+    # Create attachment record
+    attachment = Attachment(
+        file_url=blob.storage_key,
+        public_url=blob.public_url,
+        filename=filename,
+        mime_type=mime_type,
+        file_size=file_size,
+        uploaded_by=current_user_id,
+        user_id=user_id,
+        job_id=job_id,
+        bid_id=bid_id,
+        blob_id=blob.id
+    )
+    
+    # Add metadata to attachment
+    if title:
+        attachment.title = title
+    if description:
+        attachment.description = description
+    
+    db.session.add(attachment)
+    db.session.commit()
+    
+    # Log successful upload
+    current_app.logger.info(f'Successfully uploaded file {attachment.id} for user {user_id}')
+    
+    return jsonify({
+        'success': True,
+        'message': 'File uploaded successfully',
+        'attachment': attachment.to_dict(),
+        'download_url': attachment.get_download_url()
+    }), 201
+
 @document_bp.route('/upload', methods=['POST'])
 @jwt_required()
 def upload_document():
@@ -95,184 +214,292 @@ def upload_document():
                            f"Bid ID: {bid_id}, User ID: {user_id}, Current User ID: {current_user_id}")
     
     # Validate document type
-    valid_document_types = ['profile', 'bid', 'job', 'other']
-    if document_type not in valid_document_types:
+    if document_type not in DOCUMENT_TYPES:
         return jsonify({
             'success': False,
-            'error': f'Invalid document type. Must be one of: {valid_document_types}.'
+            'error': f'Invalid document type. Must be one of: {DOCUMENT_TYPES}.'
         }), 400
     
-    # Set folder based on document type
-    folder = f"{document_type}s"
-    
     # Validate file extension and get file info
     filename = secure_filename(file.filename)
     file_ext = os.path.splitext(filename)[1].lower().lstrip('.')
     
-    # Get allowed extensions from config
-    allowed_extensions = set()
-    for ext_group in current_app.config['ALLOWED_EXTENSIONS'].values():
-        allowed_extensions.update(ext_group)
-    
+    allowed_extensions = _allowed_extensions()
     if file_ext not in allowed_extensions:
         return jsonify({
             'success': False,
             'error': f'File type not allowed. Allowed types: {allowed_extensions}.'
         }), 400
     
-    # Generate a unique filename with timestamp
-    timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-    unique_filename = f"{timestamp}_{uuid.uuid4().hex}{os.path.splitext(filename)[1]}"
-    
+    upload = None
     try:
-        # Read file content to get actual size
-        file_content = file.read()
-        file_size = len(file_content)
-        
-        # Reset file pointer
-        file.seek(0)
-        
-        # Check file size limit (16MB)
+        # Stream the file to disk in chunks, measuring, hashing and sniffing it on the way
         max_size = current_app.config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)
-        if file_size > max_size:
+        try:
+            upload = receive_upload(
+                file.stream,
+                os.path.join(current_app.config['UPLOAD_FOLDER'], INCOMING_FOLDER),
+                max_size,
+                filename=filename,
+                chunk_size=current_app.config.get('UPLOAD_CHUNK_SIZE', 64 * 1024)
+            )
+        except FileTooLargeError:
             return jsonify({
                 'success': False,
                 'error': f'File size exceeds maximum allowed size of {max_size / (1024 * 1024):.1f}MB.'
             }), 400
         
-        # Determine MIME type
-        mime_type = file.content_type or 'application/octet-stream'
-        
-        # Upload to Cloudinary or local storage based on configuration
-        if current_app.config.get('STORAGE_PROVIDER') == 'cloudinary':
-            # Set resource type based on file type
-            resource_type = 'auto'  # Let Cloudinary auto-detect
-            if mime_type.startswith('image/'):
-                resource_type = 'image'
-            elif mime_type.startswith('video/'):
-                resource_type = 'video'
-            elif mime_type.startswith('application/pdf'):
-                resource_type = 'raw'
-            
-            # Prepare context and tags for better organization in Cloudinary
-            context = {
-                'user_id': str(user_id),
-                'document_type': document_type,
-                'uploaded_at': datetime.utcnow().isoformat(),
-                'title': title,
-                'description': description
-            }
-            
-            # Upload to Cloudinary with error handling
-            try:
-                result = cloudinary_storage.upload_file(
-                    file,
-                    subfolder=folder,
-                    resource_type=resource_type,
-                    context=context,
-                    tags=[f"user_{user_id}", f"type_{document_type}"]
-                )
-                
-                # Log before creating attachment
-                current_app.logger.debug(f"Creating attachment with - uploaded_by: {current_user_id}, "
-                                      f"user_id: {user_id}, job_id: {job_id}, bid_id: {bid_id}")
-                
-                # Create attachment record
-                attachment = Attachment(
-                    file_url=result['public_id'],
-                    public_url=result['secure_url'],
-                    filename=filename,
-                    mime_type=mime_type,
-                    file_size=file_size,
-                    uploaded_by=current_user_id,
-                    user_id=user_id,
-                    job_id=job_id,
-                    bid_id=bid_id
-                )
-                
-                current_app.logger.debug(f"Attachment created: {attachment}")
-                current_app.logger.debug(f"Attachment uploaded_by before add: {attachment.uploaded_by}")
-                
-            except Exception as upload_error:
-                current_app.logger.error(f'Cloudinary upload error: {str(upload_error)}')
-                return jsonify({
-                    'success': False,
-                    'error': 'Failed to upload file to cloud storage.',
-                    'details': str(upload_error)
-                }), 500
-                
-        else:
-            # Fallback to local storage
-            try:
-                os.makedirs(os.path.join(current_app.config['UPLOAD_FOLDER'], folder), exist_ok=True)
-                file_path = os.path.join(folder, unique_filename)
-                full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file_path)
-                
-                # Save file
-                file.save(full_path)
-                
-                # Verify file was saved
-                if not os.path.exists(full_path):
-                    raise IOError('Failed to save file to disk')
-                
-                # Update file size with actual size
-                file_size = os.path.getsize(full_path)
-                
-                # Create attachment record
-                attachment = Attachment(
-                    file_url=file_path,
-                    filename=filename,
-                    mime_type=mime_type,
-                    file_size=file_size,
-                    uploaded_by=current_user_id,
-                    user_id=user_id,
-                    job_id=job_id,
-                    bid_id=bid_id
-                )
-                
-            except Exception as local_error:
-                current_app.logger.error(f'Local file save error: {str(local_error)}')
-                # Clean up partially saved file if it exists
-                if 'full_path' in locals() and os.path.exists(full_path):
-                    try:
-                        os.remove(full_path)
-                    except Exception as cleanup_error:
-                        current_app.logger.error(f'Error cleaning up file {full_path}: {str(cleanup_error)}')
-                
-                return jsonify({
-                    'success': False,
-                    'error': 'Failed to save file to local storage.',
-                    'details': str(local_error)
-                }), 500
-        
-        # Add metadata to attachment
-        if title:
-            attachment.title = title
-        if description:
-            attachment.description = description
-        
-        db.session.add(attachment)
-        db.session.commit()
-        
-        # Log successful upload
-        current_app.logger.info(f'Successfully uploaded file {attachment.id} for user {user_id}')
+        return _save_attachment(
+            upload, filename, current_user_id, user_id, document_type,
+            job_id=job_id, bid_id=bid_id, title=title, description=description
+        )
         
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'File upload error: {str(e)}', exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': 'An unexpected error occurred while processing your request.',
+            'details': str(e)
+        }), 500
+
+def _get_upload_session(token, user_id):
+    """The caller's open upload session with this ID, or None."""
+    upload = UploadSession.query.filter_by(token=token).first()
+    if upload is None or upload.created_by != int(user_id):
+        return None
+    return upload
+
+@document_bp.route('/uploads', methods=['POST'])
+@jwt_required()
+def create_resumable_upload():
+    """
+    Start a resumable upload of a large document.
+
+    Request format (JSON):
+    - filename: Name of the file (required)
+    - size: Size of the file in bytes (required)
+    - document_type, job_id, bid_id, user_id, title, description: As for /upload
+
+    The file is then sent with PUT /uploads/<upload_id>/chunks/<index>, each
+    chunk `chunk_size` bytes (the last may be shorter), and completed with
+    POST /uploads/<upload_id>/complete. GET /uploads/<upload_id> reports the
+    byte ranges received so far.
+    """
+    current_user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    config = current_app.config
+
+    filename = secure_filename(data.get('filename') or '')
+    if not filename:
+        return jsonify({
+            'success': False,
+            'error': 'A filename is required.'
+        }), 400
+    if os.path.splitext(filename)[1].lower().lstrip('.') not in _allowed_extensions():
+        return jsonify({
+            'success': False,
+            'error': f'File type not allowed. Allowed types: {_allowed_extensions()}.'
+        }), 400
+
+    document_type = str(data.get('document_type', 'other')).lower()
+    if document_type not in DOCUMENT_TYPES:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid document type. Must be one of: {DOCUMENT_TYPES}.'
+        }), 400
+
+    max_size = config.get('RESUMABLE_UPLOAD_MAX_SIZE', 1024 * 1024 * 1024)
+    try:
+        total_size = int(data.get('size'))
+        job_id = int(data['job_id']) if data.get('job_id') is not None else None
+        bid_id = int(data['bid_id']) if data.get('bid_id') is not None else None
+        user_id = int(data.get('user_id', current_user_id))
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'size, job_id, bid_id and user_id must be integers.'
+        }), 400
+    if not 0 < total_size <= max_size:
+        return jsonify({
+            'success': False,
+            'error': f'File size must be between 1 byte and {max_size / (1024 * 1024):.1f}MB.'
+        }), 400
+
+    try:
+        upload = create_upload_session(
+            db.session,
+            config['UPLOAD_FOLDER'],
+            created_by=int(current_user_id),
+            filename=filename,
+            total_size=total_size,
+            chunk_size=config.get('RESUMABLE_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024),
+            ttl=config.get('RESUMABLE_UPLOAD_TTL', 86400),
+            document_type=document_type,
+            user_id=user_id,
+            job_id=job_id,
+            bid_id=bid_id,
+            title=data.get('title') or None,
+            description=data.get('description') or None
+        )
         return jsonify({
             'success': True,
-            'message': 'File uploaded successfully',
-            'attachment': attachment.to_dict(),
-            'download_url': attachment.get_download_url()
+            'upload': upload_status(db.session, upload)
         }), 201
-        
+
+    except Exception as e:
+        current_app.logger.error(f'Upload session error: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Failed to start the upload. Please try again.'
+        }), 500
+
+@document_bp.route('/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_resumable_upload(upload_id):
+    """Report the byte ranges and chunks of a resumable upload received so far."""
+    upload = _get_upload_session(upload_id, get_jwt_identity())
+    if upload is None:
+        return jsonify({
+            'success': False,
+            'error': 'Upload not found.'
+        }), 404
+    return jsonify({
+        'success': True,
+        'upload': upload_status(db.session, upload)
+    })
+
+@document_bp.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@jwt_required()
+def put_upload_chunk(upload_id, index):
+    """
+    Receive one chunk of a resumable upload as the raw request body.
+
+    An optional X-Chunk-SHA256 header is checked against the bytes
+    received. Sending a chunk again overwrites it, so failed requests can
+    simply be retried.
+    """
+    upload = _get_upload_session(upload_id, get_jwt_identity())
+    if upload is None:
+        return jsonify({
+            'success': False,
+            'error': 'Upload not found.'
+        }), 404
+
+    try:
+        digest = write_chunk(
+            db.session,
+            upload,
+            current_app.config['UPLOAD_FOLDER'],
+            index,
+            request.stream,
+            ttl=current_app.config.get('RESUMABLE_UPLOAD_TTL', 86400),
+            expected_sha256=request.headers.get('X-Chunk-SHA256'),
+            piece_size=current_app.config.get('UPLOAD_CHUNK_SIZE', 64 * 1024)
+        )
+        return jsonify({
+            'success': True,
+            'index': index,
+            'sha256': digest,
+            'upload': upload_status(db.session, upload)
+        })
+
+    except ResumableUploadError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        current_app.logger.error(f'Upload chunk error: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Failed to store the chunk. Please retry it.'
+        }), 500
+
+@document_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_resumable_upload(upload_id):
+    """
+    Assemble a resumable upload into an attachment once every chunk has arrived.
+
+    An optional `sha256` (JSON) is checked against the whole file.
+    """
+    current_user_id = get_jwt_identity()
+    upload = _get_upload_session(upload_id, current_user_id)
+    if upload is None:
+        return jsonify({
+            'success': False,
+            'error': 'Upload not found.'
+        }), 404
+
+    root = current_app.config['UPLOAD_FOLDER']
+    data = request.get_json(silent=True) or {}
+    staged = None
+    try:
+        try:
+            received = finish_upload(db.session, upload, root, expected_sha256=data.get('sha256'))
+        except ResumableUploadError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'upload': upload_status(db.session, upload)
+            }), 409
+
+        # The session is closed in the attachment's transaction, and the blob is
+        # stored from a second link, so a failed store leaves the upload to retry
+        staged = stage_for_storage(received)
+        close_upload_session(db.session, upload, root, remove_file=False)
+        response, status = _save_attachment(
+            staged, upload.filename, current_user_id, upload.user_id, upload.document_type,
+            job_id=upload.job_id, bid_id=upload.bid_id,
+            title=upload.title or '', description=upload.description or ''
+        )
+        if status >= 400:
+            db.session.rollback()
+            discard_upload(staged)
+            return jsonify({
+                'success': False,
+                'error': 'Failed to store the file. Please retry completing the upload.',
+                'upload': upload_status(db.session, upload)
+            }), 503
+        discard_upload(received)
+        return response, status
+
     except Exception as e:
         db.session.rollback()
-        current_app.logger.error(f'File upload error: {str(e)}', exc_info=True)
+        discard_upload(staged)
+        current_app.logger.error(f'Upload completion error: {str(e)}', exc_info=True)
         return jsonify({
             'success': False,
             'error': 'An unexpected error occurred while processing your request.',
             'details': str(e)
         }), 500
 
+@document_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def abort_resumable_upload(upload_id):
+    """Abandon a resumable upload and discard the chunks received."""
+    upload = _get_upload_session(upload_id, get_jwt_identity())
+    if upload is None:
+        return jsonify({
+            'success': False,
+            'error': 'Upload not found.'
+        }), 404
+    try:
+        close_upload_session(db.session, upload, current_app.config['UPLOAD_FOLDER'])
+        db.session.commit()
+        return jsonify({
+            'success': True,
+            'message': 'Upload cancelled.'
+        })
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Upload cancel error: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Failed to cancel the upload.'
+        }), 500
+
 @document_bp.route('/download/<int:attachment_id>', methods=['GET'])
 @jwt_required()
 def download_document(attachment_id):
@@ -290,13 +517,13 @@ def download_document(attachment_id):
                 'error': 'Unauthorized to access this file.'
             }), 403
         
-        # If using Cloudinary, redirect to the public URL
-        if current_app.config.get('STORAGE_PROVIDER') == 'cloudinary':
-            if not attachment.public_url:
+        # Files held by a remote provider are downloaded from it; staged and local files are sent from disk
+        if attachment.public_url:
+            if current_app.config.get('STORAGE_PROVIDER') != 'cloudinary':
                 return jsonify({
-                    'success': False,
-                    'error': 'File URL not found.'
-                }), 404
+                    'success': True,
+                    'download_url': attachment.public_url
+                })
             
             # Generate a signed URL that expires in 1 hour
             try:
@@ -320,20 +547,20 @@ def download_document(attachment_id):
             # Fallback to local file system
             file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], attachment.file_url)
             
-            # Check if file exists
-            if not os.path.exists(file_path):
+            # Send the file with Range and conditional GET support, or hand it to the front proxy
+            try:
+                return send_stored_file(
+                    file_path,
+                    attachment.filename,
+                    mimetype=attachment.mime_type,
+                    etag=attachment.blob.sha256 if attachment.blob else None,
+                    internal_path=attachment.file_url
+                )
+            except FileNotFoundError:
                 return jsonify({
                     'success': False,
                     'error': 'File not found.'
                 }), 404
-            
-            # Send the file
-            return send_from_directory(
-                directory=os.path.dirname(file_path),
-                path=os.path.basename(file_path),
-                as_attachment=True,
-                download_name=attachment.filename
-            )
         
     except Exception as e:
         current_app.logger.error(f'Document download error: {str(e)}')
@@ -342,6 +569,134 @@ def download_document(attachment_id):
             'error': 'Failed to download file. Please try again.'
         }), 500
 
+@document_bp.route('/search', methods=['GET'])
+@jwt_required()
+def search_documents():
+    """
+    Full-text search of the PDF documents the current user may open.
+
+    Query parameters:
+    - q: Search terms (required)
+    - job_id: Only search this job's documents (optional)
+    - page, per_page: Paging (defaults 1 and 20, at most 100 per page)
+    """
+    current_user_id = get_jwt_identity()
+    user = db.session.get(User, current_user_id)
+
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({
+            'success': False,
+            'error': 'Search terms (q) are required.'
+        }), 400
+
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+
+    try:
+        results = document_index.search_documents(
+            db.session,
+            user,
+            query,
+            job_id=request.args.get('job_id', type=int),
+            limit=per_page,
+            offset=(page - 1) * per_page
+        )
+        return jsonify({
+            'success': True,
+            'results': results,
+            'page': page,
+            'per_page': per_page
+        })
+
+    except Exception as e:
+        current_app.logger.error(f'Document search error: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Failed to search documents. Please try again.'
+        }), 500
+
+@document_bp.route('/<int:attachment_id>/variants/<size>', methods=['GET'])
+@jwt_required()
+def get_image_variant(attachment_id, size):
+    """
+    Get a resized variant of an image attachment.
+
+    Sizes are the keys of VARIANT_SIZES (thumb, small, medium, large). The
+    format is taken from `?format=webp|jpeg`, or WebP when the client
+    accepts it. Variants missing from the cache are rendered on request.
+    """
+    current_user_id = get_jwt_identity()
+    user = db.session.get(User, current_user_id)
+
+    try:
+        attachment = Attachment.query.get_or_404(attachment_id)
+
+        if not check_document_permission(attachment, user):
+            return jsonify({
+                'success': False,
+                'error': 'Unauthorized to access this file.'
+            }), 403
+
+        fmt = request.args.get('format')
+        if fmt is None:
+            fmt = 'webp' if 'image/webp' in request.accept_mimetypes else 'jpeg'
+        if size not in VARIANT_SIZES or fmt not in VARIANT_FORMATS:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown variant; sizes: {', '.join(VARIANT_SIZES)}, formats: {', '.join(VARIANT_FORMATS)}"
+            }), 400
+
+        if attachment.mime_type not in VARIANT_SOURCE_TYPES or attachment.blob is None:
+            return jsonify({
+                'success': False,
+                'error': 'No variants available for this file.'
+            }), 404
+
+        # Cloudinary renders its own derivatives of the files it holds
+        if current_app.config.get('STORAGE_PROVIDER') == 'cloudinary' and attachment.public_url:
+            return jsonify({
+                'success': True,
+                'url': attachment.get_variant_url(size)
+            })
+
+        root = current_app.config['UPLOAD_FOLDER']
+        try:
+            path = image_variants.get(
+                root, attachment.blob.sha256, os.path.join(root, attachment.file_url), size, fmt
+            )
+        except FileNotFoundError:
+            return jsonify({
+                'success': False,
+                'error': 'File not found.'
+            }), 404
+        except VariantError as e:
+            current_app.logger.warning(f'Image variant error: {str(e)}')
+            return jsonify({
+                'success': False,
+                'error': 'This image cannot be resized.'
+            }), 422
+
+        key = variant_key(attachment.blob.sha256, size, fmt)
+        response = send_stored_file(
+            path,
+            f"{os.path.splitext(attachment.filename)[0]}_{size}.{VARIANT_FORMATS[fmt][1]}",
+            mimetype=VARIANT_FORMATS[fmt][2],
+            etag=f'{attachment.blob.sha256}-{size}-{fmt}',
+            internal_path=key,
+            as_attachment=False
+        )
+        if 'format' not in request.args:
+            response.vary.add('Accept')
+        return response
+
+    except Exception as e:
+        current_app.logger.error(f'Image variant error: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Failed to load image. Please try again.'
+        }), 500
+
 @document_bp.route('/<int:attachment_id>', methods=['DELETE'])
 @jwt_required()
 def delete_document(attachment_id):
@@ -359,25 +714,40 @@ def delete_document(attachment_id):
                 'error': 'Unauthorized to delete this file.'
             }), 403
         
-        # Delete the file from storage
-        if current_app.config.get('STORAGE_PROVIDER') == 'cloudinary':
-            try:
-                # Delete from Cloudinary
-                cloudinary_storage.delete_file(attachment.file_url)
-            except Exception as e:
-                current_app.logger.error(f'Failed to delete file from Cloudinary: {str(e)}')
-                # Continue with the deletion of the database record even if file deletion fails
+        if attachment.blob_id:
+            # Shared content is only deleted with its last attachment, once the deletion commits
+            provider = get_provider(current_app.config) if current_app.config.get('STORAGE_OFFLOAD') else None
+            if provider is not None:
+                store = TieredBlobStore(current_app.config['UPLOAD_FOLDER'], provider)
+            elif current_app.config.get('STORAGE_PROVIDER') == 'cloudinary':
+                store = CloudinaryBlobStore(attachment.filename)
+            else:
+                store = LocalBlobStore(current_app.config['UPLOAD_FOLDER'])
+            blob_id = attachment.blob_id
+            db.session.delete(attachment)
+            db.session.flush()
+            release_blob(db.session, blob_id, store)
         else:
-            # Fallback to local file system
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], attachment.file_url)
-            if os.path.exists(file_path):
+            # Files stored before content addressing belong to this attachment alone
+            if current_app.config.get('STORAGE_PROVIDER') == 'cloudinary':
                 try:
-                    os.remove(file_path)
+                    # Delete from Cloudinary
+                    cloudinary_storage.delete_file(attachment.file_url)
                 except Exception as e:
-                    current_app.logger.error(f'Failed to delete local file {file_path}: {str(e)}')
+                    current_app.logger.error(f'Failed to delete file from Cloudinary: {str(e)}')
+                    # Continue with the deletion of the database record even if file deletion fails
+            else:
+                # Fallback to local file system
+                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], attachment.file_url)
+                if os.path.exists(file_path):
+                    try:
+                        os.remove(file_path)
+                    except Exception as e:
+                        current_app.logger.error(f'Failed to delete local file {file_path}: {str(e)}')
+            
+            # Delete the attachment record
+            db.session.delete(attachment)
         
-        # Delete the attachment record
-        db.session.delete(attachment)
         db.session.commit()
         
         return jsonify({
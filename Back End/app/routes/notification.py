@@ -1,9 +1,13 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
+from sqlalchemy import tuple_
 
 from ..models import db, Notification, User, UserRole
 from ..utils.decorators import role_required
+from ..utils.helpers import parse_bool, encode_cursor, decode_cursor
+from ..services.notification_counters import get_unread_count as get_cached_unread_count, record_unread_delta
+from ..services.notification_stream import notification_events, stream_slots
 
 # Create notification blueprint
 notification_bp = Blueprint('notification', __name__)
@@ -11,14 +15,32 @@ notification_bp = Blueprint('notification', __name__)
 @notification_bp.route('', methods=['GET'])
 @jwt_required()
 def get_notifications():
-    """Get all notifications for the current user."""
+    """
+    Get notifications for the current user, newest first.
+    
+    Pages are addressed with opaque keyset cursors: pass `before=<next_cursor>`
+    for older notifications and `after=<prev_cursor>` for newer ones. The
+    total is only counted when `include_total=true`.
+    """
     current_user_id = get_jwt_identity()
     
     try:
         # Get query parameters
-        unread_only = request.args.get('unread_only', 'false').lower() == 'true'
-        limit = int(request.args.get('limit', 20))
+        unread_only = parse_bool(request.args.get('unread_only', 'false'))
+        include_total = parse_bool(request.args.get('include_total', 'false'))
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
         offset = int(request.args.get('offset', 0))
+        before = request.args.get('before')
+        after = request.args.get('after')
+        
+        try:
+            before = decode_cursor(before) if before else None
+            after = decode_cursor(after) if after else None
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid pagination cursor.'
+            }), 400
         
         # Base query
         query = Notification.query.filter_by(user_id=current_user_id)
@@ -26,30 +48,59 @@ def get_notifications():
         # Filter by read status if needed
         if unread_only:
             query = query.filter_by(read=False)
+        base_query = query
         
-        # Order by creation date (newest first)
-        query = query.order_by(Notification.created_at.desc())
+        position = tuple_(Notification.created_at, Notification.id)
+        if after:
+            # Walk forward from the cursor, then flip back to newest first
+            query = query.filter(position > after).order_by(
+                Notification.created_at.asc(), Notification.id.asc()
+            )
+        else:
+            if before:
+                query = query.filter(position < before)
+            query = query.order_by(Notification.created_at.desc(), Notification.id.desc())
+            if offset and not before:
+                # Legacy offset paging; cursors stay cheap however deep the page
+                query = query.offset(offset)
         
-        # Apply pagination
-        notifications = query.offset(offset).limit(limit).all()
+        # Fetch one extra row to know whether another page exists
+        notifications = query.limit(limit + 1).all()
+        has_more = len(notifications) > limit
+        notifications = notifications[:limit]
+        if after:
+            notifications.reverse()
         
         # Mark notifications as read if requested
-        mark_read = request.args.get('mark_read', 'false').lower() == 'true'
+        mark_read = parse_bool(request.args.get('mark_read', 'false'))
         if mark_read and notifications:
             notification_ids = [n.id for n in notifications if not n.read]
             if notification_ids:
-                Notification.query.filter(Notification.id.in_(notification_ids)).update(
-                    {'read': True, 'read_at': datetime.utcnow()},
-                    synchronize_session=False
-                )
+                updated = Notification.query.filter(
+                    Notification.id.in_(notification_ids),
+                    Notification.read == False
+                ).update({'read': True}, synchronize_session=False)
+                # Bulk updates bypass the ORM events that maintain the counter
+                record_unread_delta(db.session, current_user_id, -updated)
                 db.session.commit()
         
-        return jsonify({
+        response = {
             'success': True,
             'notifications': [n.to_dict() for n in notifications],
-            'total': query.count(),
-            'unread_count': Notification.query.filter_by(user_id=current_user_id, read=False).count()
-        })
+            'has_more': has_more,
+            'next_cursor': None,
+            'prev_cursor': None,
+            'unread_count': get_cached_unread_count(current_user_id)
+        }
+        if notifications:
+            newest, oldest = notifications[0], notifications[-1]
+            if has_more or after:
+                response['next_cursor'] = encode_cursor(oldest.created_at, oldest.id)
+            response['prev_cursor'] = encode_cursor(newest.created_at, newest.id)
+        if include_total:
+            response['total'] = base_query.count()
+        
+        return jsonify(response)
         
     except Exception as e:
         db.session.rollback()
@@ -138,11 +189,10 @@ def mark_all_notifications_read():
         updated = Notification.query.filter_by(
             user_id=current_user_id,
             read=False
-        ).update({
-            'read': True,
-            'read_at': datetime.utcnow()
-        })
+        ).update({'read': True})
         
+        # Bulk updates bypass the ORM events that maintain the counter
+        record_unread_delta(db.session, current_user_id, -updated)
         db.session.commit()
         
         return jsonify({
@@ -200,10 +250,7 @@ def get_unread_count():
     current_user_id = get_jwt_identity()
     
     try:
-        count = Notification.query.filter_by(
-            user_id=current_user_id,
-            read=False
-        ).count()
+        count = get_cached_unread_count(current_user_id)
         
         return jsonify({
             'success': True,
@@ -216,3 +263,57 @@ def get_unread_count():
             'success': False,
             'error': 'Failed to get unread count. Please try again.'
         }), 500
+
+@notification_bp.route('/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_notifications():
+    """
+    Stream new notifications and unread-count changes as Server-Sent Events.
+    
+    EventSource cannot set headers, so the token may also be passed as
+    `?jwt=<token>`. Reconnecting clients send Last-Event-ID (or `last_event_id`)
+    and receive the notifications they missed, or a `resync` event if they
+    missed too many; new clients receive only notifications created from now on.
+    """
+    current_user_id = int(get_jwt_identity())
+    
+    try:
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        if last_event_id is not None:
+            last_event_id = int(last_event_id)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid Last-Event-ID.'
+        }), 400
+    
+    if not stream_slots.acquire(current_app.config.get('SSE_MAX_CONNECTIONS_PER_WORKER', 100)):
+        response = jsonify({
+            'success': False,
+            'error': 'Too many open notification streams. Please retry shortly.'
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+    
+    try:
+        events = notification_events(
+            current_user_id,
+            last_event_id=last_event_id,
+            heartbeat_interval=current_app.config.get('SSE_HEARTBEAT_INTERVAL', 15),
+            poll_interval=current_app.config.get('SSE_POLL_INTERVAL', 5)
+        )
+        response = Response(stream_with_context(events), mimetype='text/event-stream')
+    except Exception as e:
+        stream_slots.release()
+        current_app.logger.error(f'Notification stream error: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Failed to open notification stream. Please try again.'
+        }), 500
+    
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(stream_slots.release)
+    return response
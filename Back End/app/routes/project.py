@@ -4,13 +4,81 @@ from werkzeug.utils import secure_filename
 import os
 from datetime import datetime
 
-from ..models import db, Job, User, Category, ProjectStatusHistory, JobStatus, UserRole
+from ..models import db, Attachment, Job, User, Category, ProjectStatusHistory, JobStatus, UserRole
 from ..utils.decorators import role_required
-from ..utils.helpers import allowed_file, save_uploaded_file
+from ..utils.helpers import allowed_file
+from ..utils.storage import FileTooLargeError
+from ..utils.uploads import INCOMING_FOLDER, discard_upload, receive_upload
+from ..services.blob_storage import CloudinaryBlobStore, LocalBlobStore, store_blobs
 
 # Create project blueprint
 project_bp = Blueprint('project', __name__)
 
+def _document_store(filename, mime_type, user_id):
+    """Blob store for a project document, following STORAGE_PROVIDER and STORAGE_OFFLOAD."""
+    if current_app.config.get('STORAGE_PROVIDER') != 'cloudinary' or current_app.config.get('STORAGE_OFFLOAD'):
+        return LocalBlobStore(current_app.config['UPLOAD_FOLDER'])
+    resource_type = 'auto'
+    if mime_type.startswith('image/'):
+        resource_type = 'image'
+    elif mime_type.startswith('video/'):
+        resource_type = 'video'
+    elif mime_type.startswith('application/pdf'):
+        resource_type = 'raw'
+    return CloudinaryBlobStore(
+        filename,
+        resource_type=resource_type,
+        context={'user_id': str(user_id), 'document_type': 'job', 'uploaded_at': datetime.utcnow().isoformat()},
+        tags=[f"user_{user_id}", "type_job"]
+    )
+
+def _attach_documents(project, files, user_id):
+    """
+    Attach uploaded documents to a project.
+
+    Every file is first received to local disk; the new content is then
+    written to storage on a bounded thread pool, so ten documents cost about
+    one remote upload's latency instead of ten. Files that fail to store are
+    skipped, as before.
+    """
+    config = current_app.config
+    received = []
+    try:
+        for file in files:
+            filename = secure_filename(file.filename)
+            received.append((filename, receive_upload(
+                file.stream,
+                os.path.join(config['UPLOAD_FOLDER'], INCOMING_FOLDER),
+                config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024),
+                filename=filename,
+                chunk_size=config.get('UPLOAD_CHUNK_SIZE', 64 * 1024)
+            )))
+    except Exception:
+        for _, upload in received:
+            discard_upload(upload)
+        raise
+    
+    stored = store_blobs(
+        db.session,
+        [(upload, _document_store(filename, upload.mime_type, user_id)) for filename, upload in received],
+        max_workers=config.get('PROJECT_UPLOAD_WORKERS', 4)
+    )
+    for (filename, upload), result in zip(received, stored):
+        if result is None:
+            continue
+        blob, _ = result
+        db.session.add(Attachment(
+            file_url=blob.storage_key,
+            public_url=blob.public_url,
+            filename=filename,
+            mime_type=upload.mime_type,
+            file_size=upload.size,
+            uploaded_by=user_id,
+            job_id=project.id,
+            user_id=user_id,
+            blob_id=blob.id
+        ))
+
 @project_bp.route('', methods=['POST'])
 @jwt_required()
 @role_required([UserRole.CUSTOMER, UserRole.ADMIN])
@@ -61,21 +129,8 @@ def create_project():
         
         # Handle file uploads if any
         if 'documents' in request.files:
-            files = request.files.getlist('documents')
-            for file in files:
-                if file and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    file_url = save_uploaded_file(file, 'project_documents', f'project_{project.id}')
-                    
-                    if file_url:
-                        attachment = Attachment(
-                            file_url=file_url,
-                            filename=filename,
-                            uploaded_by=current_user_id,
-                            job_id=project.id,
-                            user_id=current_user_id
-                        )
-                        db.session.add(attachment)
+            files = [file for file in request.files.getlist('documents') if file and allowed_file(file.filename)]
+            _attach_documents(project, files, current_user_id)
         
         # Record status change
         status_history = ProjectStatusHistory(
@@ -95,6 +150,13 @@ def create_project():
             'project': project.to_dict()
         }), 201
         
+    except FileTooLargeError:
+        db.session.rollback()
+        max_size = current_app.config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)
+        return jsonify({
+            'success': False,
+            'error': f'File size exceeds maximum allowed size of {max_size / (1024 * 1024):.1f}MB.'
+        }), 400
     except ValueError:
         return jsonify({
             'success': False,
@@ -205,21 +267,8 @@ def update_project(project_id):
         
         # Handle file uploads if any
         if 'documents' in request.files:
-            files = request.files.getlist('documents')
-            for file in files:
-                if file and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    file_url = save_uploaded_file(file, 'project_documents', f'project_{project.id}')
-                    
-                    if file_url:
-                        attachment = Attachment(
-                            file_url=file_url,
-                            filename=filename,
-                            uploaded_by=current_user_id,
-                            job_id=project.id,
-                            user_id=current_user_id
-                        )
-                        db.session.add(attachment)
+            files = [file for file in request.files.getlist('documents') if file and allowed_file(file.filename)]
+            _attach_documents(project, files, current_user_id)
         
         db.session.commit()
         
@@ -229,6 +278,13 @@ def update_project(project_id):
             'project': project.to_dict(include_details=True)
         })
         
+    except FileTooLargeError:
+        db.session.rollback()
+        max_size = current_app.config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)
+        return jsonify({
+            'success': False,
+            'error': f'File size exceeds maximum allowed size of {max_size / (1024 * 1024):.1f}MB.'
+        }), 400
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f'Project update error: {str(e)}')
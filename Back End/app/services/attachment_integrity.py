@@ -0,0 +1,126 @@
+"""
+Background integrity check for stored attachment files.
+
+Document listings are served from `attachments` columns alone, so nothing
+on the request path touches the filesystem. This check walks the table in
+primary-key batches instead: it flags attachments whose file has gone
+missing (`missing_at`), clears the flag when the file is back, and
+backfills `file_size` and `mime_type` on rows stored without them.
+Attachments held by a remote provider (with a `public_url`) are skipped.
+"""
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam, column, select, table, update
+
+from ..utils.uploads import SNIFF_SIZE, sniff_mime_type
+
+logger = logging.getLogger(__name__)
+
+# Table clause so both the package models and the legacy app's models can use it
+attachments_table = table(
+    'attachments',
+    column('id'), column('file_url'), column('public_url'), column('filename'),
+    column('mime_type'), column('file_size'), column('missing_at')
+)
+
+def _candidate_paths(upload_folder, file_url):
+    """
+    Where a `file_url` may point: paths are stored relative to the upload
+    folder, absolute, or (by the legacy app) relative to the folder's parent,
+    e.g. 'uploads/project_1/plan.pdf'.
+    """
+    yield os.path.join(upload_folder, file_url)
+    if upload_folder and not os.path.isabs(file_url):
+        root = os.path.normpath(upload_folder)
+        if file_url.startswith(os.path.basename(root) + '/'):
+            yield os.path.join(os.path.dirname(root), file_url)
+
+def _inspect(upload_folder, row):
+    """Return (exists, size, mime_type) for a stored file, reading only what is missing."""
+    for path in _candidate_paths(upload_folder, row.file_url):
+        try:
+            size = os.path.getsize(path)
+            break
+        except OSError:
+            continue
+    else:
+        return False, None, None
+    mime_type = row.mime_type
+    if mime_type is None:
+        with open(path, 'rb') as f:
+            mime_type = sniff_mime_type(f.read(SNIFF_SIZE), row.filename or '')
+    return True, size, mime_type
+
+def check_attachment_files(session, upload_folder='', batch_size=500, pause=0):
+    """
+    Flag attachments whose stored file is missing and backfill file metadata.
+
+    Args:
+        session: SQLAlchemy session
+        upload_folder: Folder relative `file_url` paths are resolved against
+        batch_size: Attachments checked per transaction
+        pause: Seconds to sleep between batches
+
+    Returns:
+        dict: Numbers of attachments 'checked', newly 'missing', 'restored'
+        and 'backfilled'
+    """
+    attachments = attachments_table
+    report = {'checked': 0, 'missing': 0, 'restored': 0, 'backfilled': 0}
+    last_id = 0
+    while True:
+        rows = session.execute(
+            select(attachments).where(attachments.c.id > last_id, attachments.c.public_url.is_(None))
+            .order_by(attachments.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        missing, restored, backfill = [], [], []
+        for row in rows:
+            exists, size, mime_type = _inspect(upload_folder, row)
+            if not exists:
+                if row.missing_at is None:
+                    missing.append(row.id)
+                continue
+            if row.missing_at is not None:
+                restored.append(row.id)
+            if row.file_size is None or row.mime_type is None:
+                backfill.append({'attachment_id': row.id, 'size': size, 'type': mime_type})
+
+        try:
+            if missing:
+                session.execute(
+                    update(attachments).where(attachments.c.id.in_(missing))
+                    .values(missing_at=datetime.now(timezone.utc).replace(tzinfo=None))
+                )
+            if restored:
+                session.execute(update(attachments).where(attachments.c.id.in_(restored)).values(missing_at=None))
+            if backfill:
+                session.execute(
+                    update(attachments).where(attachments.c.id == bindparam('attachment_id'))
+                    .values(file_size=bindparam('size'), mime_type=bindparam('type')),
+                    backfill
+                )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+        report['checked'] += len(rows)
+        report['missing'] += len(missing)
+        report['restored'] += len(restored)
+        report['backfilled'] += len(backfill)
+        if len(rows) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    if report['missing']:
+        logger.warning(f"Attachment integrity check found {report['missing']} missing files")
+    logger.info(f"Attachment integrity check: {report}")
+    return report
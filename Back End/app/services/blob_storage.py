@@ -0,0 +1,247 @@
+"""
+Content-addressed attachment storage.
+
+File content is stored once per SHA-256 as a `Blob`, under a key derived
+from the hash, and every `Attachment` with that content points at the same
+blob. A blob's `ref_count` tracks its attachments: uploading content that
+is already stored only increments the count and skips the write, and the
+stored file is removed once the last attachment referencing it is deleted.
+
+Releasing the last reference leaves the row behind as a tombstone with a
+zero count. After the release commits, the tombstone is deleted and then
+its file is removed, in one transaction. The delete locks the row, so an
+upload of the same content either revives the tombstone first, and the
+removal is skipped, or waits for the removal to commit and writes the file
+anew. An upload therefore never writes a file that a removal then deletes.
+"""
+import logging
+import os
+import shutil
+
+from sqlalchemy import delete, event, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from werkzeug.datastructures import FileStorage
+
+from ..models import Blob, DocumentPage
+from ..utils.uploads import commit_upload, discard_upload
+from ..utils.work_queue import run_concurrently
+from .cloudinary_storage import cloudinary_storage
+from .image_variants import variant_folder
+
+logger = logging.getLogger(__name__)
+
+BLOB_FOLDER = 'blobs'
+SESSION_REMOVALS_KEY = 'blob_removals'
+
+blobs = Blob.__table__
+
+def blob_key(sha256: str) -> str:
+    """Storage key for content with the given SHA-256, fanned out over two directory levels."""
+    return f'{BLOB_FOLDER}/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+class LocalBlobStore:
+    """Keeps blobs under the local upload folder."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def put(self, upload, key: str):
+        """Move a received upload into place; returns its public URL (none for local files)."""
+        commit_upload(upload, os.path.join(self.root, key))
+        return None
+
+    def delete(self, key: str):
+        """Delete a stored blob and any image variants rendered from it."""
+        try:
+            os.remove(os.path.join(self.root, key))
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(variant_folder(self.root, os.path.basename(key)), ignore_errors=True)
+
+class CloudinaryBlobStore:
+    """Keeps blobs in Cloudinary, under their storage key as public ID."""
+
+    def __init__(self, filename: str, **options):
+        """
+        Args:
+            filename: Original file name, used to validate the file type
+            **options: Additional options passed to the Cloudinary upload
+        """
+        self.filename = filename
+        self.options = options
+
+    def put(self, upload, key: str):
+        """Upload a received upload; returns its secure URL."""
+        try:
+            with open(upload.path, 'rb') as staged:
+                # Its size was checked against the route's limit when it was received
+                result = cloudinary_storage.upload_file(
+                    FileStorage(staged, filename=self.filename, content_type=upload.mime_type),
+                    public_id=key,
+                    max_size=upload.size,
+                    **self.options
+                )
+        finally:
+            discard_upload(upload)
+        return result['secure_url']
+
+    def delete(self, key: str):
+        """Delete a stored blob."""
+        cloudinary_storage.delete_file(key)
+
+def _acquire(session, sha256: str):
+    row = session.execute(
+        update(blobs).where(blobs.c.sha256 == sha256).values(ref_count=blobs.c.ref_count + 1)
+        .returning(blobs.c.id).execution_options(synchronize_session=False)
+    ).first()
+    return session.get(Blob, row.id, populate_existing=True) if row else None
+
+def store_blob(session, upload, store):
+    """
+    Add a reference to the blob for an upload, storing its content only if it is new.
+
+    The reference is part of the session's transaction; the caller commits
+    it together with the attachment that points at the blob.
+
+    Args:
+        session: SQLAlchemy session
+        upload: ReceivedUpload from `receive_upload`; consumed either way
+        store: LocalBlobStore or CloudinaryBlobStore to write new content to
+
+    Returns:
+        tuple: (Blob, True if the content was written, False for a duplicate)
+    """
+    blob = _acquire(session, upload.sha256)
+    if blob is not None:
+        discard_upload(upload)
+        return blob, False
+
+    public_url = store.put(upload, blob_key(upload.sha256))
+    return _add_blob(session, upload, public_url), True
+
+def store_blobs(session, items, max_workers: int = 4):
+    """
+    Like `store_blob` for several uploads, writing new content concurrently.
+
+    Lookups and inserts stay on the calling thread (the session is not
+    thread-safe); only `store.put`, which for Cloudinary is a blocking
+    HTTP upload, runs on a bounded thread pool. Content repeated within
+    the batch is written once.
+
+    Args:
+        session: SQLAlchemy session
+        items: (ReceivedUpload, store) pairs; every upload is consumed
+        max_workers: Maximum number of concurrent writes
+
+    Returns:
+        list: (Blob, stored) per item as from `store_blob`, or None where
+        the write failed (the error is logged)
+    """
+    results = [None] * len(items)
+    writes = {}
+    for index, (upload, store) in enumerate(items):
+        if upload.sha256 in writes:
+            discard_upload(upload)
+            writes[upload.sha256].append(index)
+            continue
+        blob = _acquire(session, upload.sha256)
+        if blob is not None:
+            discard_upload(upload)
+            results[index] = (blob, False)
+        else:
+            writes[upload.sha256] = [index]
+
+    public_urls = {}
+
+    def put(index):
+        upload, store = items[index]
+        try:
+            public_urls[index] = store.put(upload, blob_key(upload.sha256))
+        except Exception:
+            discard_upload(upload)
+            raise
+
+    succeeded, failed = run_concurrently([indexes[0] for indexes in writes.values()], put, max_workers)
+    for index, error in failed:
+        logger.error(f"Failed to store {items[index][0].sha256}: {str(error)}")
+    for index in succeeded:
+        upload = items[index][0]
+        blob = _add_blob(session, upload, public_urls[index])
+        results[index] = (blob, True)
+        for duplicate in writes[upload.sha256][1:]:
+            results[duplicate] = (_acquire(session, upload.sha256), False)
+    return results
+
+def _add_blob(session, upload, public_url):
+    try:
+        with session.begin_nested():
+            blob = Blob(
+                sha256=upload.sha256,
+                size=upload.size,
+                mime_type=upload.mime_type,
+                storage_key=blob_key(upload.sha256),
+                public_url=public_url,
+                ref_count=1
+            )
+            session.add(blob)
+    except IntegrityError:
+        # The same content was stored concurrently under the same key; share that blob
+        blob = _acquire(session, upload.sha256)
+        if blob is None:
+            raise
+    return blob
+
+def release_blob(session, blob_id: int, store):
+    """
+    Drop a reference to a blob, deleting it with its last reference.
+
+    Call after the referencing attachment has been deleted and flushed. The
+    blob and its stored content are removed once the transaction commits,
+    unless the same content has been uploaded again by then.
+
+    Args:
+        session: SQLAlchemy session
+        blob_id: ID of the referenced blob
+        store: LocalBlobStore or CloudinaryBlobStore holding the content
+
+    Returns:
+        bool: True if this was the last reference
+    """
+    row = session.execute(
+        update(blobs).where(blobs.c.id == blob_id).values(ref_count=blobs.c.ref_count - 1)
+        .returning(blobs.c.ref_count, blobs.c.storage_key).execution_options(synchronize_session=False)
+    ).first()
+    if row is None or row.ref_count > 0:
+        return False
+
+    session.info.setdefault(SESSION_REMOVALS_KEY, []).append((blob_id, row.storage_key, store))
+    return True
+
+def _remove_tombstone(connection, blob_id, key, store):
+    """Delete a released blob and its content unless it has been referenced again."""
+    with connection.begin():
+        # Locks the row until the file is gone; an upload reviving it either
+        # got there first or waits, then finds no row and writes the file anew
+        claimed = connection.execute(delete(blobs).where(blobs.c.id == blob_id, blobs.c.ref_count <= 0))
+        if not claimed.rowcount:
+            return
+        # Extracted text goes with the content (SQLite does not enforce the cascade)
+        connection.execute(delete(DocumentPage.__table__).where(DocumentPage.__table__.c.blob_id == blob_id))
+        store.delete(key)
+
+@event.listens_for(Session, 'after_commit')
+def _remove_released(session):
+    removals = session.info.pop(SESSION_REMOVALS_KEY, [])
+    if not removals:
+        return
+    with session.get_bind().connect() as connection:
+        for blob_id, key, store in removals:
+            try:
+                _remove_tombstone(connection, blob_id, key, store)
+            except Exception as e:
+                logger.error(f"Failed to delete blob {key}: {str(e)}")
+
+@event.listens_for(Session, 'after_rollback')
+def _keep_released(session):
+    session.info.pop(SESSION_REMOVALS_KEY, None)
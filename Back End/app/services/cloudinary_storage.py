@@ -38,6 +38,8 @@ class CloudinaryStorage:
             'code': {'py', 'js', 'html', 'css', 'json', 'xml'},
         }
         self.max_content_length = 16 * 1024 * 1024  # 16MB default
+        # Larger files are sent in chunks; the plain upload API rejects files over 100MB
+        self.large_file_size = 100 * 1024 * 1024
         
         if app is not None:
             self.init_app(app)
@@ -59,6 +61,7 @@ class CloudinaryStorage:
         
         # Set max content length
         self.max_content_length = app.config.get('MAX_CONTENT_LENGTH', self.max_content_length)
+        self.large_file_size = app.config.get('CLOUDINARY_LARGE_FILE_SIZE', self.large_file_size)
     
     def get_allowed_extensions(self, category: str = None) -> set:
         """
@@ -96,13 +99,16 @@ class CloudinaryStorage:
         ext = filename.rsplit('.', 1)[1].lower()
         return ext in self.get_allowed_extensions(category)
     
-    def upload_file(self, file_storage, subfolder: str = 'uploads', **options) -> Dict[str, Any]:
+    def upload_file(self, file_storage, subfolder: str = 'uploads', public_id: Optional[str] = None,
+                    max_size: Optional[int] = None, **options) -> Dict[str, Any]:
         """
         Upload a file to Cloudinary.
         
         Args:
             file_storage: FileStorage object from request.files
             subfolder: Subfolder to store the file in
+            public_id: Public ID to store the file under (default: a new UUID in `subfolder`)
+            max_size: Maximum file size in bytes (default: MAX_CONTENT_LENGTH)
             **options: Additional options to pass to Cloudinary
             
         Returns:
@@ -127,20 +133,30 @@ class CloudinaryStorage:
         file_size = file_storage.tell()
         file_storage.seek(0)
         
-        if file_size > self.max_content_length:
-            raise FileTooLargeError(f"File size exceeds maximum allowed size of {self.max_content_length} bytes")
+        max_size = max_size or self.max_content_length
+        if file_size > max_size:
+            raise FileTooLargeError(f"File size exceeds maximum allowed size of {max_size} bytes")
         
         try:
             # Generate a unique public ID
-            file_ext = filename.rsplit('.', 1)[1].lower()
-            public_id = f"{subfolder}/{str(uuid.uuid4())}.{file_ext}"
+            if not public_id:
+                file_ext = filename.rsplit('.', 1)[1].lower()
+                public_id = f"{subfolder}/{str(uuid.uuid4())}.{file_ext}"
             
             # Upload to Cloudinary
-            result = cloudinary.uploader.upload(
-                file_storage,
-                public_id=public_id,
-                **options
-            )
+            if file_size > self.large_file_size:
+                result = cloudinary.uploader.upload_large(
+                    file_storage.stream,
+                    public_id=public_id,
+                    filename=filename,
+                    **options
+                )
+            else:
+                result = cloudinary.uploader.upload(
+                    file_storage,
+                    public_id=public_id,
+                    **options
+                )
             
             return {
                 'public_id': result['public_id'],
@@ -0,0 +1,263 @@
+"""
+Full-text indexing and search of PDF attachments.
+
+Text is extracted per stored blob, so duplicate uploads are indexed once.
+A PDF's pages are split into ranges that are extracted in parallel on a
+process pool (PyPDF2 is pure Python, so threads would serialize on the
+GIL), and each range's pages are committed as soon as it finishes. An
+interrupted run therefore resumes with the pages still missing instead of
+starting over, and large documents become searchable page by page.
+
+Pages are searched through SQLite FTS5 or a Postgres tsvector column (see
+`DOCUMENT_SEARCH_DDL`), and results are limited to attachments the user may
+open, following the same rules as `check_document_permission`.
+"""
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import PyPDF2
+from sqlalchemy import Float, Integer, String, and_, delete, exists, or_, select, text, true
+
+from ..models import Attachment, Bid, Blob, DocumentPage, Job, JobStatus, UserRole
+
+logger = logging.getLogger(__name__)
+
+PAGES_PER_RANGE = 8
+INDEXED_TYPES = {'application/pdf'}
+
+# Marks matched terms in snippets; plain text, so clients can escape it before highlighting
+HIGHLIGHT = ('**', '**')
+
+document_pages = DocumentPage.__table__
+
+class IndexingError(Exception):
+    """Raised when a document's text cannot be extracted."""
+    pass
+
+def count_pages(path: str) -> int:
+    """Number of pages in a PDF."""
+    try:
+        with open(path, 'rb') as f:
+            return len(PyPDF2.PdfReader(f).pages)
+    except PyPDF2.errors.PdfReadError as e:
+        raise IndexingError(f"Cannot read {path}: {str(e)}")
+
+def extract_pages(path: str, start: int, stop: int):
+    """
+    Extract the text of pages [start, stop); runs in a pool process.
+
+    Returns:
+        list: (1-based page number, text) pairs
+    """
+    pages = []
+    try:
+        with open(path, 'rb') as f:
+            reader = PyPDF2.PdfReader(f)
+            for index in range(start, min(stop, len(reader.pages))):
+                try:
+                    page_text = reader.pages[index].extract_text() or ''
+                except Exception as e:
+                    # One malformed page should not keep the rest of the document out of the index
+                    logger.warning(f"Cannot extract page {index + 1} of {path}: {str(e)}")
+                    page_text = ''
+                # NUL bytes are rejected by Postgres text columns
+                pages.append((index + 1, page_text.replace('\x00', '')))
+    except PyPDF2.errors.PdfReadError as e:
+        raise IndexingError(f"Cannot read {path}: {str(e)}")
+    return pages
+
+def missing_ranges(session, blob_id: int, page_count: int, pages_per_range: int = PAGES_PER_RANGE):
+    """
+    Page ranges of a document that are not stored yet.
+
+    Returns:
+        list: (start, stop) 0-based, half-open page ranges
+    """
+    stored = set(session.execute(
+        select(document_pages.c.page_number).where(document_pages.c.blob_id == blob_id)
+    ).scalars())
+    ranges = []
+    for start in range(0, page_count, pages_per_range):
+        stop = min(start + pages_per_range, page_count)
+        if not all(number in stored for number in range(start + 1, stop + 1)):
+            ranges.append((start, stop))
+    return ranges
+
+def store_pages(session, blob_id: int, pages):
+    """Store extracted pages, replacing any already stored for the same page numbers, and commit."""
+    numbers = [number for number, _ in pages]
+    try:
+        session.execute(delete(document_pages).where(
+            document_pages.c.blob_id == blob_id, document_pages.c.page_number.in_(numbers)
+        ))
+        now = datetime.now(timezone.utc)
+        if pages:
+            session.execute(document_pages.insert(), [
+                {'blob_id': blob_id, 'page_number': number, 'text': page_text, 'created_at': now, 'updated_at': now}
+                for number, page_text in pages
+            ])
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+def index_document(session, blob, path: str, executor=None, pages_per_range: int = PAGES_PER_RANGE) -> int:
+    """
+    Extract and index the text of a stored PDF, committing each page range as it completes.
+
+    Args:
+        session: SQLAlchemy session
+        blob: Blob of the document
+        path: Local path of the document
+        executor: Executor to extract ranges on (default: extract in this process)
+        pages_per_range: Pages extracted per task
+
+    Returns:
+        int: Number of pages indexed by this call
+
+    Raises:
+        IndexingError: If the document cannot be read
+    """
+    if blob.page_count is None:
+        blob.page_count = count_pages(path)
+        session.commit()
+
+    ranges = missing_ranges(session, blob.id, blob.page_count, pages_per_range)
+    indexed = 0
+    if executor is None:
+        for start, stop in ranges:
+            pages = extract_pages(path, start, stop)
+            store_pages(session, blob.id, pages)
+            indexed += len(pages)
+    else:
+        futures = [executor.submit(extract_pages, path, start, stop) for start, stop in ranges]
+        for future in as_completed(futures):
+            pages = future.result()
+            store_pages(session, blob.id, pages)
+            indexed += len(pages)
+
+    blob.text_indexed_at = datetime.now(timezone.utc)
+    session.commit()
+    return indexed
+
+def index_pending_documents(session, root: str, batch_size: int = 20, max_workers: int = None) -> dict:
+    """
+    Index locally stored PDFs that have not been fully indexed yet.
+
+    Args:
+        session: SQLAlchemy session
+        root: Upload folder blob storage keys are relative to
+        batch_size: Documents indexed per run
+        max_workers: Extraction processes (default: number of CPUs)
+
+    Returns:
+        dict: Numbers of 'documents' and 'pages' indexed and documents 'failed'
+    """
+    blobs = session.execute(
+        select(Blob).where(
+            Blob.mime_type.in_(INDEXED_TYPES),
+            Blob.text_indexed_at.is_(None),
+            Blob.public_url.is_(None),
+            # Released blobs wait for removal
+            Blob.ref_count > 0
+        ).order_by(Blob.id).limit(batch_size)
+    ).scalars().all()
+    report = {'documents': 0, 'pages': 0, 'failed': 0}
+    if not blobs:
+        return report
+
+    executor = None
+    if not multiprocessing.current_process().daemon:
+        # Spawned rather than forked, as for image variants; daemonic workers (e.g. Celery prefork) extract inline
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        for blob in blobs:
+            try:
+                report['pages'] += index_document(session, blob, os.path.join(root, blob.storage_key), executor)
+                report['documents'] += 1
+            except (IndexingError, FileNotFoundError) as e:
+                session.rollback()
+                logger.warning(f"Cannot index blob {blob.id}: {str(e)}")
+                # Leave unreadable documents out of later runs
+                blob.page_count = blob.page_count or 0
+                blob.text_indexed_at = datetime.now(timezone.utc)
+                session.commit()
+                report['failed'] += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return report
+
+def _match_query(session, query: str):
+    """The dialect's full-text hits as a subquery of (page_id, rank, snippet); lower rank is better."""
+    start, end = HIGHLIGHT
+    if session.get_bind().dialect.name == 'postgresql':
+        hits = text(
+            "SELECT id AS page_id, -ts_rank(search_vector, q) AS rank, "
+            "ts_headline('english', text, q, :headline) AS snippet "
+            "FROM document_pages, websearch_to_tsquery('english', :query) AS q "
+            "WHERE search_vector @@ q"
+        ).bindparams(query=query, headline=f'StartSel={start}, StopSel={end}, MaxWords=24, MinWords=8')
+    else:
+        # Quote every term so user input cannot form FTS5 query syntax; terms are ANDed
+        terms = ' '.join('"{}"'.format(term.replace('"', '""')) for term in re.findall(r'\w+', query))
+        hits = text(
+            "SELECT rowid AS page_id, bm25(document_pages_fts) AS rank, "
+            "snippet(document_pages_fts, 0, :start, :end, '...', 16) AS snippet "
+            "FROM document_pages_fts WHERE document_pages_fts MATCH :terms"
+        ).bindparams(terms=terms, start=start, end=end)
+    return hits.columns(page_id=Integer, rank=Float, snippet=String).subquery('hits')
+
+def _accessible(user):
+    """Conditions under which `user` may open an attachment, as in `check_document_permission`."""
+    if user.role == UserRole.ADMIN:
+        return true()
+    conditions = [Attachment.uploaded_by == user.id, Job.customer_id == user.id]
+    if user.role == UserRole.PROFESSIONAL:
+        conditions.append(and_(Job.status == JobStatus.AWARDED, Job.assigned_contractor_id == user.id))
+        conditions.append(and_(
+            Job.status != JobStatus.AWARDED,
+            exists().where(Bid.job_id == Attachment.job_id, Bid.professional_id == user.id)
+        ))
+    return or_(*conditions)
+
+def search_documents(session, user, query: str, job_id: int = None, limit: int = 20, offset: int = 0):
+    """
+    Search the text of the documents a user may open.
+
+    Args:
+        session: SQLAlchemy session
+        user: User searching
+        query: Search terms
+        job_id: Only search this job's documents
+        limit: Maximum number of hits
+        offset: Hits to skip, for paging
+
+    Returns:
+        list: Hits as dicts with attachment 'id', 'filename', 'job_id',
+        'page' and a highlighted 'snippet', best match first
+    """
+    if not re.search(r'\w', query):
+        return []
+    hits = _match_query(session, query)
+    statement = (
+        select(
+            Attachment.id, Attachment.filename, Attachment.job_id,
+            DocumentPage.page_number, hits.c.snippet
+        )
+        .select_from(hits)
+        .join(DocumentPage, DocumentPage.id == hits.c.page_id)
+        .join(Attachment, Attachment.blob_id == DocumentPage.blob_id)
+        .outerjoin(Job, Job.id == Attachment.job_id)
+        .where(_accessible(user), Attachment.job_id == job_id if job_id is not None else true())
+        .order_by(hits.c.rank, Attachment.id, DocumentPage.page_number)
+        .limit(limit).offset(offset)
+    )
+    return [
+        {'id': row.id, 'filename': row.filename, 'job_id': row.job_id, 'page': row.page_number, 'snippet': row.snippet}
+        for row in session.execute(statement)
+    ]
@@ -0,0 +1,317 @@
+"""
+Reconciliation of the upload folder against the database.
+
+Files with no database row referencing them are found without loading
+either side into memory. The folder is walked with `os.scandir`, one
+directory at a time in sorted order. Content-addressed files (`blobs/` and
+the `variants/` rendered from them) come out in SHA-256 order, because
+their fan-out directories are prefixes of the hash. They are merge-joined
+against the `blobs.sha256` values, which are streamed from the database in
+key order with keyset paging. Other files, stored before content addressing,
+are looked up against `attachments.file_url` one batch at a time.
+
+Orphans are never deleted outright. They are moved to
+`.quarantine/<run_id>/` and removed on a later run once they have been
+there for the quarantine period. Files younger than `min_age` are skipped,
+since an upload's file lands on disk before its row commits. Progress is
+checkpointed after every batch, so an interrupted run resumes where it
+stopped. Every orphan is written as a line to the run's JSONL report.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from ..models import Attachment, Blob
+from .blob_storage import BLOB_FOLDER
+from .image_variants import VARIANT_FOLDER
+
+logger = logging.getLogger(__name__)
+
+QUARANTINE_FOLDER = '.quarantine'
+REPORT_FOLDER = '.reconcile'
+CHECKPOINT_FILE = 'checkpoint.json'
+RUN_ID_FORMAT = '%Y%m%dT%H%M%SZ'
+
+# Walked in this order; the checkpoint records the phase a run stopped in
+PHASES = ('blobs', 'variants', 'files')
+
+SHA256_NAME = re.compile(r'[0-9a-f]{64}')
+
+blobs = Blob.__table__
+attachments = Attachment.__table__
+
+def _walk(path, parts=(), after=None, depth=None, skip=None):
+    """
+    Yield (path components, DirEntry) below `path` in sorted component order.
+
+    Only one directory listing per level is held at a time. Directories at
+    `depth` are yielded rather than entered. Entries up to and including
+    the `after` components are skipped without listing the subtrees before
+    them, and so are top-level entries whose name `skip` returns True for.
+    """
+    try:
+        with os.scandir(path) as listing:
+            entries = sorted(listing, key=lambda entry: entry.name)
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if not parts and skip is not None and skip(entry.name):
+            continue
+        child = parts + (entry.name,)
+        if after is not None and child < after[:len(child)]:
+            continue
+        if entry.is_dir(follow_symlinks=False) and (depth is None or len(child) < depth):
+            resume = after if after is not None and child == after[:len(child)] else None
+            yield from _walk(entry.path, child, resume, depth)
+        elif after is None or child > after:
+            yield child, entry
+
+def _stream_hashes(session, after: str, batch_size: int):
+    """Yield every `blobs.sha256` greater than `after`, in order, one batch per query."""
+    # Fixed-length lowercase hex sorts the same under any collation
+    while True:
+        hashes = session.execute(
+            select(blobs.c.sha256).where(blobs.c.sha256 > after).order_by(blobs.c.sha256).limit(batch_size)
+        ).scalars().all()
+        session.commit()
+        yield from hashes
+        if len(hashes) < batch_size:
+            return
+        after = hashes[-1]
+
+def _content_hash(parts, entry, is_dir):
+    """The SHA-256 a content-addressed entry is named after, or None if it is misplaced."""
+    if len(parts) != 3 or entry.is_dir(follow_symlinks=False) != is_dir:
+        return None
+    name = parts[2]
+    if not SHA256_NAME.fullmatch(name) or name[:2] != parts[0] or name[2:4] != parts[1]:
+        return None
+    return name
+
+class _Run:
+    """State of one reconciliation run: its report, checkpoint and counts."""
+
+    def __init__(self, root, report_folder, min_age, dry_run, batch_size):
+        self.root = root
+        self.report_folder = report_folder
+        self.checkpoint_path = os.path.join(report_folder, CHECKPOINT_FILE)
+        self.cutoff = time.time() - min_age
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.phase, self.after = PHASES[0], None
+        self.counts = {'scanned': 0, 'recent': 0, 'orphaned': 0, 'quarantined': 0, 'purged': 0}
+
+        os.makedirs(report_folder, exist_ok=True)
+        checkpoint = self._load_checkpoint()
+        if checkpoint and checkpoint.get('dry_run', False) == dry_run:
+            self.run_id = checkpoint['run_id']
+            self.phase = checkpoint['phase']
+            self.after = tuple(checkpoint['after']) if checkpoint['after'] else None
+            self.counts.update(checkpoint['counts'])
+            logger.info(f"Resuming file reconciliation {self.run_id} in {self.phase} after {self.after}")
+        else:
+            self.run_id = datetime.now(timezone.utc).strftime(RUN_ID_FORMAT)
+        self.report_path = os.path.join(report_folder, f'{self.run_id}.jsonl')
+        self.report = open(self.report_path, 'a')
+        self.pending = 0
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning(f"Ignoring unreadable reconciliation checkpoint {self.checkpoint_path}")
+            return None
+
+    def checkpoint(self, phase, after):
+        """Record progress; everything up to `after` in `phase` is done."""
+        self.report.flush()
+        temp_path = f'{self.checkpoint_path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({
+                'run_id': self.run_id, 'phase': phase, 'after': list(after) if after else None,
+                'counts': self.counts, 'dry_run': self.dry_run
+            }, f)
+        os.replace(temp_path, self.checkpoint_path)
+        self.pending = 0
+
+    def scanned(self, phase, parts):
+        """Count a processed entry, checkpointing once a batch has been processed."""
+        self.counts['scanned'] += 1
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.checkpoint(phase, parts)
+
+    def is_recent(self, entry):
+        try:
+            recent = entry.stat(follow_symlinks=False).st_mtime > self.cutoff
+        except FileNotFoundError:
+            # Removed since the directory was listed
+            return True
+        if recent:
+            self.counts['recent'] += 1
+        return recent
+
+    def write(self, **line):
+        self.report.write(json.dumps(line) + '\n')
+
+    def orphan(self, relpath, entry, reason):
+        """Report an orphan and move it to this run's quarantine."""
+        try:
+            stat = entry.stat(follow_symlinks=False)
+            size, modified = stat.st_size, datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat()
+        except FileNotFoundError:
+            return
+        self.counts['orphaned'] += 1
+        action = 'orphaned'
+        if not self.dry_run:
+            target = os.path.join(self.root, QUARANTINE_FOLDER, self.run_id, relpath)
+            try:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(entry.path, target)
+                action = 'quarantined'
+                self.counts['quarantined'] += 1
+            except OSError as e:
+                logger.error(f"Failed to quarantine {relpath}: {str(e)}")
+                action = 'failed'
+        self.write(path=relpath, size=size, modified=modified, reason=reason, action=action)
+
+    def finish(self):
+        self.write(summary=self.counts, run_id=self.run_id)
+        self.report.close()
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+
+def _reconcile_content(session, run, phase, folder, is_dir):
+    """Merge-join a content-addressed folder against the stored blob hashes."""
+    after = run.after if run.phase == phase else None
+    start = after[-1] if after and SHA256_NAME.fullmatch(after[-1]) else ''
+    hashes = _stream_hashes(session, start, run.batch_size)
+    current = next(hashes, None)
+    for parts, entry in _walk(os.path.join(run.root, folder), after=after, depth=3):
+        relpath = '/'.join((folder,) + parts)
+        if not run.is_recent(entry):
+            sha256 = _content_hash(parts, entry, is_dir)
+            if sha256 is None:
+                run.orphan(relpath, entry, 'unexpected')
+            else:
+                while current is not None and current < sha256:
+                    current = next(hashes, None)
+                if current != sha256:
+                    run.orphan(relpath, entry, 'unreferenced')
+        run.scanned(phase, parts)
+    hashes.close()
+
+def _reconcile_files(session, run, phase):
+    """Look up files stored before content addressing against attachment paths, one batch at a time."""
+    after = run.after if run.phase == phase else None
+    batch = []
+
+    def skip(name):
+        # Uploads in progress, the quarantine and the reports are all hidden folders
+        return name in (BLOB_FOLDER, VARIANT_FOLDER) or name.startswith('.')
+
+    def flush():
+        # Paths are stored relative to the upload folder, absolute, or (by the
+        # legacy app) relative to the folder's parent
+        candidates = {}
+        for parts, entry in batch:
+            relpath = '/'.join(parts)
+            for stored in (relpath, entry.path, f'{os.path.basename(run.root)}/{relpath}'):
+                candidates[stored] = relpath
+        referenced = {
+            candidates[file_url] for file_url in session.execute(
+                select(attachments.c.file_url).where(attachments.c.file_url.in_(list(candidates)))
+            ).scalars()
+        }
+        session.commit()
+        for parts, entry in batch:
+            relpath = '/'.join(parts)
+            if relpath not in referenced:
+                run.orphan(relpath, entry, 'unreferenced')
+        run.counts['scanned'] += len(batch)
+        run.checkpoint(phase, batch[-1][0])
+        batch.clear()
+
+    for parts, entry in _walk(run.root, after=after, skip=skip):
+        if run.is_recent(entry):
+            run.counts['scanned'] += 1
+            continue
+        batch.append((parts, entry))
+        if len(batch) >= run.batch_size:
+            flush()
+    if batch:
+        flush()
+
+def purge_quarantine(root: str, quarantine_days: int, run=None) -> int:
+    """
+    Delete quarantined runs older than `quarantine_days`.
+
+    Returns:
+        int: Number of runs deleted
+    """
+    folder = os.path.join(root, QUARANTINE_FOLDER)
+    cutoff = datetime.now(timezone.utc) - timedelta(days=quarantine_days)
+    purged = 0
+    for parts, entry in _walk(folder, depth=1):
+        try:
+            started = datetime.strptime(entry.name, RUN_ID_FORMAT).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        if started < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            purged += 1
+            if run is not None:
+                run.write(path=f'{QUARANTINE_FOLDER}/{entry.name}', action='purged')
+    return purged
+
+def reconcile_upload_folder(session, root: str, report_folder: str = None, min_age: int = 3600,
+                            quarantine_days: int = 7, batch_size: int = 1000, dry_run: bool = False) -> dict:
+    """
+    Quarantine files in the upload folder that no database row references.
+
+    Args:
+        session: SQLAlchemy session
+        root: Upload folder
+        report_folder: Folder for JSONL reports and the checkpoint
+            (default: `.reconcile` in the upload folder)
+        min_age: Seconds a file must have existed before it can be an orphan
+        quarantine_days: Days quarantined files are kept before deletion
+        batch_size: Hashes and paths read per query, and entries between checkpoints
+        dry_run: Report orphans without moving or deleting anything
+
+    Returns:
+        dict: Counts of entries 'scanned', skipped as 'recent', 'orphaned',
+        'quarantined' and quarantine runs 'purged', with the 'run_id' and
+        'report' path
+    """
+    run = _Run(root, report_folder or os.path.join(root, REPORT_FOLDER), min_age, dry_run, batch_size)
+    try:
+        for phase in PHASES[PHASES.index(run.phase):]:
+            if phase == 'blobs':
+                _reconcile_content(session, run, phase, BLOB_FOLDER, is_dir=False)
+            elif phase == 'variants':
+                _reconcile_content(session, run, phase, VARIANT_FOLDER, is_dir=True)
+            else:
+                _reconcile_files(session, run, phase)
+            run.checkpoint(PHASES[PHASES.index(phase) + 1] if phase != PHASES[-1] else phase, None)
+        if not dry_run:
+            run.counts['purged'] = purge_quarantine(root, quarantine_days, run)
+        run.finish()
+    except Exception:
+        session.rollback()
+        run.report.close()
+        raise
+
+    logger.info(f"File reconciliation {run.run_id}: {run.counts}")
+    return dict(run.counts, run_id=run.run_id, report=run.report_path)
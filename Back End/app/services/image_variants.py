@@ -0,0 +1,262 @@
+"""
+Resized WebP/JPEG variants of image attachments.
+
+Variants are rendered in a process pool, so decoding and resampling large
+photos neither holds the GIL of a web worker nor runs inside its request
+thread. JPEG sources are opened in draft mode, which has libjpeg decode at
+the smallest DCT scale still larger than the biggest requested variant
+instead of at full resolution. Each variant is cached on disk under the
+SHA-256 of its source content, so duplicate uploads share variants and a
+cached file never goes stale. Missing variants are rendered on first
+request; concurrent requests for the same variant wait on a single render.
+"""
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+VARIANT_FOLDER = 'variants'
+
+# Longest edge in pixels; images are never upscaled
+VARIANT_SIZES = {
+    'thumb': 200,
+    'small': 640,
+    'medium': 1280,
+    'large': 2048
+}
+
+# Format name -> (Pillow format, file extension, MIME type)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg')
+}
+
+# Source types Pillow can decode
+VARIANT_SOURCE_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'image/tiff'}
+
+class VariantError(Exception):
+    """Raised when a variant cannot be rendered."""
+    pass
+
+def variant_key(sha256: str, size: str, fmt: str) -> str:
+    """Storage key of a variant of the content with the given SHA-256."""
+    return f'{VARIANT_FOLDER}/{sha256[:2]}/{sha256[2:4]}/{sha256}/{size}.{VARIANT_FORMATS[fmt][1]}'
+
+def _save(image, pil_format: str, path: str, quality: int):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            if pil_format == 'JPEG':
+                if image.mode == 'RGBA':
+                    # JPEG has no alpha channel; flatten onto white rather than black
+                    background = Image.new('RGB', image.size, (255, 255, 255))
+                    background.paste(image, mask=image.getchannel('A'))
+                    image = background
+                image.save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+            else:
+                image.save(out, pil_format, quality=quality, method=4)
+        # Readers only ever see complete variants
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def render_variants(source_path: str, targets, quality: int = 80):
+    """
+    Render variants of one image; runs in a pool process.
+
+    Args:
+        source_path: Path of the source image
+        targets: List of (longest edge in pixels, Pillow format, destination path)
+        quality: Encoder quality, 1-100
+
+    Returns:
+        tuple: (width, height) of the source image
+
+    Raises:
+        FileNotFoundError: If the source does not exist
+        VariantError: If the source is not a readable image
+    """
+    try:
+        with Image.open(source_path) as image:
+            width, height = image.size
+            largest = max(edge for edge, _, _ in targets)
+            # No-op for formats other than JPEG
+            image.draft('RGB', (largest, largest))
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+            # Largest first, so each variant is resampled from the previous one rather than the full image
+            for edge, pil_format, path in sorted(targets, key=lambda target: -target[0]):
+                image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+                _save(image, pil_format, path, quality)
+            return width, height
+    except FileNotFoundError:
+        raise
+    except (OSError, Image.DecompressionBombError, ValueError) as e:
+        raise VariantError(f"Cannot render variants of {source_path}: {str(e)}")
+
+def missing_variants(root: str, sha256: str, sizes=None, formats=None):
+    """
+    List the variants of some content and which of them still need rendering.
+
+    Returns:
+        tuple: ({size: {format: storage key}}, `render_variants` targets for
+        the variants not yet on disk)
+    """
+    keys, targets = {}, []
+    for size in sizes or VARIANT_SIZES:
+        for fmt in formats or VARIANT_FORMATS:
+            key = variant_key(sha256, size, fmt)
+            keys.setdefault(size, {})[fmt] = key
+            path = os.path.join(root, key)
+            if not os.path.exists(path):
+                targets.append((VARIANT_SIZES[size], VARIANT_FORMATS[fmt][0], path))
+    return keys, targets
+
+def variant_folder(root: str, sha256: str) -> str:
+    """Folder holding every variant of the content with the given SHA-256."""
+    return os.path.join(root, os.path.dirname(variant_key(sha256, 'thumb', 'webp')))
+
+class ImageVariants:
+    """Renders and caches image variants under a storage root."""
+
+    def __init__(self, max_workers: int = None, quality: int = 80, timeout: float = 30):
+        """
+        Args:
+            max_workers: Render processes (default: number of CPUs)
+            quality: Encoder quality, 1-100
+            timeout: Seconds a request waits for a variant to render
+        """
+        self.max_workers = max_workers
+        self.quality = quality
+        self.timeout = timeout
+        self._executor = None
+        self._inflight = {}
+        # Reentrant: a future that is already done runs its callback, which takes the lock, immediately
+        self._lock = threading.RLock()
+
+    def init_app(self, app):
+        """Read pool settings from the app config."""
+        self.max_workers = app.config.get('IMAGE_VARIANT_WORKERS', self.max_workers)
+        self.quality = app.config.get('IMAGE_VARIANT_QUALITY', self.quality)
+        self.timeout = app.config.get('IMAGE_VARIANT_TIMEOUT', self.timeout)
+
+    def _pool(self):
+        if self._executor is None:
+            # Spawned rather than forked: forking a threaded web worker can deadlock the child
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def shutdown(self):
+        """Stop the render processes."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _discard_pool(self, executor):
+        """Drop a pool whose processes died, so the next render starts a fresh one."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _render(self, key, source_path, targets):
+        """Submit a render, or join the one already running under `key`; returns (future, pool)."""
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is None:
+                executor = self._pool()
+                try:
+                    future = executor.submit(render_variants, source_path, targets, self.quality)
+                except BrokenProcessPool:
+                    self._discard_pool(executor)
+                    executor = self._pool()
+                    future = executor.submit(render_variants, source_path, targets, self.quality)
+                entry = self._inflight[key] = (future, executor)
+                future.add_done_callback(lambda _: self._forget(key, future))
+        return entry
+
+    def _forget(self, key, future):
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is not None and entry[0] is future:
+                del self._inflight[key]
+
+    def _wait(self, key, source_path, targets, timeout=None):
+        """Render and wait for the result, retrying once on a fresh pool if a render process died."""
+        # A missing source would only surface as an error from inside the pool
+        if not os.path.exists(source_path):
+            raise FileNotFoundError(source_path)
+        future, executor = self._render(key, source_path, targets)
+        try:
+            return future.result(timeout)
+        except BrokenProcessPool:
+            logger.warning(f"Image variant pool broke while rendering {key}; restarting it")
+            self._discard_pool(executor)
+            future, _ = self._render(key, source_path, targets)
+            return future.result(timeout)
+
+    def get(self, root: str, sha256: str, source_path: str, size: str, fmt: str) -> str:
+        """
+        Return the path of a variant, rendering it first if it is not cached.
+
+        Args:
+            root: Storage root variants are kept under
+            sha256: SHA-256 of the source content
+            source_path: Path of the source image
+            size: Key of VARIANT_SIZES
+            fmt: Key of VARIANT_FORMATS
+
+        Returns:
+            str: Path of the variant file
+
+        Raises:
+            KeyError: For an unknown size or format
+            FileNotFoundError: If the source does not exist
+            VariantError: If the source cannot be rendered
+        """
+        key = variant_key(sha256, size, fmt)
+        path = os.path.join(root, key)
+        if os.path.exists(path):
+            return path
+        self._wait(key, source_path, [(VARIANT_SIZES[size], VARIANT_FORMATS[fmt][0], path)], self.timeout)
+        return path
+
+    def generate(self, root: str, sha256: str, source_path: str, sizes=None, formats=None) -> dict:
+        """
+        Render every missing variant of an image with a single decode.
+
+        Args:
+            root: Storage root variants are kept under
+            sha256: SHA-256 of the source content
+            source_path: Path of the source image
+            sizes: Keys of VARIANT_SIZES (default: all)
+            formats: Keys of VARIANT_FORMATS (default: all)
+
+        Returns:
+            dict: Storage keys of the variants, as {size: {format: key}}
+        """
+        keys, targets = missing_variants(root, sha256, sizes, formats)
+        if targets:
+            self._wait(f'{VARIANT_FOLDER}/{sha256}', source_path, targets)
+        return keys
+
+# Create a default instance
+image_variants = ImageVariants()
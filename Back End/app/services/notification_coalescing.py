@@ -0,0 +1,149 @@
+"""
+Notification coalescing and email/SMS digests.
+
+Bursty notifications (a new bid on a project, a project needing manual
+review) are merged into one row per user, type and group key while that row
+is unread and younger than the coalescing window, e.g. "12 new bids on
+Project X" instead of twelve rows. Instead of queueing a message per
+notification, coalesced rows are flagged for the next digest, which sends
+each user a single email and SMS covering everything since the last one.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+
+from .notification_outbox import enqueue
+from .notification_stream import queue_event, serialize_notification
+
+logger = logging.getLogger(__name__)
+
+SMS_MAX_LENGTH = 160
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def notify_coalesced(session, model, user_id, notification_type, group_key, title, message,
+                     aggregate=None, content=None, window=600, digest=True):
+    """
+    Add a notification, merging it into the user's open group if there is one.
+
+    Args:
+        session: The SQLAlchemy session to write in; the caller commits
+        model: The notification model (app or legacy)
+        user_id: The recipient
+        notification_type: Notification type, e.g. 'new_bid'
+        group_key: Notifications with the same type and key are merged,
+            e.g. 'project:42'
+        title: Title for a single notification
+        message: Message for a single notification
+        aggregate: Callable taking the merged count and returning the
+            (title, message) of the merged notification
+        content: Notification content (default: the message)
+        window: Seconds after a group is opened during which it is merged into
+        digest: Flag the notification for the next email/SMS digest
+
+    Returns:
+        The new or updated notification
+    """
+    since = _utcnow() - timedelta(seconds=window)
+    existing = session.query(model).filter(
+        model.user_id == user_id,
+        model.notification_type == notification_type,
+        model.group_key == group_key,
+        model.read == False,
+        model.created_at >= since
+    ).order_by(model.id.desc()).with_for_update().first()
+
+    if existing is None:
+        notification = model(
+            user_id=user_id,
+            title=title,
+            message=message,
+            content=content if content is not None else message,
+            notification_type=notification_type,
+            read=False,
+            group_key=group_key,
+            group_count=1,
+            digest_pending=digest
+        )
+        session.add(notification)
+        return notification
+
+    existing.group_count = (existing.group_count or 1) + 1
+    if aggregate is not None:
+        existing.title, existing.message = aggregate(existing.group_count)
+    else:
+        existing.title, existing.message = title, message
+    existing.content = content if content is not None else existing.message
+    existing.digest_pending = existing.digest_pending or digest
+    queue_event(session, user_id, 'notification_updated', serialize_notification(existing))
+    return existing
+
+def _digest_email(notifications):
+    count = sum(n.group_count or 1 for n in notifications)
+    subject = f"You have {count} new notification{'s' if count != 1 else ''}"
+    lines = [f"- {n.title}: {n.message}" for n in notifications]
+    return subject, '\n'.join([subject + ':', ''] + lines)
+
+def _digest_sms(notifications):
+    count = sum(n.group_count or 1 for n in notifications)
+    text = f"{count} new notification{'s' if count != 1 else ''}: " + '; '.join(n.title for n in notifications)
+    if len(text) > SMS_MAX_LENGTH:
+        text = text[:SMS_MAX_LENGTH - 3] + '...'
+    return text
+
+def send_notification_digests(session, notification_model, user_model, batch_size=500, channels=('email', 'sms')):
+    """
+    Queue one digest email and SMS per user for notifications awaiting a digest.
+
+    The outbox rows and the cleared digest flags commit together, so each
+    notification is included in exactly one digest.
+
+    Args:
+        session: SQLAlchemy session to work in
+        notification_model: The notification model (app or legacy)
+        user_model: The matching user model
+        batch_size: Notifications handled per transaction
+        channels: Channels the outbox dispatcher has a sender for; no
+            digest is queued on any other channel, since it would never be sent
+
+    Returns:
+        int: Number of users a digest was queued for
+    """
+    users_notified = 0
+    while True:
+        pending = session.query(notification_model).filter(
+            notification_model.digest_pending == True
+        ).order_by(notification_model.user_id, notification_model.id).limit(batch_size).with_for_update(skip_locked=True).all()
+        if not pending:
+            session.commit()
+            break
+
+        user_ids = {n.user_id for n in pending}
+        users = {
+            user.id: user
+            for user in session.query(user_model).filter(user_model.id.in_(user_ids))
+        }
+        for user_id, notifications in groupby(pending, key=lambda n: n.user_id):
+            notifications = list(notifications)
+            user = users.get(user_id)
+            email = getattr(user, 'email', None) if 'email' in channels else None
+            phone = getattr(user, 'phone', None) if 'sms' in channels else None
+            if email:
+                subject, body = _digest_email(notifications)
+                enqueue(session, 'email', email, body, subject=subject)
+            if phone:
+                enqueue(session, 'sms', phone, _digest_sms(notifications))
+            if email or phone:
+                users_notified += 1
+
+        for notification in pending:
+            notification.digest_pending = False
+        session.commit()
+
+        if len(pending) < batch_size:
+            break
+
+    if users_notified:
+        logger.info(f"Queued notification digests for {users_notified} users")
+    return users_notified
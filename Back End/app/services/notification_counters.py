@@ -0,0 +1,317 @@
+"""
+Incrementally maintained unread-notification counters.
+
+Each user's unread count is kept in the ``users.unread_notifications`` column,
+adjusted in the same transaction as the notification change, and mirrored in
+Redis so the badge poll is a single key read. Redis is only updated after the
+transaction commits; a missing key is reseeded from the column, and a
+periodic reconciliation job corrects any drift against the notifications
+table.
+
+A reseed must not overwrite an increment it did not see. Each counter has
+a sync hash: transactions changing the counter register as `writers` when
+they flush and, once they end, bump its `version`. A reader snapshots the
+version before reading the column and only seeds the key if no transaction
+is still in flight and the version has not moved since.
+"""
+import logging
+from collections import Counter
+
+import redis
+from sqlalchemy import bindparam, case, column, event, func, table
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history
+
+from .. import extensions
+from ..extensions import db
+from .notification_stream import publish
+
+logger = logging.getLogger(__name__)
+
+UNREAD_KEY = 'notifications:unread:{user_id}'
+UNREAD_KEY_TTL = 24 * 60 * 60
+SYNC_KEY = 'notifications:unread:{user_id}:sync'
+# A transaction that dies without ending blocks reseeding for at most this long
+SYNC_KEY_TTL = 60
+SESSION_DELTAS_KEY = 'unread_notification_deltas'
+SESSION_WRITERS_KEY = 'unread_notification_writers'
+
+# Lightweight table clause so both the app models and the legacy models.py
+# share the same update statement
+users_table = table('users', column('id'), column('unread_notifications'))
+
+# End a transaction's part in each counter. KEYS are the counters followed by
+# their sync hashes; ARGV the deltas, then whether each user was registered as
+# a writer, then whether the transaction committed. Committed deltas only
+# adjust counters Redis already holds (missing keys are reseeded from the
+# database on the next read) and counts never go below zero. Returns the new
+# value per key, or -1 where the key was missing or nothing was applied
+FINISH_SCRIPT = """
+local n = #KEYS / 2
+local committed = ARGV[2 * n + 1] == '1'
+local values = {}
+for i = 1, n do
+    local key, sync = KEYS[i], KEYS[n + i]
+    local value = -1
+    if committed then
+        if redis.call('EXISTS', key) == 1 then
+            value = redis.call('INCRBY', key, ARGV[i])
+            if value < 0 then
+                redis.call('SET', key, 0, 'KEEPTTL')
+                value = 0
+            end
+        end
+        redis.call('HINCRBY', sync, 'version', 1)
+    end
+    if ARGV[n + i] == '1' and redis.call('HINCRBY', sync, 'writers', -1) < 0 then
+        redis.call('HSET', sync, 'writers', 0)
+    end
+    redis.call('EXPIRE', sync, ARGV[2 * n + 2])
+    values[i] = value
+end
+return values
+"""
+
+# Read a counter, or on a miss the version of its sync hash to seed against
+READ_SCRIPT = """
+local value = redis.call('GET', KEYS[1])
+if value then
+    return {1, value}
+end
+return {0, redis.call('HGET', KEYS[2], 'version') or ''}
+"""
+
+# Seed a missing counter unless a transaction is changing it or has changed
+# it since the reader's snapshot of the version
+SEED_SCRIPT = """
+if tonumber(redis.call('HGET', KEYS[2], 'writers') or '0') > 0 then
+    return 0
+end
+if (redis.call('HGET', KEYS[2], 'version') or '') ~= ARGV[2] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3], 'NX')
+return 1
+"""
+
+_scripts = {}
+
+def _script(client, source):
+    script = _scripts.get(source)
+    if script is None or script.registered_client is not client:
+        script = _scripts[source] = client.register_script(source)
+    return script
+
+def _unread_key(user_id):
+    return UNREAD_KEY.format(user_id=user_id)
+
+def _sync_key(user_id):
+    return SYNC_KEY.format(user_id=user_id)
+
+def _column_update(user_id, delta):
+    adjusted = func.coalesce(users_table.c.unread_notifications, 0) + delta
+    return users_table.update().where(users_table.c.id == user_id).values(
+        unread_notifications=case((adjusted < 0, 0), else_=adjusted)
+    )
+
+def _register_writer(session, user_id):
+    """Block reseeding of a user's counter until this session's transaction ends."""
+    writers = session.info.setdefault(SESSION_WRITERS_KEY, set())
+    client = extensions.redis_client
+    if user_id in writers or client is None:
+        return
+    try:
+        sync_key = _sync_key(user_id)
+        pipe = client.pipeline()
+        pipe.hincrby(sync_key, 'writers', 1)
+        pipe.expire(sync_key, SYNC_KEY_TTL)
+        pipe.execute()
+        writers.add(user_id)
+    except (redis.RedisError, ConnectionError) as e:
+        logger.warning(f"Failed to register unread counter update in Redis: {str(e)}")
+
+def _queue_redis_delta(session, user_id, delta):
+    _register_writer(session, user_id)
+    deltas = session.info.setdefault(SESSION_DELTAS_KEY, Counter())
+    deltas[user_id] += delta
+
+def _finish(client, deltas, writers, committed):
+    """Apply committed deltas in Redis and release the transaction's writer registrations."""
+    user_ids = list(set(deltas) | set(writers))
+    return user_ids, _script(client, FINISH_SCRIPT)(
+        keys=[_unread_key(user_id) for user_id in user_ids] + [_sync_key(user_id) for user_id in user_ids],
+        args=[deltas.get(user_id, 0) for user_id in user_ids]
+        + [1 if user_id in writers else 0 for user_id in user_ids]
+        + [1 if committed else 0, SYNC_KEY_TTL]
+    )
+
+def record_unread_delta(session, user_id, delta):
+    """
+    Adjust a user's unread counter as part of the session's transaction.
+
+    Use this for bulk updates and deletes that bypass the ORM events, e.g.
+    marking all of a user's notifications as read.
+
+    Args:
+        session: The SQLAlchemy session the change is made in
+        user_id: The user whose counter changes
+        delta: Change in the number of unread notifications
+    """
+    if not delta:
+        return
+    session.execute(_column_update(user_id, delta))
+    _queue_redis_delta(session, user_id, delta)
+
+def _after_insert(mapper, connection, target):
+    if not target.read:
+        connection.execute(_column_update(target.user_id, 1))
+        _queue_redis_delta(object_session(target), target.user_id, 1)
+
+def _after_update(mapper, connection, target):
+    history = get_history(target, 'read')
+    if not history.has_changes():
+        return
+    was_read = bool(history.deleted[0]) if history.deleted else False
+    if was_read != bool(target.read):
+        delta = 1 if was_read else -1
+        connection.execute(_column_update(target.user_id, delta))
+        _queue_redis_delta(object_session(target), target.user_id, delta)
+
+def _after_delete(mapper, connection, target):
+    if not target.read:
+        connection.execute(_column_update(target.user_id, -1))
+        _queue_redis_delta(object_session(target), target.user_id, -1)
+
+def register_unread_tracking(model):
+    """Keep unread counters in step with inserts, read changes and deletes of a notification model."""
+    event.listen(model, 'after_insert', _after_insert)
+    event.listen(model, 'after_update', _after_update)
+    event.listen(model, 'after_delete', _after_delete)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_redis_deltas(session):
+    deltas = session.info.pop(SESSION_DELTAS_KEY, None) or Counter()
+    writers = session.info.pop(SESSION_WRITERS_KEY, None) or set()
+    client = extensions.redis_client
+    if not (deltas or writers) or client is None:
+        return
+
+    try:
+        user_ids, values = _finish(client, deltas, writers, committed=True)
+    except (redis.RedisError, ConnectionError) as e:
+        # The keys may now be stale, so drop them and reseed from the column
+        logger.warning(f"Failed to update unread counters in Redis: {str(e)}")
+        try:
+            client.delete(*[_unread_key(user_id) for user_id in set(deltas) | writers])
+        except (redis.RedisError, ConnectionError):
+            pass
+        return
+
+    for user_id, value in zip(user_ids, values or []):
+        if deltas.get(user_id) and int(value) >= 0:
+            publish(user_id, 'unread_count', {'count': int(value)})
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_redis_deltas(session):
+    session.info.pop(SESSION_DELTAS_KEY, None)
+
+@event.listens_for(Session, 'after_transaction_end')
+def _release_writers(session, transaction):
+    # Writers stay registered through savepoint rollbacks until the whole transaction ends
+    if transaction.parent is not None:
+        return
+    writers = session.info.pop(SESSION_WRITERS_KEY, None)
+    client = extensions.redis_client
+    if not writers or client is None:
+        return
+    try:
+        _finish(client, {}, writers, committed=False)
+    except (redis.RedisError, ConnectionError) as e:
+        logger.warning(f"Failed to release unread counter writers in Redis: {str(e)}")
+
+def get_unread_count(user_id):
+    """
+    Get a user's unread notification count.
+
+    Reads Redis first and falls back to the users.unread_notifications
+    column, reseeding Redis from it on a miss unless the counter changed
+    while the column was being read.
+    """
+    client = extensions.redis_client
+    keys = [_unread_key(user_id), _sync_key(user_id)]
+
+    if client is not None:
+        try:
+            found, value = _script(client, READ_SCRIPT)(keys=keys)
+            if int(found):
+                return max(0, int(value))
+            version = value.decode() if isinstance(value, bytes) else value
+        except (redis.RedisError, ConnectionError) as e:
+            logger.warning(f"Failed to read unread counter from Redis: {str(e)}")
+            client = None
+
+    count = db.session.execute(
+        users_table.select().with_only_columns(users_table.c.unread_notifications)
+        .where(users_table.c.id == user_id)
+    ).scalar() or 0
+
+    if client is not None:
+        try:
+            _script(client, SEED_SCRIPT)(keys=keys, args=[count, version, UNREAD_KEY_TTL])
+        except (redis.RedisError, ConnectionError):
+            pass
+    return count
+
+def reconcile_unread_counts(batch_size=1000):
+    """
+    Recompute unread counters from the notifications table and fix any drift.
+
+    The Redis keys of every checked user are dropped, corrected or not, so
+    drift in Redis alone is fixed too; each is reseeded on its next read.
+
+    Returns:
+        int: Number of users whose counter was corrected
+    """
+    from ..models import Notification, User
+
+    corrected = []
+    last_id = 0
+    while True:
+        # Walk users by primary key so the job never holds a huge result set
+        rows = db.session.query(User.id, User.unread_notifications).filter(
+            User.id > last_id
+        ).order_by(User.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        actual = dict(
+            db.session.query(Notification.user_id, func.count(Notification.id))
+            .filter(Notification.user_id.in_([user_id for user_id, _ in rows]))
+            .filter(Notification.read == False)
+            .group_by(Notification.user_id)
+            .all()
+        )
+        updates = [
+            {'user_id': user_id, 'count': actual.get(user_id, 0)}
+            for user_id, stored in rows
+            if (stored or 0) != actual.get(user_id, 0)
+        ]
+        if updates:
+            db.session.execute(
+                users_table.update()
+                .where(users_table.c.id == bindparam('user_id'))
+                .values(unread_notifications=bindparam('count')),
+                updates
+            )
+            corrected.extend(update['user_id'] for update in updates)
+        db.session.commit()
+
+        client = extensions.redis_client
+        if client is not None:
+            try:
+                client.delete(*[_unread_key(user_id) for user_id, _ in rows])
+            except (redis.RedisError, ConnectionError) as e:
+                logger.warning(f"Failed to clear reconciled unread counters: {str(e)}")
+
+    return len(corrected)
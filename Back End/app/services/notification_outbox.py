@@ -0,0 +1,277 @@
+"""
+Transactional outbox for notification emails and SMS.
+
+Request handlers write outbox rows in the same transaction as the
+notification they belong to, so a committed notification always has its
+deliveries queued and a rolled-back one never sends anything. A dispatcher
+(the Celery beat task, or a background thread in the standalone app) claims
+due rows in batches, sends them concurrently through the channel's sender
+and retries failures with exponential backoff.
+
+Delivery is at-least-once: a dispatcher that dies after sending but before
+marking the row sent leaves it to be retried once its claim expires.
+Each row carries a unique dedupe key, so the same delivery is never queued twice.
+"""
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import bindparam, column, insert, table
+from sqlalchemy.exc import IntegrityError
+
+from ..utils.work_queue import claim_batch, run_concurrently
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+
+# Lightweight table clause so both the app models and the legacy models.py
+# can write to the outbox through their own sessions
+outbox_table = table(
+    'notification_outbox',
+    column('id'), column('channel'), column('recipient'), column('subject'),
+    column('body'), column('dedupe_key'), column('status'), column('attempts'),
+    column('next_attempt_at'), column('claimed_by'), column('last_error'),
+    column('sent_at'), column('created_at'), column('updated_at')
+)
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def enqueue(session, channel, recipient, body, subject=None, dedupe_key=None):
+    """
+    Queue a message for delivery when the session's transaction commits.
+
+    Args:
+        session: The SQLAlchemy session the notification is written in
+        channel: Delivery channel, e.g. 'email' or 'sms'
+        recipient: Email address or phone number
+        body: Message body
+        subject: Subject line, for channels that have one
+        dedupe_key: Unique key for the delivery; a duplicate is ignored
+
+    Returns:
+        bool: False if a message with the same dedupe key is already queued
+    """
+    now = _utcnow()
+    values = {
+        'channel': channel,
+        'recipient': recipient,
+        'subject': subject,
+        'body': body,
+        'dedupe_key': dedupe_key,
+        'status': PENDING,
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now,
+        'updated_at': now
+    }
+    if dedupe_key is None:
+        session.execute(insert(outbox_table).values(**values))
+        return True
+
+    # A savepoint keeps a duplicate from rolling back the caller's transaction
+    try:
+        with session.begin_nested():
+            session.execute(insert(outbox_table).values(**values))
+    except IntegrityError:
+        return False
+    return True
+
+def enqueue_notification_delivery(session, notification, email=None, phone=None):
+    """
+    Queue the email and SMS copies of a notification.
+
+    Args:
+        session: The SQLAlchemy session the notification was added to
+        notification: The notification being delivered
+        email: Recipient email address, if any
+        phone: Recipient phone number, if any
+    """
+    if notification.id is None:
+        session.flush()
+
+    if email:
+        enqueue(
+            session, 'email', email, notification.message,
+            subject=notification.title,
+            dedupe_key=f'notification:{notification.id}:email'
+        )
+    if phone:
+        enqueue(
+            session, 'sms', phone, f'{notification.title}: {notification.message}',
+            dedupe_key=f'notification:{notification.id}:sms'
+        )
+
+def _retry_delay(attempts, base_delay, max_delay):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempts - 1)))
+
+def _claim(session, channels, batch_size, lease):
+    """Claim a batch of due messages on the given channels, returning them as rows."""
+    now = _utcnow()
+    # Claiming pushes next_attempt_at out by the lease, so rows left behind by
+    # a crashed dispatcher become due again on their own
+    messages = claim_batch(
+        session, outbox_table,
+        ready=[
+            outbox_table.c.status == PENDING,
+            outbox_table.c.next_attempt_at <= now,
+            outbox_table.c.channel.in_(channels)
+        ],
+        order_by=[outbox_table.c.next_attempt_at, outbox_table.c.id],
+        batch_size=batch_size,
+        values={
+            'claimed_by': uuid.uuid4().hex,
+            'next_attempt_at': now + timedelta(seconds=lease),
+            'updated_at': now
+        },
+        returning=[
+            outbox_table.c.id, outbox_table.c.channel, outbox_table.c.recipient,
+            outbox_table.c.subject, outbox_table.c.body, outbox_table.c.attempts
+        ]
+    )
+    session.commit()
+    return messages
+
+def dispatch_outbox(session, senders, batch_size=100, max_attempts=5,
+                    base_delay=30, max_delay=3600, lease=300, max_workers=8):
+    """
+    Deliver one batch of due outbox messages.
+
+    Args:
+        session: SQLAlchemy session to read and update the outbox with
+        senders: Mapping of channel -> callable(recipient, subject, body) that
+            raises on failure; only messages on these channels are claimed
+        batch_size: Maximum number of messages to claim
+        max_attempts: Attempts before a message is marked failed
+        base_delay: Seconds before the first retry; doubles per attempt
+        max_delay: Upper bound on the retry delay in seconds
+        lease: Seconds a claim is held before the message is retried
+        max_workers: Messages sent concurrently
+
+    Returns:
+        dict: Counts of 'sent', 'retried' and 'failed' messages
+    """
+    messages = _claim(session, list(senders), batch_size, lease)
+    results = {'sent': 0, 'retried': 0, 'failed': 0}
+    if not messages:
+        return results
+
+    delivered, errors = run_concurrently(
+        messages,
+        lambda message: senders[message.channel](message.recipient, message.subject, message.body),
+        max_workers=max_workers
+    )
+    sent = [message.id for message in delivered]
+    failed = []
+    for message, e in errors:
+        logger.warning(f"Outbox delivery {message.id} via {message.channel} failed: {str(e)}")
+        failed.append((message, str(e)[:1000]))
+
+    now = _utcnow()
+    if sent:
+        session.execute(
+            outbox_table.update().where(outbox_table.c.id.in_(sent)).values(
+                status=SENT, sent_at=now, claimed_by=None, last_error=None, updated_at=now
+            )
+        )
+        results['sent'] = len(sent)
+
+    if failed:
+        updates = []
+        for message, error in failed:
+            attempts = message.attempts + 1
+            gave_up = attempts >= max_attempts
+            updates.append({
+                'message_id': message.id,
+                'new_status': FAILED if gave_up else PENDING,
+                'new_attempts': attempts,
+                'retry_at': now + timedelta(seconds=_retry_delay(attempts, base_delay, max_delay)),
+                'error': error
+            })
+            results['failed' if gave_up else 'retried'] += 1
+        session.execute(
+            outbox_table.update().where(outbox_table.c.id == bindparam('message_id')).values(
+                status=bindparam('new_status'),
+                attempts=bindparam('new_attempts'),
+                next_attempt_at=bindparam('retry_at'),
+                last_error=bindparam('error'),
+                claimed_by=None,
+                updated_at=now
+            ),
+            updates
+        )
+
+    session.commit()
+    return results
+
+class OutboxDispatcher:
+    """Drains the outbox from a background thread in each worker process."""
+
+    def __init__(self, senders, interval=5, batch_size=100, jobs=None, **options):
+        """
+        Initialize the dispatcher.
+
+        Args:
+            senders: Mapping of channel -> callable(recipient, subject, body)
+            interval: Seconds to wait when the outbox is empty
+            batch_size: Messages claimed per batch
+            jobs: Optional list of (seconds, callable(session)) run periodically
+                before dispatching, e.g. building digests
+            **options: Retry options passed through to dispatch_outbox
+        """
+        self.senders = senders
+        self.interval = interval
+        self.batch_size = batch_size
+        self.jobs = [[seconds, job, 0] for seconds, job in (jobs or [])]
+        self.options = options
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def ensure_running(self, app, db):
+        """Start the dispatcher thread in this process if it is not already running."""
+        # Checked per process so forked workers start their own thread
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            thread = threading.Thread(
+                target=self._run, args=(app, db), name='notification-outbox', daemon=True
+            )
+            thread.start()
+
+    def _run_jobs(self, session):
+        for entry in self.jobs:
+            seconds, job, next_run = entry
+            if time.monotonic() < next_run:
+                continue
+            entry[2] = time.monotonic() + seconds
+            try:
+                job(session)
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Error running outbox job {getattr(job, '__name__', job)}: {str(e)}")
+
+    def _run(self, app, db):
+        while True:
+            try:
+                with app.app_context():
+                    self._run_jobs(db.session)
+                    results = dispatch_outbox(db.session, self.senders, self.batch_size, **self.options)
+                    db.session.remove()
+                # Keep draining while full batches come back
+                if sum(results.values()) >= self.batch_size:
+                    continue
+            except Exception as e:
+                logger.error(f"Error dispatching notification outbox: {str(e)}")
+            time.sleep(self.interval)
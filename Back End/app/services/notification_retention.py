@@ -0,0 +1,148 @@
+"""
+Retention for read notifications.
+
+Old read notifications are removed from the hot ``notifications`` table in
+small chunks, walking the primary key so each DELETE touches a bounded set of
+rows and commits quickly, with a short pause between chunks to leave room for
+production writes. Rows can be archived first, either into the compressed
+``notifications_archive`` table or to a gzipped JSONL file.
+"""
+import gzip
+import json
+import logging
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert, select
+
+from ..extensions import db
+
+logger = logging.getLogger(__name__)
+
+def _serialize(row):
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in row._mapping.items()
+    }
+
+class TableArchive:
+    """Archives rows into notifications_archive as zlib-compressed JSON."""
+
+    def write(self, session, rows):
+        from ..models import NotificationArchive
+
+        archived_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        session.execute(insert(NotificationArchive.__table__), [
+            {
+                'id': row.id,
+                'user_id': row.user_id,
+                'created_at': row.created_at,
+                'archived_at': archived_at,
+                'payload': zlib.compress(json.dumps(_serialize(row)).encode('utf-8'))
+            }
+            for row in rows
+        ])
+
+class JsonlArchive:
+    """Appends rows to a gzipped JSON Lines file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, session, rows):
+        # Each chunk is its own gzip member; readers handle concatenated members
+        with gzip.open(self.path, 'at', encoding='utf-8') as archive:
+            for row in rows:
+                archive.write(json.dumps(_serialize(row)) + '\n')
+
+def get_archive(mode, path=None):
+    """
+    Build an archive from configuration.
+
+    Args:
+        mode: 'table', 'jsonl' or None to delete without archiving
+        path: File path for the 'jsonl' mode
+    """
+    if not mode or mode == 'none':
+        return None
+    if mode == 'table':
+        return TableArchive()
+    if mode == 'jsonl':
+        if not path:
+            raise ValueError('A path is required to archive notifications to JSONL')
+        return JsonlArchive(path)
+    raise ValueError(f"Unknown notification archive mode '{mode}'")
+
+def purge_notifications(older_than_days=90, chunk_size=1000, pause=0.1, archive=None, max_chunks=None):
+    """
+    Delete read notifications older than a cutoff in primary-key ordered chunks.
+
+    Args:
+        older_than_days: Age in days after which read notifications are removed
+        chunk_size: Rows deleted per transaction
+        pause: Seconds to sleep between chunks
+        archive: Optional TableArchive or JsonlArchive the rows are copied to first
+        max_chunks: Stop after this many chunks (default: run until done)
+
+    Returns:
+        dict: 'deleted', 'archived', 'chunks', 'seconds' and 'rows_per_second'
+    """
+    from ..models import Notification
+
+    notifications = Notification.__table__
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=older_than_days)
+    eligible = (notifications.c.read == True) & (notifications.c.created_at < cutoff)
+
+    started = time.monotonic()
+    deleted = archived = chunks = 0
+    last_id = 0
+    while max_chunks is None or chunks < max_chunks:
+        if archive is not None:
+            # Lock the chunk so what is archived is exactly what gets deleted;
+            # rows another transaction holds are left for the next run
+            rows = db.session.execute(
+                select(notifications).where(eligible, notifications.c.id > last_id)
+                .order_by(notifications.c.id).limit(chunk_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            ids = [row.id for row in rows]
+        else:
+            ids = db.session.execute(
+                select(notifications.c.id).where(eligible, notifications.c.id > last_id)
+                .order_by(notifications.c.id).limit(chunk_size)
+            ).scalars().all()
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        try:
+            if archive is not None:
+                archive.write(db.session, rows)
+                archived += len(rows)
+            # Re-check eligibility so a row marked unread meanwhile is kept
+            result = db.session.execute(
+                delete(notifications).where(notifications.c.id.in_(ids), eligible)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        deleted += result.rowcount
+        chunks += 1
+
+        if len(ids) < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    seconds = time.monotonic() - started
+    report = {
+        'deleted': deleted,
+        'archived': archived,
+        'chunks': chunks,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(deleted / seconds, 1) if seconds > 0 else 0.0
+    }
+    logger.info(f"Notification retention: {report}")
+    return report
@@ -0,0 +1,225 @@
+"""
+Server-Sent Events stream of a user's notifications.
+
+New notifications and unread-count changes are published to a per-user Redis
+pub/sub channel once their transaction commits. Each open stream subscribes to
+its user's channel, replays anything after the client's Last-Event-ID from the
+database and then relays published events, with periodic heartbeats. A client
+that missed more than REPLAY_LIMIT notifications is sent a `resync` event
+instead and refetches its inbox. Without Redis the stream falls back to
+polling the database.
+
+Streams are long-lived, so serve them from an async-capable worker (e.g.
+``gunicorn -k gevent``) where an idle connection does not hold a thread.
+"""
+import json
+import logging
+import threading
+import time
+
+import redis
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, object_session
+
+from .. import extensions
+from ..extensions import db
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'notifications:user:{user_id}'
+SESSION_EVENTS_KEY = 'notification_stream_events'
+REPLAY_LIMIT = 100
+
+def _channel(user_id):
+    return CHANNEL.format(user_id=user_id)
+
+def publish(user_id, event_type, data):
+    """
+    Publish an event to a user's notification stream.
+
+    Args:
+        user_id: The user the event is for
+        event_type: SSE event name, e.g. 'notification' or 'unread_count'
+        data: JSON-serializable event payload
+    """
+    client = extensions.redis_client
+    if client is None:
+        return
+    try:
+        client.publish(_channel(user_id), json.dumps({'event': event_type, 'data': data}))
+    except (redis.RedisError, ConnectionError) as e:
+        logger.warning(f"Failed to publish notification event: {str(e)}")
+
+def serialize_notification(notification):
+    """Serialize a notification for the stream; works for the app and legacy models."""
+    created_at = notification.created_at
+    return {
+        'id': notification.id,
+        'title': notification.title,
+        'message': notification.message,
+        'content': notification.content,
+        'read': bool(notification.read),
+        'notification_type': notification.notification_type,
+        'group_count': notification.group_count,
+        'created_at': created_at.isoformat() if created_at else None,
+        'user_id': notification.user_id
+    }
+
+def queue_event(session, user_id, event_type, data):
+    """Publish an event to a user's stream once the session's transaction commits."""
+    session.info.setdefault(SESSION_EVENTS_KEY, []).append((user_id, event_type, data))
+
+def _after_insert(mapper, connection, target):
+    queue_event(object_session(target), target.user_id, 'notification', serialize_notification(target))
+
+def register_stream_publishing(model):
+    """Publish new rows of a notification model to their user's stream after commit."""
+    event.listen(model, 'after_insert', _after_insert)
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed(session):
+    for user_id, event_type, data in session.info.pop(SESSION_EVENTS_KEY, []):
+        publish(user_id, event_type, data)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_uncommitted(session):
+    session.info.pop(SESSION_EVENTS_KEY, None)
+
+class ConnectionSlots:
+    """Caps the number of streams a worker process keeps open."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+
+    def acquire(self, limit):
+        """Take a slot if fewer than `limit` are in use."""
+        with self._lock:
+            if self.active >= limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        """Return a slot."""
+        with self._lock:
+            self.active = max(0, self.active - 1)
+
+stream_slots = ConnectionSlots()
+
+def format_event(event_type, data, event_id=None):
+    """Format an SSE message."""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+def _latest_id(user_id):
+    """ID of the user's newest notification, or 0."""
+    from ..models import Notification
+
+    return db.session.query(func.max(Notification.id)).filter(Notification.user_id == user_id).scalar() or 0
+
+def _replay(user_id, after_id):
+    """Load up to REPLAY_LIMIT + 1 notifications created after an event ID, oldest first."""
+    from ..models import Notification
+
+    notifications = Notification.query.filter(
+        Notification.user_id == user_id,
+        Notification.id > after_id
+    ).order_by(Notification.id.asc()).limit(REPLAY_LIMIT + 1).all()
+    return [serialize_notification(n) for n in notifications]
+
+def _catch_up(user_id, after_id):
+    """
+    SSE messages for the notifications created after an event ID.
+
+    Returns:
+        tuple: (messages, ID of the last notification they cover); more than
+        REPLAY_LIMIT missed notifications become one `resync` event
+    """
+    notifications = _replay(user_id, after_id)
+    if len(notifications) > REPLAY_LIMIT:
+        latest = _latest_id(user_id)
+        return [format_event('resync', {'last_event_id': latest}, event_id=latest)], latest
+    messages = [format_event('notification', n, event_id=n['id']) for n in notifications]
+    return messages, notifications[-1]['id'] if notifications else after_id
+
+def notification_events(user_id, last_event_id=None, heartbeat_interval=15, poll_interval=5):
+    """
+    Generate SSE messages for a user's notifications.
+
+    Args:
+        user_id: The user whose notifications are streamed
+        last_event_id: ID of the last notification the client received, or
+            None for a new client, which is only sent what comes next
+        heartbeat_interval: Seconds between keep-alive comments
+        poll_interval: Seconds between database polls when Redis is unavailable
+    """
+    from .notification_counters import get_unread_count
+
+    pubsub = None
+    client = extensions.redis_client
+    if client is not None:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(_channel(user_id))
+        except (redis.RedisError, ConnectionError) as e:
+            logger.warning(f"Notification stream subscription failed: {str(e)}. Polling instead")
+            pubsub = None
+
+    try:
+        yield 'retry: 5000\n\n'
+
+        # Subscribed before replaying, so nothing created in between is lost;
+        # duplicates are dropped by comparing IDs
+        if last_event_id is None:
+            last_event_id = _latest_id(user_id)
+        else:
+            messages, last_event_id = _catch_up(user_id, last_event_id)
+            yield from messages
+        unread_count = get_unread_count(user_id)
+        yield format_event('unread_count', {'count': unread_count})
+        # Do not hold a pooled connection for the life of the stream
+        db.session.close()
+
+        next_heartbeat = time.monotonic() + heartbeat_interval
+        while True:
+            if pubsub is not None:
+                try:
+                    message = pubsub.get_message(timeout=1.0)
+                except (redis.RedisError, ConnectionError) as e:
+                    logger.warning(f"Notification stream subscription lost: {str(e)}. Polling instead")
+                    pubsub.close()
+                    pubsub = None
+                    continue
+
+                if message:
+                    payload = json.loads(message['data'])
+                    if payload['event'] == 'notification':
+                        notification_id = payload['data']['id']
+                        if notification_id <= last_event_id:
+                            continue
+                        last_event_id = notification_id
+                        yield format_event('notification', payload['data'], event_id=notification_id)
+                    else:
+                        yield format_event(payload['event'], payload['data'])
+                    next_heartbeat = time.monotonic() + heartbeat_interval
+            else:
+                time.sleep(poll_interval)
+                messages, last_event_id = _catch_up(user_id, last_event_id)
+                yield from messages
+                count = get_unread_count(user_id)
+                db.session.close()
+                if count != unread_count:
+                    unread_count = count
+                    yield format_event('unread_count', {'count': count})
+
+            if time.monotonic() >= next_heartbeat:
+                yield ': heartbeat\n\n'
+                next_heartbeat = time.monotonic() + heartbeat_interval
+    finally:
+        if pubsub is not None:
+            pubsub.close()
@@ -0,0 +1,292 @@
+"""
+Resumable uploads for large documents.
+
+A client opens an upload session for a file of known size, then PUTs it as
+numbered, fixed-size chunks in any order and from any number of connections.
+Every chunk is written with `os.pwrite` at its own offset of a sparse
+temporary file sized up front, so chunks never need to arrive in order,
+and a retried chunk simply overwrites the same bytes. Each chunk's SHA-256
+is computed while it is written (and checked against the client's, if
+sent), and the received chunks are recorded in `upload_chunks`, so after a
+dropped connection the client asks which ranges arrived and sends only the
+rest. Once every chunk is in, the file is hashed in one sequential pass and
+stored like any other upload. Sessions that go quiet expire.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from ..models import UploadChunk, UploadSession
+from ..utils.uploads import CHUNK_SIZE, INCOMING_FOLDER, SNIFF_SIZE, ReceivedUpload, sniff_mime_type
+
+logger = logging.getLogger(__name__)
+
+class ResumableUploadError(Exception):
+    """Raised when a chunk or upload session request cannot be honoured."""
+    pass
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def upload_path(root: str, token: str) -> str:
+    """Path of the temporary file an upload session writes to."""
+    return os.path.join(root, INCOMING_FOLDER, f'{token}.upload')
+
+def create_upload_session(
+    session,
+    root: str,
+    created_by: int,
+    filename: str,
+    total_size: int,
+    chunk_size: int,
+    ttl: int,
+    **attachment
+) -> UploadSession:
+    """
+    Open an upload session and allocate its (sparse) temporary file.
+
+    Args:
+        session: SQLAlchemy session
+        root: Upload folder
+        created_by: ID of the uploading user
+        filename: Sanitized file name
+        total_size: Size of the file in bytes
+        chunk_size: Size of every chunk but the last
+        ttl: Seconds the session stays open without receiving a chunk
+        **attachment: document_type, user_id, job_id, bid_id, title and
+            description of the attachment to create on completion
+
+    Returns:
+        UploadSession: The committed session
+    """
+    upload = UploadSession(
+        token=uuid.uuid4().hex,
+        created_by=created_by,
+        filename=filename,
+        total_size=total_size,
+        chunk_size=chunk_size,
+        expires_at=_now() + timedelta(seconds=ttl),
+        **attachment
+    )
+    path = upload_path(root, upload.token)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        # Allocates no blocks; chunks fill the file in wherever they land
+        os.ftruncate(fd, total_size)
+    finally:
+        os.close(fd)
+
+    try:
+        session.add(upload)
+        session.commit()
+    except Exception:
+        session.rollback()
+        _remove(path)
+        raise
+    return upload
+
+def write_chunk(session, upload: UploadSession, root: str, index: int, stream, ttl: int,
+                expected_sha256: str = None, piece_size: int = CHUNK_SIZE) -> str:
+    """
+    Write one chunk from a request stream at its offset and record it.
+
+    Writing the same chunk again lands on the same bytes. The chunk counts
+    as missing while it is written, so a retry that fails its checks is
+    sent again rather than leaving bad bytes behind a "received" record.
+
+    Args:
+        session: SQLAlchemy session
+        upload: The upload session
+        root: Upload folder
+        index: 0-based chunk number
+        stream: Readable binary stream with the chunk's bytes
+        ttl: Seconds to extend the session by
+        expected_sha256: Client's SHA-256 of the chunk, if sent
+        piece_size: Bytes read from the stream and written at a time
+
+    Returns:
+        str: SHA-256 hex digest of the chunk
+
+    Raises:
+        ResumableUploadError: For an unknown chunk, a wrong length or a digest mismatch
+    """
+    if not 0 <= index < upload.chunk_count:
+        raise ResumableUploadError(f'Chunk index must be between 0 and {upload.chunk_count - 1}.')
+    expected = upload.chunk_length(index)
+    offset = index * upload.chunk_size
+
+    # A retry overwrites the chunk's bytes, so the chunk is not received again until it passes its checks
+    try:
+        session.execute(delete(UploadChunk).where(UploadChunk.session_id == upload.id, UploadChunk.index == index))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    sha256 = hashlib.sha256()
+    written = 0
+
+    fd = os.open(upload_path(root, upload.token), os.O_WRONLY)
+    try:
+        while True:
+            piece = stream.read(piece_size)
+            if not piece:
+                break
+            if written + len(piece) > expected:
+                raise ResumableUploadError(f'Chunk {index} must be {expected} bytes.')
+            view = memoryview(piece)
+            while view:
+                count = os.pwrite(fd, view, offset + written)
+                written += count
+                view = view[count:]
+            sha256.update(piece)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    if written != expected:
+        raise ResumableUploadError(f'Chunk {index} must be {expected} bytes, got {written}.')
+    digest = sha256.hexdigest()
+    if expected_sha256 and expected_sha256.lower() != digest:
+        raise ResumableUploadError(f'Chunk {index} does not match its SHA-256.')
+
+    try:
+        try:
+            with session.begin_nested():
+                session.add(UploadChunk(session_id=upload.id, index=index, sha256=digest))
+        except IntegrityError:
+            # The same chunk was recorded by a concurrent retry
+            chunk = session.get(UploadChunk, (upload.id, index), populate_existing=True)
+            chunk.sha256 = digest
+        upload.expires_at = _now() + timedelta(seconds=ttl)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return digest
+
+def received_chunks(session, upload: UploadSession):
+    """Sorted indexes of the chunks received so far."""
+    return list(session.execute(
+        select(UploadChunk.index).where(UploadChunk.session_id == upload.id).order_by(UploadChunk.index)
+    ).scalars())
+
+def upload_status(session, upload: UploadSession) -> dict:
+    """
+    Describe an upload session for the client.
+
+    Returns:
+        dict: Session details with the byte 'ranges' received, as half-open
+        [start, end) pairs, and the 'missing' chunk indexes
+    """
+    received = received_chunks(session, upload)
+    ranges = []
+    for index in received:
+        start = index * upload.chunk_size
+        end = start + upload.chunk_length(index)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    done = set(received)
+    return {
+        'upload_id': upload.token,
+        'filename': upload.filename,
+        'total_size': upload.total_size,
+        'chunk_size': upload.chunk_size,
+        'chunk_count': upload.chunk_count,
+        'ranges': ranges,
+        'missing': [index for index in range(upload.chunk_count) if index not in done],
+        'expires_at': upload.expires_at.isoformat()
+    }
+
+def finish_upload(session, upload: UploadSession, root: str, expected_sha256: str = None) -> ReceivedUpload:
+    """
+    Check that every chunk has arrived and hash the assembled file.
+
+    Returns:
+        ReceivedUpload: The temporary file, ready for `store_blob`
+
+    Raises:
+        ResumableUploadError: If chunks are missing or the file does not match its SHA-256
+    """
+    missing = upload.chunk_count - len(received_chunks(session, upload))
+    if missing:
+        raise ResumableUploadError(f'{missing} chunks have not been received.')
+
+    path = upload_path(root, upload.token)
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_SIZE)
+        sha256.update(head)
+        for piece in iter(lambda: f.read(CHUNK_SIZE * 16), b''):
+            sha256.update(piece)
+    digest = sha256.hexdigest()
+    if expected_sha256 and expected_sha256.lower() != digest:
+        raise ResumableUploadError('The assembled file does not match its SHA-256.')
+    return ReceivedUpload(path, upload.total_size, digest, sniff_mime_type(head, upload.filename))
+
+def stage_for_storage(received: ReceivedUpload) -> ReceivedUpload:
+    """
+    A second link to an assembled upload, for `store_blob` to consume.
+
+    The session's own file stays in place until the attachment commits, so
+    a failed store can be retried without sending the chunks again.
+    """
+    path = f'{received.path}.{uuid.uuid4().hex[:8]}.store'
+    try:
+        os.link(received.path, path)
+    except OSError:
+        shutil.copyfile(received.path, path)
+    return received._replace(path=path)
+
+def close_upload_session(session, upload: UploadSession, root: str, remove_file: bool = True):
+    """
+    Delete an upload session; the caller commits.
+
+    Args:
+        remove_file: Also delete the temporary file; pass False to keep it
+            until the attachment stored from it has committed
+    """
+    session.execute(delete(UploadChunk).where(UploadChunk.session_id == upload.id))
+    session.delete(upload)
+    if remove_file:
+        _remove(upload_path(root, upload.token))
+
+def expire_upload_sessions(session, root: str, batch_size: int = 100) -> int:
+    """
+    Delete upload sessions that have received nothing before their expiry.
+
+    Returns:
+        int: Number of sessions deleted
+    """
+    expired = 0
+    while True:
+        uploads = session.execute(
+            select(UploadSession).where(UploadSession.expires_at < _now()).order_by(UploadSession.id).limit(batch_size)
+        ).scalars().all()
+        if not uploads:
+            break
+        try:
+            for upload in uploads:
+                close_upload_session(session, upload, root)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        expired += len(uploads)
+    if expired:
+        logger.info(f"Expired {expired} upload sessions")
+    return expired
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
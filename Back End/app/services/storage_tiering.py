@@ -0,0 +1,284 @@
+"""
+Local staging tier in front of remote storage.
+
+With `STORAGE_OFFLOAD` enabled, uploads are stored on local disk like any
+local blob and are served from there straight away; the request never
+waits on the remote provider. A background run (the Celery beat task)
+then claims staged blobs in batches, pushes them to the provider
+concurrently and, once a push has succeeded, swaps the blob's and its
+attachments' `public_url` in and evicts the local copy. Failed pushes are
+retried with exponential backoff, and the local copy is kept until the
+push succeeds, so a provider outage delays offloading but loses nothing.
+
+Providers implement `RemoteProvider`; `FilesystemProvider` stands in for a
+remote store in tests and development.
+"""
+import abc
+import logging
+import os
+import random
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import bindparam, func, or_, select
+from werkzeug.datastructures import FileStorage
+
+from ..models import Attachment, Blob
+from ..utils.work_queue import claim_batch, run_concurrently
+from .blob_storage import LocalBlobStore
+from .cloudinary_storage import cloudinary_storage
+from .document_index import INDEXED_TYPES
+from .image_variants import VARIANT_SOURCE_TYPES
+
+logger = logging.getLogger(__name__)
+
+blobs = Blob.__table__
+attachments = Attachment.__table__
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class RemoteProvider(abc.ABC):
+    """Remote storage that staged blobs are pushed to."""
+
+    # Whether the provider renders image variants itself, so local ones can be evicted
+    serves_variants = False
+
+    @abc.abstractmethod
+    def push(self, path: str, key: str, mime_type: str, filename: str) -> str:
+        """
+        Upload a local file under a storage key.
+
+        Args:
+            path: Local path of the staged file
+            key: Storage key of the blob
+            mime_type: MIME type of the content
+            filename: Original name of a file with this content
+
+        Returns:
+            str: Public URL of the pushed file
+
+        Raises:
+            Exception: If the push failed; it is retried
+        """
+
+    @abc.abstractmethod
+    def delete(self, key: str):
+        """Delete a pushed file; deleting a missing file is not an error."""
+
+class CloudinaryProvider(RemoteProvider):
+    """Pushes blobs to Cloudinary, under their storage key as public ID."""
+
+    serves_variants = True
+
+    def push(self, path, key, mime_type, filename):
+        resource_type = 'auto'
+        if mime_type.startswith('image/'):
+            resource_type = 'image'
+        elif mime_type.startswith('video/'):
+            resource_type = 'video'
+        elif mime_type.startswith('application/pdf'):
+            resource_type = 'raw'
+        with open(path, 'rb') as staged:
+            result = cloudinary_storage.upload_file(
+                FileStorage(staged, filename=filename, content_type=mime_type),
+                public_id=key,
+                max_size=os.path.getsize(path),
+                resource_type=resource_type
+            )
+        return result['secure_url']
+
+    def delete(self, key):
+        cloudinary_storage.delete_file(key)
+
+class FilesystemProvider(RemoteProvider):
+    """Keeps "remote" copies in a local directory; a stand-in for a real provider."""
+
+    def __init__(self, root: str, base_url: str):
+        """
+        Args:
+            root: Directory the pushed files are written to
+            base_url: URL prefix the directory is served under
+        """
+        self.root = root
+        self.base_url = base_url.rstrip('/')
+
+    def push(self, path, key, mime_type, filename):
+        destination = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out, open(path, 'rb') as staged:
+                shutil.copyfileobj(staged, out)
+            os.replace(temp_path, destination)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return f'{self.base_url}/{key}'
+
+    def delete(self, key):
+        try:
+            os.remove(os.path.join(self.root, key))
+        except FileNotFoundError:
+            pass
+
+def get_provider(config) -> RemoteProvider:
+    """The remote provider configured by STORAGE_PROVIDER, or None for local storage only."""
+    name = config.get('STORAGE_PROVIDER')
+    if name == 'cloudinary':
+        return CloudinaryProvider()
+    if name == 'filesystem':
+        return FilesystemProvider(config['REMOTE_STORAGE_ROOT'], config.get('REMOTE_STORAGE_URL') or '')
+    return None
+
+class TieredBlobStore(LocalBlobStore):
+    """
+    Blob store for the staging tier: new content is written locally, and
+    deleting a blob removes both its local and its remote copy.
+    """
+
+    def __init__(self, root: str, provider: RemoteProvider):
+        super().__init__(root)
+        self.provider = provider
+
+    def delete(self, key: str):
+        super().delete(key)
+        self.provider.delete(key)
+
+def _retry_delay(attempts, base_delay, max_delay):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempts - 1)))
+
+def _claim(session, batch_size, max_attempts, lease):
+    """Claim a batch of staged blobs that are due to be pushed."""
+    now = _utcnow()
+    staged = claim_batch(
+        session, blobs,
+        ready=[
+            blobs.c.public_url.is_(None),
+            blobs.c.ref_count > 0,
+            blobs.c.offload_attempts < max_attempts,
+            or_(blobs.c.offload_next_at.is_(None), blobs.c.offload_next_at <= now),
+            # PDFs are read from disk until their text is indexed
+            or_(
+                blobs.c.mime_type.is_(None),
+                blobs.c.mime_type.notin_(INDEXED_TYPES),
+                blobs.c.text_indexed_at.isnot(None)
+            )
+        ],
+        order_by=[blobs.c.id],
+        batch_size=batch_size,
+        values={'offload_next_at': now + timedelta(seconds=lease)},
+        returning=[blobs.c.id, blobs.c.storage_key, blobs.c.mime_type, blobs.c.offload_attempts]
+    )
+    session.commit()
+    if not staged:
+        return []
+
+    # The provider may check the original file name (e.g. its extension)
+    filenames = dict(session.execute(
+        select(attachments.c.blob_id, func.min(attachments.c.filename))
+        .where(attachments.c.blob_id.in_([blob.id for blob in staged]))
+        .group_by(attachments.c.blob_id)
+    ).all())
+    return [(blob, filenames.get(blob.id) or os.path.basename(blob.storage_key)) for blob in staged]
+
+def offload_blobs(session, root: str, provider: RemoteProvider, batch_size: int = 20, max_attempts: int = 8,
+                  base_delay: int = 60, max_delay: int = 3600, lease: int = 600, max_workers: int = 4) -> dict:
+    """
+    Push one batch of staged blobs to remote storage.
+
+    Args:
+        session: SQLAlchemy session
+        root: Upload folder the staged blobs are stored in
+        provider: RemoteProvider to push to
+        batch_size: Maximum number of blobs to claim
+        max_attempts: Failed pushes after which a blob stays local
+        base_delay: Seconds before the first retry; doubles per attempt
+        max_delay: Upper bound on the retry delay in seconds
+        lease: Seconds a claim is held before the blob is retried
+        max_workers: Blobs pushed concurrently
+
+    Returns:
+        dict: Counts of blobs 'offloaded', 'retried' and 'failed'
+    """
+    staged = _claim(session, batch_size, max_attempts, lease)
+    results = {'offloaded': 0, 'retried': 0, 'failed': 0}
+    if not staged:
+        return results
+
+    public_urls = {}
+
+    def push(item):
+        blob, filename = item
+        public_urls[blob.id] = provider.push(
+            os.path.join(root, blob.storage_key), blob.storage_key, blob.mime_type or 'application/octet-stream', filename
+        )
+
+    pushed, errors = run_concurrently(staged, push, max_workers=max_workers)
+    now = _utcnow()
+    if pushed:
+        swaps = [{'staged_id': blob.id, 'url': public_urls[blob.id]} for blob, _ in pushed]
+        session.execute(
+            blobs.update().where(blobs.c.id == bindparam('staged_id')).values(
+                public_url=bindparam('url'), offload_next_at=None, offload_error=None, updated_at=now
+            ),
+            swaps
+        )
+        session.execute(
+            attachments.update().where(attachments.c.blob_id == bindparam('staged_id')).values(
+                public_url=bindparam('url')
+            ),
+            swaps
+        )
+        results['offloaded'] = len(pushed)
+
+    if errors:
+        updates = []
+        for (blob, _), e in errors:
+            logger.warning(f"Offloading blob {blob.id} failed: {str(e)}")
+            attempts = blob.offload_attempts + 1
+            results['failed' if attempts >= max_attempts else 'retried'] += 1
+            updates.append({
+                'staged_id': blob.id,
+                'new_attempts': attempts,
+                'retry_at': now + timedelta(seconds=_retry_delay(attempts, base_delay, max_delay)),
+                'error': str(e)[:1000]
+            })
+        session.execute(
+            blobs.update().where(blobs.c.id == bindparam('staged_id')).values(
+                offload_attempts=bindparam('new_attempts'),
+                offload_next_at=bindparam('retry_at'),
+                offload_error=bindparam('error'),
+                updated_at=now
+            ),
+            updates
+        )
+
+    session.commit()
+    if pushed:
+        _evict(session, root, provider, [blob for blob, _ in pushed])
+    return results
+
+def _evict(session, root, provider, pushed):
+    """Remove the local copies of pushed blobs, and the remote copies of blobs deleted meanwhile."""
+    rows = session.execute(
+        select(blobs.c.id, blobs.c.storage_key).where(blobs.c.storage_key.in_([blob.storage_key for blob in pushed]))
+    ).all()
+    session.commit()
+    ids = {row.id for row in rows}
+    keys = {row.storage_key for row in rows}
+    local = LocalBlobStore(root)
+    for blob in pushed:
+        try:
+            if blob.id not in ids:
+                # Released while it was being pushed, so its deletion missed the remote copy;
+                # if the same content was uploaded again since, that blob is pushed on its own
+                if blob.storage_key not in keys:
+                    provider.delete(blob.storage_key)
+            elif provider.serves_variants or blob.mime_type not in VARIANT_SOURCE_TYPES:
+                local.delete(blob.storage_key)
+        except Exception as e:
+            logger.error(f"Failed to evict blob {blob.storage_key}: {str(e)}")
@@ -9,25 +9,25 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-def make_celery(app):
+def make_celery(app, celery=None):
     """
     Create and configure a new Celery instance.
     
     Args:
         app: Flask application instance
+        celery: Existing Celery instance to configure instead of creating one
         
     Returns:
         Celery: Configured Celery application
     """
     # Create Celery instance
-    celery = Celery(
-        app.import_name,
-        backend=app.config['CELERY_RESULT_BACKEND'],
-        broker=app.config['CELERY_BROKER_URL']
-    )
+    if celery is None:
+        celery = Celery(app.import_name)
     
     # Set default Celery config
     celery.conf.update(
+        broker_url=app.config['CELERY_BROKER_URL'],
+        result_backend=app.config['CELERY_RESULT_BACKEND'],
         broker_connection_retry_on_startup=True,
         broker_connection_retry=True,
         broker_connection_max_retries=5,
@@ -55,14 +55,50 @@ def make_celery(app):
         },
         beat_schedule={
             # Scheduled tasks can be added here
-            'cleanup-expired-sessions': {
-                'task': 'app.tasks.scheduled.cleanup_expired_sessions',
-                'schedule': timedelta(hours=24),  # Run daily
-            },
             'send-scheduled-emails': {
                 'task': 'app.tasks.scheduled.send_scheduled_emails',
                 'schedule': timedelta(minutes=5),  # Run every 5 minutes
             },
+            'flush-last-active': {
+                'task': 'app.tasks.scheduled.flush_last_active',
+                'schedule': timedelta(seconds=app.config.get('LAST_ACTIVE_FLUSH_INTERVAL', 60)),
+            },
+            'reconcile-notification-counters': {
+                'task': 'app.tasks.scheduled.reconcile_notification_counters',
+                'schedule': timedelta(hours=1),
+            },
+            'cleanup-old-notifications': {
+                'task': 'app.tasks.scheduled.cleanup_old_notifications',
+                'schedule': timedelta(hours=24),
+            },
+            'send-notification-digests': {
+                'task': 'app.tasks.scheduled.send_notification_digests',
+                'schedule': timedelta(seconds=app.config.get('NOTIFICATION_DIGEST_INTERVAL', 900)),
+            },
+            'dispatch-notification-outbox': {
+                'task': 'app.tasks.scheduled.dispatch_notification_outbox',
+                'schedule': timedelta(seconds=app.config.get('OUTBOX_DISPATCH_INTERVAL', 10)),
+            },
+            'check-attachment-integrity': {
+                'task': 'app.tasks.scheduled.check_attachment_integrity',
+                'schedule': timedelta(seconds=app.config.get('ATTACHMENT_INTEGRITY_INTERVAL', 21600)),
+            },
+            'index-documents': {
+                'task': 'app.tasks.scheduled.index_documents',
+                'schedule': timedelta(seconds=app.config.get('DOCUMENT_INDEX_INTERVAL', 60)),
+            },
+            'cleanup-expired-uploads': {
+                'task': 'app.tasks.scheduled.cleanup_expired_uploads',
+                'schedule': timedelta(hours=1),
+            },
+            'cleanup-orphaned-files': {
+                'task': 'app.tasks.file_tasks.cleanup_orphaned_files',
+                'schedule': timedelta(seconds=app.config.get('ORPHAN_RECONCILE_INTERVAL', 86400)),
+            },
+            'offload-staged-blobs': {
+                'task': 'app.tasks.scheduled.offload_staged_blobs',
+                'schedule': timedelta(seconds=app.config.get('STORAGE_OFFLOAD_INTERVAL', 30)),
+            },
         },
     )
     
@@ -84,8 +120,9 @@ def make_celery(app):
     
     return celery
 
-# Create a default Celery instance that will be configured later
-celery_app = None
+# Task modules register their tasks on this instance when they are imported;
+# init_celery configures it once the Flask app exists
+celery_app = Celery(__name__)
 
 def init_celery(app):
     """
@@ -97,8 +134,6 @@ def init_celery(app):
     Returns:
         Celery: Configured Celery application
     """
-    global celery_app
-    
     # Set default configuration
     app.config.setdefault('CELERY_BROKER_URL', 'redis://localhost:6379/0')
     app.config.setdefault('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
@@ -118,8 +153,8 @@ def init_celery(app):
          '[%(task_name)s(%(task_id)s)] %(message)s')
     )
     
-    # Create Celery app
-    celery_app = make_celery(app)
+    # Configure the Celery app the tasks are registered on
+    make_celery(app, celery_app)
     
     # Import tasks to register them with Celery
     from . import email_tasks, scheduled, file_tasks
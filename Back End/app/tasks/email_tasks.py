@@ -1,14 +1,18 @@
 """
 Background tasks for sending emails asynchronously.
 """
+import json
 import logging
+from collections import defaultdict
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List, Union
 
 from flask import current_app
+from sqlalchemy import and_, bindparam, case, func, or_
 from ..extensions import db
 from ..models import EmailQueue, Notification, User, Bid, Job
 from ..utils.email import email_service
+from ..utils.work_queue import claim_batch
 from .celery import celery_app
 
 logger = logging.getLogger(__name__)
@@ -91,8 +95,157 @@ def queue_email(
         logger.error(f"Failed to queue email: {str(e)}")
         raise EmailError(f"Failed to queue email: {str(e)}")
 
-@celery_app.task(bind=True, max_retries=3, default_retry_delay=300)
-def send_queued_email(self, email_id: int) -> bool:
+def claim_queued_emails(batch_size: int = 100, email_id: Optional[int] = None) -> list:
+    """
+    Atomically claim due emails, moving them to 'sending' under a lease.
+    
+    Emails stuck in 'sending' longer than EMAIL_QUEUE_LEASE (their worker
+    died) are claimed again.
+    
+    Args:
+        batch_size: Maximum number of emails to claim
+        email_id: Only claim this email
+        
+    Returns:
+        list: Claimed rows, with their updated attempt counts
+    """
+    now = datetime.utcnow()
+    lease = timedelta(seconds=current_app.config.get('EMAIL_QUEUE_LEASE', 300))
+    queue = EmailQueue.__table__
+    
+    ready = [or_(
+        and_(queue.c.status == 'pending', queue.c.scheduled_at <= now),
+        and_(queue.c.status == 'sending', queue.c.last_attempt_at < now - lease)
+    )]
+    if email_id is not None:
+        ready.append(queue.c.id == email_id)
+    
+    claimed = claim_batch(
+        db.session, queue,
+        ready=ready,
+        # Priorities are stored by name, which does not sort in priority order
+        order_by=[case({'high': 0, 'normal': 1}, value=queue.c.priority, else_=2), queue.c.created_at],
+        batch_size=batch_size,
+        values={'status': 'sending', 'last_attempt_at': now, 'attempts': queue.c.attempts + 1},
+        returning=[
+            queue.c.id, queue.c.subject, queue.c.recipient_email, queue.c.text_body,
+            queue.c.html_body, queue.c.sender_email, queue.c.sender_name, queue.c.attempts,
+            queue.c.template_name, queue.c.context
+        ]
+    )
+    db.session.commit()
+    return claimed
+
+def _retry_at(attempts: int) -> datetime:
+    config = current_app.config
+    delay = min(
+        config.get('EMAIL_RETRY_MAX_DELAY', 3600),
+        config.get('EMAIL_RETRY_BASE_DELAY', 60) * 2 ** (attempts - 1)
+    )
+    return datetime.utcnow() + timedelta(seconds=delay)
+
+def _render_claimed_emails(claimed: list) -> Dict[int, Any]:
+    """
+    Render the templates of claimed emails queued without a body.
+    
+    Emails sharing a template and subject are rendered as one batch.
+    
+    Returns:
+        dict: RenderedEmail, or the rendering error, by email ID
+    """
+    batches = defaultdict(list)
+    for email in claimed:
+        if email.template_name and not (email.text_body or email.html_body):
+            batches[email.template_name, email.subject].append(email)
+    
+    rendered = {}
+    for (template_name, subject), emails in batches.items():
+        try:
+            results = email_service.templates.render_batch(
+                template_name, [email.context or {} for email in emails], subject=subject
+            )
+        except Exception as e:
+            results = [e] * len(emails)
+        rendered.update((email.id, result) for email, result in zip(emails, results))
+    return rendered
+
+def deliver_claimed_emails(claimed: list) -> Dict[str, List[int]]:
+    """
+    Send claimed emails concurrently and record each outcome on its row.
+    
+    Emails queued with a template are rendered here, one batch per template.
+    Failed emails go back to 'pending' with an exponential backoff until
+    EMAIL_QUEUE_MAX_ATTEMPTS is reached, then are marked 'failed'.
+    
+    Args:
+        claimed: Rows returned by claim_queued_emails
+        
+    Returns:
+        dict: IDs of emails that were 'sent', are being 'retried' or 'failed'
+    """
+    outcome = {'sent': [], 'retried': [], 'failed': []}
+    if not claimed:
+        return outcome
+    
+    rendered = _render_claimed_emails(claimed)
+    errors, sending, messages = {}, [], []
+    for email in claimed:
+        body = rendered.get(email.id, email)
+        if isinstance(body, Exception):
+            errors[email.id] = body
+            continue
+        sending.append(email.id)
+        messages.append(email_service.create_message(
+            subject=body.subject,
+            recipients=email.recipient_email,
+            text_body=body.text_body,
+            html_body=body.html_body,
+            sender=email.sender_email,
+            sender_name=email.sender_name
+        ))
+    errors.update(zip(sending, email_service.send_messages(messages)))
+    
+    max_attempts = current_app.config.get('EMAIL_QUEUE_MAX_ATTEMPTS', 5)
+    failures = []
+    for email in claimed:
+        error = errors[email.id]
+        if error is None:
+            outcome['sent'].append(email.id)
+            continue
+        
+        logger.error(f"Error sending email {email.id} (attempt {email.attempts}): {str(error)}")
+        gave_up = email.attempts >= max_attempts
+        outcome['failed' if gave_up else 'retried'].append(email.id)
+        failures.append({
+            'email_id': email.id,
+            'new_status': 'failed' if gave_up else 'pending',
+            'retry_at': None if gave_up else _retry_at(email.attempts),
+            'message': str(error)
+        })
+    
+    # Two statements record the whole batch
+    queue = EmailQueue.__table__
+    if outcome['sent']:
+        db.session.execute(
+            queue.update().where(queue.c.id.in_(outcome['sent'])).values(
+                status='sent', sent_at=datetime.utcnow(), error=None, last_error=None
+            )
+        )
+    if failures:
+        db.session.execute(
+            queue.update().where(queue.c.id == bindparam('email_id')).values(
+                status=bindparam('new_status'),
+                scheduled_at=func.coalesce(bindparam('retry_at'), queue.c.scheduled_at),
+                error=bindparam('message'),
+                last_error=bindparam('message')
+            ),
+            failures
+        )
+    db.session.commit()
+    return outcome
+
+@celery_app.task
+def send_queued_email(email_id: int) -> bool:
     """
     Send a queued email.
     
@@ -103,79 +256,45 @@ def send_queued_email(self, email_id: int) -> bool:
         bool: True if sent successfully, False otherwise
     """
     try:
-        email = EmailQueue.query.get(email_id)
-        if not email:
-            logger.error(f"Email with ID {email_id} not found")
+        claimed = claim_queued_emails(batch_size=1, email_id=email_id)
+        if not claimed:
+            # Already sent, scheduled for later, or being sent by another worker
+            email = EmailQueue.query.get(email_id)
+            if not email:
+                logger.error(f"Email with ID {email_id} not found")
+                return False
+            return email.status == 'sent'
+        
+        if not deliver_claimed_emails(claimed)['sent']:
             return False
-            
-        if email.status == 'sent':
-            logger.info(f"Email {email_id} already sent")
-            return True
-            
-        # Mark as sending
-        email.status = 'sending'
-        email.attempts += 1
-        email.last_attempt_at = datetime.utcnow()
-        db.session.commit()
         
-        # Send the email
-        success = email_service.send_email(
-            subject=email.subject,
-            recipients=[email.recipient_email],
-            text_body=email.text_body,
-            html_body=email.html_body,
-            sender=email.sender_email,
-            sender_name=email.sender_name
-        )
+        email = EmailQueue.query.get(email_id)
+        logger.info(f"Email {email.id} sent successfully to {email.recipient_email}")
+        
+        # Create notification if requested
+        if email.notification_user_id:
+            try:
+                notification = Notification(
+                    user_id=email.notification_user_id,
+                    title=email.notification_title or email.subject,
+                    message=email.notification_message or f"Email sent to {email.recipient_email}",
+                    content=json.dumps({
+                        'email_id': email.id,
+                        'recipient': email.recipient_email,
+                        **email.notification_data
+                    })
+                )
+                db.session.add(notification)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Failed to create notification for email {email.id}: {str(e)}")
+        return True
         
-        if success:
-            email.status = 'sent'
-            email.sent_at = datetime.utcnow()
-            
-            # Create notification if requested
-            if email.notification_user_id:
-                try:
-                    notification = Notification(
-                        user_id=email.notification_user_id,
-                        title=email.notification_title or email.subject,
-                        message=email.notification_message or f"Email sent to {email.recipient_email}",
-                        data={
-                            'email_id': email.id,
-                            'recipient': email.recipient_email,
-                            **email.notification_data
-                        }
-                    )
-                    db.session.add(notification)
-                except Exception as e:
-                    logger.error(f"Failed to create notification for email {email.id}: {str(e)}")
-            
-            db.session.commit()
-            logger.info(f"Email {email.id} sent successfully to {email.recipient_email}")
-            return True
-        else:
-            raise Exception("Email service returned failure")
-            
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error sending email {email_id}: {str(e)}")
-        
-        # Update email status
-        try:
-            if email:
-                email.status = 'failed'
-                email.error = str(e)
-                email.last_error = str(e)
-                email.last_attempt_at = datetime.utcnow()
-                db.session.commit()
-        except:
-            db.session.rollback()
-        
-        # Retry with exponential backoff
-        try:
-            raise self.retry(exc=e, countdown=60 * (2 ** (self.request.retries - 1)))
-        except self.MaxRetriesExceededError:
-            logger.error(f"Max retries exceeded for email {email_id}")
-            return False
+        return False
 
 @celery_app.task
 def send_welcome_email(user_id: int) -> bool:
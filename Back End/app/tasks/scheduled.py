@@ -4,9 +4,21 @@ Scheduled background tasks using Celery Beat.
 import logging
 from datetime import datetime, timedelta
 from celery.schedules import crontab
+from flask import current_app
+from sqlalchemy import func
 from ..extensions import db
-from ..models import Session, Notification, EmailQueue, User
+from ..models import Notification, EmailQueue, User
 from ..utils.email import email_service
+from ..utils.activity import last_active_buffer
+from ..services.notification_counters import reconcile_unread_counts
+from .email_tasks import claim_queued_emails, deliver_claimed_emails
+from ..services.notification_outbox import dispatch_outbox
+from ..services.notification_retention import get_archive, purge_notifications
+from ..services.notification_coalescing import send_notification_digests as queue_notification_digests
+from ..services.attachment_integrity import check_attachment_files
+from ..services.document_index import index_pending_documents
+from ..services.resumable_uploads import expire_upload_sessions
+from ..services.storage_tiering import get_provider, offload_blobs
 
 logger = logging.getLogger(__name__)
 
@@ -15,84 +27,29 @@ def init_scheduled_tasks(celery):
     # This function is called during Celery initialization to set up periodic tasks
     pass
 
-def cleanup_expired_sessions():
-    """Clean up expired user sessions from the database."""
-    try:
-        # Delete sessions that have expired
-        expired = Session.query.filter(
-            Session.expires_at < datetime.utcnow()
-        ).delete(synchronize_session=False)
-        
-        db.session.commit()
-        logger.info(f"Cleaned up {expired} expired sessions")
-        return expired
-    except Exception as e:
-        db.session.rollback()
-        logger.error(f"Error cleaning up expired sessions: {str(e)}")
-        raise
-
 def send_scheduled_emails():
-    """Send emails that are queued for sending."""
+    """
+    Send a batch of queued emails.
+    
+    The batch is claimed atomically (moved to 'sending' under a lease), so any
+    number of workers can run this at once without sending duplicates, and is
+    sent concurrently through the async delivery engine.
+    """
     try:
-        # Get emails that are pending and scheduled to be sent now or earlier
-        pending_emails = EmailQueue.query.filter(
-            EmailQueue.status == 'pending',
-            EmailQueue.scheduled_at <= datetime.utcnow()
-        ).order_by(EmailQueue.priority.desc(), EmailQueue.created_at).limit(100).all()
-        
-        sent_count = 0
-        failed_count = 0
-        
-        for email in pending_emails:
-            try:
-                # Mark as sending
-                email.status = 'sending'
-                email.sent_at = datetime.utcnow()
-                db.session.commit()
-                
-                # Send the email
-                success = email_service.send_email(
-                    subject=email.subject,
-                    recipients=email.recipient_email,
-                    text_body=email.text_body,
-                    html_body=email.html_body,
-                    sender=email.sender_email,
-                    sender_name=email.sender_name
-                )
-                
-                if success:
-                    email.status = 'sent'
-                    email.sent_at = datetime.utcnow()
-                    sent_count += 1
-                else:
-                    email.status = 'failed'
-                    email.error = 'Failed to send email'
-                    failed_count += 1
-                
-                db.session.commit()
-                
-            except Exception as e:
-                db.session.rollback()
-                logger.error(f"Error sending email {email.id}: {str(e)}")
-                
-                # Update email status
-                try:
-                    email.status = 'failed'
-                    email.error = str(e)
-                    db.session.commit()
-                except:
-                    db.session.rollback()
-                
-                failed_count += 1
+        claimed = claim_queued_emails(current_app.config.get('EMAIL_QUEUE_BATCH_SIZE', 100))
+        outcome = deliver_claimed_emails(claimed)
         
+        sent_count = len(outcome['sent'])
+        failed_count = len(outcome['retried']) + len(outcome['failed'])
         logger.info(f"Sent {sent_count} emails, failed: {failed_count}")
         return {
             'sent': sent_count,
             'failed': failed_count,
-            'total': len(pending_emails)
+            'total': len(claimed)
         }
         
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error in send_scheduled_emails: {str(e)}")
         raise
 
@@ -103,24 +60,35 @@ def notify_inactive_users():
         days_inactive = 30  # Notify users inactive for 30+ days
         threshold_date = datetime.utcnow() - timedelta(days=days_inactive)
         
+        # Users who have not been active since last_active was added fall back
+        # to when they signed up
         inactive_users = User.query.filter(
-            User.last_login < threshold_date,
+            func.coalesce(User.last_active, User.created_at) < threshold_date,
             User.is_active == True,
-            ~User.notifications.any(Notification.type == 'inactive_user')
+            ~User.notifications.any(Notification.notification_type == 'inactive_user')
         ).all()
         
+        # Read through the write-behind buffer so users active since the
+        # last flush are not treated as inactive
+        recent = last_active_buffer.pending_for(user.id for user in inactive_users)
+        inactive_users = [
+            user for user in inactive_users
+            if recent.get(user.id, threshold_date) <= threshold_date
+        ]
+        
         notified_count = 0
         
         for user in inactive_users:
             try:
                 # Create notification
+                message = 'You haven\'t logged in for a while. Come back and check out what\'s new!'
                 notification = Notification(
                     user_id=user.id,
-                    type='inactive_user',
+                    notification_type='inactive_user',
                     title='We miss you!',
-                    message='You haven\'t logged in for a while. Come back and check out what\'s new!',
-                    action_url='/app',
-                    is_read=False
+                    message=message,
+                    content=message,
+                    read=False
                 )
                 
                 db.session.add(notification)
@@ -158,32 +126,148 @@ def notify_inactive_users():
         logger.error(f"Error in notify_inactive_users: {str(e)}")
         raise
 
+def flush_last_active():
+    """Write buffered user last-active timestamps to the database."""
+    try:
+        flushed = last_active_buffer.flush()
+        logger.info(f"Flushed last-active timestamps for {flushed} users")
+        return flushed
+    except Exception as e:
+        logger.error(f"Error flushing last-active timestamps: {str(e)}")
+        raise
+
+def reconcile_notification_counters():
+    """Correct drift between unread counters and the notifications table."""
+    try:
+        corrected = reconcile_unread_counts()
+        logger.info(f"Reconciled unread notification counters for {corrected} users")
+        return corrected
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error reconciling unread notification counters: {str(e)}")
+        raise
+
+def _send_outbox_email(recipient, subject, body):
+    if not email_service.send_email(subject=subject, recipients=recipient, text_body=body):
+        raise RuntimeError('Email service failed to send message')
+
+# Outbox channels this app can deliver; there is no SMS provider configured here
+OUTBOX_SENDERS = {'email': _send_outbox_email}
+
+def dispatch_notification_outbox():
+    """Deliver due notification emails from the outbox."""
+    try:
+        results = dispatch_outbox(
+            db.session,
+            OUTBOX_SENDERS,
+            batch_size=current_app.config.get('OUTBOX_BATCH_SIZE', 100),
+            max_attempts=current_app.config.get('OUTBOX_MAX_ATTEMPTS', 5),
+            max_workers=current_app.config.get('OUTBOX_MAX_WORKERS', 8)
+        )
+        if any(results.values()):
+            logger.info(f"Dispatched notification outbox: {results}")
+        return results
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error dispatching notification outbox: {str(e)}")
+        raise
+
+def send_notification_digests():
+    """Queue digests of coalesced notifications on the channels the outbox can deliver."""
+    try:
+        return queue_notification_digests(db.session, Notification, User, channels=tuple(OUTBOX_SENDERS))
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error sending notification digests: {str(e)}")
+        raise
+
 def cleanup_old_notifications():
-    """Clean up old notifications from the database."""
+    """Remove (and optionally archive) old read notifications in small chunks."""
     try:
-        # Delete read notifications older than 90 days
-        threshold_date = datetime.utcnow() - timedelta(days=90)
-        
-        deleted = Notification.query.filter(
-            Notification.is_read == True,
-            Notification.created_at < threshold_date
-        ).delete(synchronize_session=False)
-        
-        db.session.commit()
-        logger.info(f"Cleaned up {deleted} old notifications")
-        return deleted
+        config = current_app.config
+        return purge_notifications(
+            older_than_days=config.get('NOTIFICATION_RETENTION_DAYS', 90),
+            chunk_size=config.get('NOTIFICATION_RETENTION_CHUNK_SIZE', 1000),
+            pause=config.get('NOTIFICATION_RETENTION_PAUSE', 0.1),
+            archive=get_archive(
+                config.get('NOTIFICATION_ARCHIVE_MODE'),
+                config.get('NOTIFICATION_ARCHIVE_PATH')
+            )
+        )
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error cleaning up old notifications: {str(e)}")
         raise
 
+def check_attachment_integrity():
+    """Flag attachments whose stored file is missing and backfill size and MIME type."""
+    try:
+        config = current_app.config
+        return check_attachment_files(
+            db.session,
+            config['UPLOAD_FOLDER'],
+            batch_size=config.get('ATTACHMENT_INTEGRITY_BATCH_SIZE', 500),
+            pause=config.get('ATTACHMENT_INTEGRITY_PAUSE', 0.1)
+        )
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error checking attachment integrity: {str(e)}")
+        raise
+
+def index_documents():
+    """Extract and index the text of newly stored PDFs for document search."""
+    try:
+        config = current_app.config
+        report = index_pending_documents(
+            db.session,
+            config['UPLOAD_FOLDER'],
+            batch_size=config.get('DOCUMENT_INDEX_BATCH_SIZE', 20),
+            max_workers=config.get('DOCUMENT_INDEX_WORKERS')
+        )
+        if any(report.values()):
+            logger.info(f"Indexed documents: {report}")
+        return report
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error indexing documents: {str(e)}")
+        raise
+
+def cleanup_expired_uploads():
+    """Delete resumable upload sessions, and their partial files, that have expired."""
+    try:
+        return expire_upload_sessions(db.session, current_app.config['UPLOAD_FOLDER'])
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error cleaning up expired uploads: {str(e)}")
+        raise
+
+def offload_staged_blobs():
+    """Push uploads staged on local disk to the remote storage provider."""
+    config = current_app.config
+    provider = get_provider(config)
+    if not config.get('STORAGE_OFFLOAD') or provider is None:
+        return None
+    try:
+        results = offload_blobs(
+            db.session,
+            config['UPLOAD_FOLDER'],
+            provider,
+            batch_size=config.get('STORAGE_OFFLOAD_BATCH_SIZE', 20),
+            max_attempts=config.get('STORAGE_OFFLOAD_MAX_ATTEMPTS', 8),
+            base_delay=config.get('STORAGE_OFFLOAD_RETRY_DELAY', 60),
+            max_workers=config.get('STORAGE_OFFLOAD_WORKERS', 4)
+        )
+        if any(results.values()):
+            logger.info(f"Offloaded staged blobs: {results}")
+        return results
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error offloading staged blobs: {str(e)}")
+        raise
+
 # Register tasks with Celery when this module is imported
 from .celery import celery_app
 
-@celery_app.task(name='app.tasks.scheduled.cleanup_expired_sessions')
-def cleanup_expired_sessions_task():
-    return cleanup_expired_sessions()
-
 @celery_app.task(name='app.tasks.scheduled.send_scheduled_emails')
 def send_scheduled_emails_task():
     return send_scheduled_emails()
@@ -192,6 +276,38 @@ def send_scheduled_emails_task():
 def notify_inactive_users_task():
     return notify_inactive_users()
 
+@celery_app.task(name='app.tasks.scheduled.flush_last_active')
+def flush_last_active_task():
+    return flush_last_active()
+
+@celery_app.task(name='app.tasks.scheduled.reconcile_notification_counters')
+def reconcile_notification_counters_task():
+    return reconcile_notification_counters()
+
+@celery_app.task(name='app.tasks.scheduled.dispatch_notification_outbox')
+def dispatch_notification_outbox_task():
+    return dispatch_notification_outbox()
+
+@celery_app.task(name='app.tasks.scheduled.send_notification_digests')
+def send_notification_digests_task():
+    return send_notification_digests()
+
 @celery_app.task(name='app.tasks.scheduled.cleanup_old_notifications')
 def cleanup_old_notifications_task():
     return cleanup_old_notifications()
+
+@celery_app.task(name='app.tasks.scheduled.check_attachment_integrity')
+def check_attachment_integrity_task():
+    return check_attachment_integrity()
+
+@celery_app.task(name='app.tasks.scheduled.index_documents')
+def index_documents_task():
+    return index_documents()
+
+@celery_app.task(name='app.tasks.scheduled.cleanup_expired_uploads')
+def cleanup_expired_uploads_task():
+    return cleanup_expired_uploads()
+
+@celery_app.task(name='app.tasks.scheduled.offload_staged_blobs')
+def offload_staged_blobs_task():
+    return offload_staged_blobs()
@@ -0,0 +1,193 @@
+"""
+Write-behind buffer for user last-active timestamps.
+
+Requests record activity into a Redis hash (or a per-process dict when Redis
+is unavailable) instead of updating the user row, and a periodic task writes
+the buffered timestamps back with one bulk UPDATE.
+"""
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import redis
+from sqlalchemy import bindparam, or_
+
+from .. import extensions
+from ..extensions import db
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'last_active:pending'
+
+# Keep the newest timestamp per user so out-of-order writes never move it back
+RECORD_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if not current or tonumber(current) < tonumber(ARGV[2]) then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+"""
+
+def _to_datetime(timestamp):
+    """Convert an epoch timestamp to the naive UTC datetime stored in the database."""
+    return datetime.fromtimestamp(float(timestamp), timezone.utc).replace(tzinfo=None)
+
+class LastActiveBuffer:
+    """Collects (user_id, timestamp) pairs and flushes them in bulk."""
+
+    def __init__(self, min_interval=60, flush_interval=60, max_tracked=100000):
+        """
+        Initialize the buffer.
+
+        Args:
+            min_interval: Seconds between records for the same user in one worker
+            flush_interval: Seconds between flushes of the in-process fallback buffer
+            max_tracked: Users remembered for min_interval throttling before resetting
+        """
+        self.min_interval = min_interval
+        self.flush_interval = flush_interval
+        self.max_tracked = max_tracked
+        self._recorded = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._script = None
+        self._script_client = None
+        self._next_local_flush = time.monotonic() + flush_interval
+
+    def _record_script(self, client):
+        if self._script_client is not client:
+            self._script = client.register_script(RECORD_SCRIPT)
+            self._script_client = client
+        return self._script
+
+    def record(self, user_id, timestamp=None):
+        """
+        Record that a user was active.
+
+        Args:
+            user_id: The user's ID
+            timestamp: Epoch seconds of the activity (default: now)
+        """
+        timestamp = timestamp if timestamp is not None else time.time()
+
+        with self._lock:
+            last = self._recorded.get(user_id)
+            if last is not None and timestamp - last < self.min_interval:
+                return
+            if len(self._recorded) >= self.max_tracked:
+                self._recorded.clear()
+            self._recorded[user_id] = timestamp
+
+        client = extensions.redis_client
+        if client is not None:
+            try:
+                self._record_script(client)(keys=[PENDING_KEY], args=[user_id, timestamp])
+                return
+            except (redis.RedisError, ConnectionError) as e:
+                logger.warning(f"Failed to buffer last-active in Redis: {str(e)}")
+
+        with self._lock:
+            self._pending[user_id] = max(self._pending.get(user_id, 0), timestamp)
+
+        # Without Redis no other process can see this buffer, so flush it here
+        if time.monotonic() >= self._next_local_flush:
+            self._next_local_flush = time.monotonic() + self.flush_interval
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing last-active buffer: {str(e)}")
+
+    def _drain(self):
+        """Take every buffered timestamp out of Redis and the local buffer."""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+
+        client = extensions.redis_client
+        if client is not None:
+            # Renaming first means records arriving mid-flush go to a fresh hash
+            flushing_key = f'{PENDING_KEY}:flushing:{uuid.uuid4().hex}'
+            try:
+                client.rename(PENDING_KEY, flushing_key)
+            except redis.ResponseError:
+                # Nothing buffered in Redis
+                return pending
+            except (redis.RedisError, ConnectionError) as e:
+                logger.warning(f"Failed to drain last-active buffer from Redis: {str(e)}")
+                return pending
+            
+            for user_id, timestamp in client.hgetall(flushing_key).items():
+                user_id = int(user_id)
+                pending[user_id] = max(pending.get(user_id, 0), float(timestamp))
+            client.delete(flushing_key)
+        return pending
+
+    def _restore(self, pending):
+        """Put timestamps back after a failed flush so the next one retries them."""
+        with self._lock:
+            for user_id, timestamp in pending.items():
+                self._pending[user_id] = max(self._pending.get(user_id, 0), timestamp)
+
+    def flush(self):
+        """
+        Write buffered timestamps to the users table in one bulk UPDATE.
+
+        Returns:
+            int: Number of users whose timestamps were flushed
+        """
+        from ..models import User
+
+        pending = self._drain()
+        if not pending:
+            return 0
+
+        users = User.__table__
+        stmt = users.update().where(
+            users.c.id == bindparam('user_id')
+        ).where(
+            or_(users.c.last_active.is_(None), users.c.last_active < bindparam('last_seen'))
+        ).values(last_active=bindparam('last_seen'))
+
+        try:
+            db.session.execute(stmt, [
+                {'user_id': user_id, 'last_seen': _to_datetime(timestamp)}
+                for user_id, timestamp in pending.items()
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._restore(pending)
+            raise
+
+        return len(pending)
+
+    def pending_for(self, user_ids):
+        """
+        Get buffered, not yet flushed, last-active times.
+
+        Args:
+            user_ids: IDs of the users to look up
+
+        Returns:
+            dict: user_id -> datetime for users with buffered activity
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+
+        with self._lock:
+            pending = {uid: self._pending[uid] for uid in user_ids if uid in self._pending}
+
+        client = extensions.redis_client
+        if client is not None:
+            try:
+                for user_id, timestamp in zip(user_ids, client.hmget(PENDING_KEY, user_ids)):
+                    if timestamp is not None:
+                        pending[user_id] = max(pending.get(user_id, 0), float(timestamp))
+            except (redis.RedisError, ConnectionError) as e:
+                logger.warning(f"Failed to read last-active buffer from Redis: {str(e)}")
+
+        return {user_id: _to_datetime(timestamp) for user_id, timestamp in pending.items()}
+
+last_active_buffer = LastActiveBuffer()
@@ -0,0 +1,199 @@
+"""
+Asyncio email delivery engine.
+
+Each process runs one event loop in a background thread. Messages submitted
+from any thread are sent on that loop over reused aiosmtplib connections,
+with a semaphore capping how many are in flight to the provider at once. A
+single worker process can keep dozens of messages in flight where the
+blocking smtplib path allows one.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from email.message import Message
+from typing import Dict, List, Optional
+
+import aiosmtplib
+
+logger = logging.getLogger(__name__)
+
+class AsyncEmailEngine:
+    """Sends email to one SMTP provider with bounded concurrency."""
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        use_tls: bool = False,
+        start_tls: bool = True,
+        max_concurrency: int = 20,
+        max_messages: int = 100,
+        max_idle: float = 60,
+        timeout: float = 30
+    ):
+        """
+        Initialize the engine.
+
+        Args:
+            hostname: SMTP server host
+            port: SMTP server port
+            username: Login username, if the server requires authentication
+            password: Login password
+            use_tls: Connect over implicit TLS (SMTPS)
+            start_tls: Upgrade plain connections with STARTTLS
+            max_concurrency: Messages in flight to the provider at once
+            max_messages: Messages sent on a connection before it is recycled
+            max_idle: Seconds an idle connection is kept
+            timeout: Seconds before an SMTP command times out
+        """
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.start_tls = start_tls and not use_tls
+        self.max_concurrency = max_concurrency
+        self.max_messages = max_messages
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._semaphore = None
+        self._idle = []
+        self._stats = {'connections': 0, 'sent': 0, 'failed': 0, 'in_flight': 0, 'peak_in_flight': 0}
+
+    def _ensure_loop(self):
+        # Checked per process so forked workers start their own loop
+        pid = os.getpid()
+        if self._pid == pid:
+            return self._loop
+        with self._lock:
+            if self._pid != pid:
+                loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._idle = []
+                thread = threading.Thread(target=loop.run_forever, name='async-email', daemon=True)
+                thread.start()
+                self._loop = loop
+                self._pid = pid
+        return self._loop
+
+    async def _connect(self):
+        client = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username or None,
+            password=self.password or None,
+            use_tls=self.use_tls,
+            start_tls=self.start_tls,
+            timeout=self.timeout
+        )
+        await client.connect()
+        self._stats['connections'] += 1
+        return client
+
+    async def _acquire(self):
+        while self._idle:
+            client, sent, idle_since = self._idle.pop()
+            if client.is_connected and time.monotonic() - idle_since <= self.max_idle:
+                return client, sent
+            await self._discard(client)
+        return await self._connect(), 0
+
+    @staticmethod
+    async def _discard(client):
+        try:
+            await client.quit()
+        except Exception:
+            client.close()
+
+    async def _send(self, msg: Message):
+        async with self._semaphore:
+            self._stats['in_flight'] += 1
+            self._stats['peak_in_flight'] = max(self._stats['peak_in_flight'], self._stats['in_flight'])
+            try:
+                # A reused connection may have been dropped by the server; retry once on a new one
+                for attempt in range(2):
+                    client, sent = await self._acquire()
+                    try:
+                        await client.send_message(msg)
+                    except aiosmtplib.SMTPServerDisconnected:
+                        client.close()
+                        if attempt == 0 and sent:
+                            continue
+                        raise
+                    except Exception:
+                        await self._discard(client)
+                        raise
+
+                    if sent + 1 >= self.max_messages:
+                        await self._discard(client)
+                    else:
+                        self._idle.append((client, sent + 1, time.monotonic()))
+                    self._stats['sent'] += 1
+                    return
+            except Exception:
+                self._stats['failed'] += 1
+                raise
+            finally:
+                self._stats['in_flight'] -= 1
+
+    def submit(self, msg: Message):
+        """
+        Queue a message for delivery without waiting for it.
+
+        Returns:
+            concurrent.futures.Future: Resolves when the message is sent, or
+            raises the delivery error
+        """
+        return asyncio.run_coroutine_threadsafe(self._send(msg), self._ensure_loop())
+
+    def send(self, msg: Message, timeout: Optional[float] = None):
+        """Send a message, blocking until it is delivered; raises on failure."""
+        return self.submit(msg).result(timeout)
+
+    def send_many(self, messages: List[Message], timeout: Optional[float] = None) -> List[Optional[Exception]]:
+        """
+        Send messages concurrently, up to max_concurrency at a time.
+
+        Args:
+            messages: Messages to send
+            timeout: Seconds to wait for each message
+
+        Returns:
+            list: None for each delivered message, or the exception it failed with
+        """
+        futures = [self.submit(msg) for msg in messages]
+        results = []
+        for future in futures:
+            try:
+                future.result(timeout)
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def metrics(self) -> Dict[str, int]:
+        """Get delivery counters, in-flight counts and idle connections."""
+        return dict(self._stats, idle=len(self._idle))
+
+    def close(self):
+        """Close idle connections and stop the event loop."""
+        loop = self._loop
+        if loop is None or self._pid != os.getpid():
+            return
+
+        async def shutdown():
+            idle, self._idle = self._idle, []
+            for client, _, _ in idle:
+                await self._discard(client)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result(self.timeout)
+        loop.call_soon_threadsafe(loop.stop)
+        self._loop = None
+        self._pid = None
@@ -0,0 +1,147 @@
+"""
+File downloads that keep Python workers out of the transfer.
+
+`send_stored_file` answers conditional GETs (ETag/Last-Modified) and
+single-range requests itself. The body is handed to the WSGI server as a
+`wsgi.file_wrapper` over a file positioned at the requested range, so
+servers that support it (gunicorn) copy it to the socket with
+`os.sendfile` instead of reading it through Python. With DOWNLOAD_OFFLOAD
+set, the response carries only an `X-Accel-Redirect` (nginx) or
+`X-Sendfile` (Apache, lighttpd) header once the caller's access check has
+passed, and the front proxy streams the file.
+"""
+import mimetypes
+import os
+import unicodedata
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import quote
+
+from flask import Response, current_app, request
+from werkzeug.datastructures import ContentRange
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
+
+class FileRange:
+    """A read-only view of `length` bytes of a file starting at `start`."""
+
+    def __init__(self, file, start: int, length: int):
+        self.file = file
+        self.remaining = length
+        # Servers using sendfile take the offset from the file position and the count from Content-Length
+        file.seek(start)
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET):
+        return self.file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+def _content_disposition(response, download_name: str, as_attachment: bool):
+    disposition = 'attachment' if as_attachment else 'inline'
+    try:
+        download_name.encode('ascii')
+        response.headers.set('Content-Disposition', disposition, filename=download_name)
+    except UnicodeEncodeError:
+        ascii_name = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        response.headers.set(
+            'Content-Disposition', disposition,
+            filename=ascii_name, **{'filename*': f"UTF-8''{quote(download_name, safe='')}"}
+        )
+
+def _if_range_matches(etag: str, last_modified: datetime) -> bool:
+    if_range = request.if_range
+    if if_range.etag:
+        return if_range.etag == etag
+    if if_range.date:
+        return last_modified <= if_range.date
+    return True
+
+def send_stored_file(
+    path: str,
+    download_name: str,
+    mimetype: Optional[str] = None,
+    etag: Optional[str] = None,
+    internal_path: Optional[str] = None,
+    as_attachment: bool = True
+) -> Response:
+    """
+    Send a file from local storage; call only after the access check.
+
+    Args:
+        path: Filesystem path of the file
+        download_name: File name offered to the client
+        mimetype: Content type (default: guessed from `download_name`)
+        etag: Strong validator for the content, e.g. its SHA-256 (default:
+            derived from the file's size and modification time)
+        internal_path: Path of the file below DOWNLOAD_ACCEL_PREFIX, for
+            X-Accel-Redirect offload
+        as_attachment: Ask the client to save the file rather than display it
+
+    Returns:
+        Response: 200, 206, 304 or 416 response
+
+    Raises:
+        FileNotFoundError: If the file does not exist
+    """
+    config = current_app.config
+    stat = os.stat(path)
+    size = stat.st_size
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+    etag = etag or f'{stat.st_mtime_ns:x}-{size:x}'
+
+    response = Response(mimetype=mimetype or mimetypes.guess_type(download_name)[0] or 'application/octet-stream')
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.accept_ranges = 'bytes'
+    _content_disposition(response, download_name, as_attachment)
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response.status_code = 304
+        return response
+
+    offload = config.get('DOWNLOAD_OFFLOAD')
+    if offload == 'x-accel' and internal_path:
+        # nginx serves the file, ranges included, from an internal location
+        prefix = config.get('DOWNLOAD_ACCEL_PREFIX', '/protected-uploads/')
+        response.headers['X-Accel-Redirect'] = quote(f"{prefix.rstrip('/')}/{internal_path.lstrip('/')}")
+        return response
+    if offload == 'x-sendfile':
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+        return response
+
+    start, length = 0, size
+    byte_range = request.range
+    # Multiple ranges are answered with the whole file, which the spec allows
+    if byte_range and len(byte_range.ranges) == 1 and _if_range_matches(etag, last_modified):
+        bounds = byte_range.range_for_length(size)
+        if bounds is None:
+            response.status_code = 416
+            response.content_range = ContentRange('bytes', None, None, size)
+            return response
+        start, stop = bounds
+        length = stop - start
+        response.status_code = 206
+        response.content_range = ContentRange('bytes', start, stop, size)
+
+    response.content_length = length
+    if request.method == 'HEAD':
+        return response
+    response.response = wrap_file(request.environ, FileRange(open(path, 'rb'), start, length))
+    response.direct_passthrough = True
+    return response
@@ -1,15 +1,157 @@
+import os
 import smtplib
 import ssl
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.utils import formataddr
 from flask import current_app, render_template_string
-from jinja2 import Template
+from jinja2 import TemplateNotFound
 import logging
-from typing import Optional, Dict, Any, List, Union
+from typing import Optional, Dict, Any, List, Union, Callable
+
+from .async_email import AsyncEmailEngine
+from .email_templates import EmailTemplateEngine
 
 logger = logging.getLogger(__name__)
 
+class SMTPConnectionPool:
+    """A pool of authenticated SMTP sessions reused across messages."""
+    
+    def __init__(
+        self,
+        connect: Callable[[], smtplib.SMTP],
+        max_size: int = 4,
+        max_messages: int = 100,
+        max_idle: float = 60,
+        acquire_timeout: float = 30
+    ):
+        """
+        Initialize the pool.
+        
+        Args:
+            connect: Callable that opens and authenticates a new SMTP session
+            max_size: Maximum number of open sessions
+            max_messages: Messages sent on a session before it is recycled
+            max_idle: Seconds an idle session is kept before it is closed
+            acquire_timeout: Seconds to wait for a free session
+        """
+        self.connect = connect
+        self.max_size = max_size
+        self.max_messages = max_messages
+        self.max_idle = max_idle
+        self.acquire_timeout = acquire_timeout
+        self._idle = deque()
+        self._open = 0
+        self._pid = os.getpid()
+        self._condition = threading.Condition()
+        self._stats = {'created': 0, 'reused': 0, 'recycled': 0, 'errors': 0, 'messages': 0}
+    
+    def _check_fork(self):
+        # Sessions inherited from a parent process share its sockets
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle.clear()
+            self._open = 0
+    
+    def _acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._condition:
+            self._check_fork()
+            while True:
+                while self._idle:
+                    server, sent, idle_since = self._idle.pop()
+                    if time.monotonic() - idle_since <= self.max_idle:
+                        self._stats['reused'] += 1
+                        return server, sent
+                    self._open -= 1
+                    self._stats['recycled'] += 1
+                    self._quit(server)
+                if self._open < self.max_size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError('Timed out waiting for an SMTP connection')
+                self._condition.wait(remaining)
+        
+        try:
+            server = self.connect()
+        except Exception:
+            with self._condition:
+                self._open -= 1
+                self._stats['errors'] += 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._stats['created'] += 1
+        return server, 0
+    
+    def _release(self, server, sent, failed):
+        with self._condition:
+            if failed or sent >= self.max_messages:
+                self._open -= 1
+                self._stats['errors' if failed else 'recycled'] += 1
+                discard = True
+            else:
+                self._idle.append((server, sent, time.monotonic()))
+                discard = False
+            self._condition.notify()
+        if discard:
+            self._quit(server)
+    
+    @staticmethod
+    def _quit(server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+    
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a session for one message.
+        
+        Sessions that raise are closed rather than returned to the pool.
+        
+        Yields:
+            smtplib.SMTP: An authenticated SMTP session
+        """
+        server, sent = self._acquire()
+        try:
+            yield server
+        except Exception:
+            self._release(server, sent, failed=True)
+            raise
+        with self._condition:
+            self._stats['messages'] += 1
+        self._release(server, sent + 1, failed=False)
+    
+    def metrics(self) -> Dict[str, int]:
+        """Get pool counters and current open/idle/in-use session counts."""
+        with self._condition:
+            return dict(
+                self._stats,
+                open=self._open,
+                idle=len(self._idle),
+                in_use=self._open - len(self._idle)
+            )
+    
+    def close(self):
+        """Close every idle session."""
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+        for server, _, _ in idle:
+            self._quit(server)
+
 class EmailService:
     """Service for sending emails."""
     
@@ -24,6 +166,9 @@ class EmailService:
         self.smtp_use_ssl = False
         self.default_sender = None
         self.default_sender_name = None
+        self.pool = None
+        self.async_engine = None
+        self.templates = None
         
         if app is not None:
             self.init_app(app)
@@ -44,6 +189,39 @@ class EmailService:
         self.default_sender = app.config.get('MAIL_DEFAULT_SENDER')
         self.default_sender_name = app.config.get('MAIL_DEFAULT_SENDER_NAME', app.name)
         
+        # Authenticated sessions are kept open and shared between messages
+        if self.pool is not None:
+            self.pool.close()
+        self.pool = SMTPConnectionPool(
+            self._connect,
+            max_size=app.config.get('MAIL_POOL_SIZE', 4),
+            max_messages=app.config.get('MAIL_POOL_MAX_MESSAGES', 100),
+            max_idle=app.config.get('MAIL_POOL_MAX_IDLE', 60)
+        )
+        
+        # Bulk and queued sends go through the async engine, many messages in flight at once
+        if self.async_engine is not None:
+            self.async_engine.close()
+        self.async_engine = AsyncEmailEngine(
+            self.smtp_server,
+            self.smtp_port,
+            username=self.smtp_username,
+            password=self.smtp_password,
+            use_tls=self.smtp_use_ssl,
+            start_tls=self.smtp_use_tls,
+            max_concurrency=app.config.get('MAIL_ASYNC_CONCURRENCY', 20),
+            max_messages=app.config.get('MAIL_POOL_MAX_MESSAGES', 100),
+            max_idle=app.config.get('MAIL_POOL_MAX_IDLE', 60)
+        )
+        
+        # Templates are compiled once here rather than on every send
+        self.templates = EmailTemplateEngine(
+            app.config.get('MAIL_TEMPLATE_FOLDER') or os.path.join(app.root_path, 'templates', 'emails'),
+            auto_reload=app.config.get('MAIL_TEMPLATE_AUTO_RELOAD', False),
+            bytecode_cache=app.config.get('MAIL_TEMPLATE_BYTECODE_CACHE')
+        )
+        self.templates.precompile()
+        
         # Add to app.extensions
         if not hasattr(app, 'extensions'):
             app.extensions = {}
@@ -137,9 +315,29 @@ class EmailService:
         
         return msg
     
+    def _connect(self) -> smtplib.SMTP:
+        """Open and authenticate a new SMTP session."""
+        context = ssl.create_default_context()
+        
+        if self.smtp_use_ssl:
+            server = smtplib.SMTP_SSL(
+                self.smtp_server, 
+                self.smtp_port,
+                context=context
+            )
+        else:
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+            if self.smtp_use_tls:
+                server.starttls(context=context)
+        
+        # Login if credentials are provided
+        if self.smtp_username and self.smtp_password:
+            server.login(self.smtp_username, self.smtp_password)
+        return server
+    
     def send_message(self, msg: MIMEMultipart) -> bool:
         """
-        Send an email message.
+        Send an email message over a pooled SMTP session.
         
         Args:
             msg: The email message to send
@@ -150,36 +348,48 @@ class EmailService:
         if not self.smtp_server:
             logger.warning('No SMTP server configured. Email not sent.')
             return False
+        
+        # A pooled session may have been dropped by the server; retry once on a new one
+        for attempt in range(2):
+            try:
+                with self.pool.connection() as server:
+                    server.send_message(msg)
+                
+                logger.info(f'Email sent to {msg["To"]}')
+                return True
+                
+            except smtplib.SMTPServerDisconnected as e:
+                if attempt == 0:
+                    continue
+                logger.error(f'Error sending email: {str(e)}')
+                return False
+            except Exception as e:
+                logger.error(f'Error sending email: {str(e)}')
+                return False
+    
+    def send_messages(self, messages: List[MIMEMultipart]) -> List[Optional[Exception]]:
+        """
+        Send many messages concurrently through the async delivery engine.
+        
+        Args:
+            messages: The email messages to send
             
-        try:
-            # Create secure connection to server
-            context = ssl.create_default_context()
-            
-            if self.smtp_use_ssl:
-                server = smtplib.SMTP_SSL(
-                    self.smtp_server, 
-                    self.smtp_port,
-                    context=context
-                )
-            else:
-                server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-                if self.smtp_use_tls:
-                    server.starttls(context=context)
-            
-            # Login if credentials are provided
-            if self.smtp_username and self.smtp_password:
-                server.login(self.smtp_username, self.smtp_password)
-            
-            # Send email
-            server.send_message(msg)
-            server.quit()
-            
-            logger.info(f'Email sent to {msg["To"]}')
-            return True
-            
-        except Exception as e:
-            logger.error(f'Error sending email: {str(e)}')
-            return False
+        Returns:
+            list: None for each message sent, or the exception it failed with
+        """
+        if not self.smtp_server:
+            logger.warning('No SMTP server configured. Emails not sent.')
+            error = RuntimeError('No SMTP server configured')
+            return [error for _ in messages]
+        
+        results = self.async_engine.send_many(messages)
+        sent = sum(1 for result in results if result is None)
+        logger.info(f'Sent {sent} of {len(messages)} emails')
+        return results
+    
+    def pool_metrics(self) -> Dict[str, int]:
+        """Get SMTP connection pool metrics."""
+        return self.pool.metrics() if self.pool else {}
     
     def send_email(
         self,
@@ -258,47 +468,66 @@ class EmailService:
         Returns:
             bool: True if the email was sent successfully, False otherwise
         """
-        if context is None:
-            context = {}
-            
-        # Load templates
         try:
-            # Try to load text template
-            with open(f'app/templates/emails/{template_name}.txt') as f:
-                text_template = Template(f.read())
-            
-            # Try to load HTML template
-            with open(f'app/templates/emails/{template_name}.html') as f:
-                html_template = Template(f.read())
-                
-            # Render templates
-            text_body = text_template.render(**context)
-            html_body = html_template.render(**context)
-            
-            # Render subject
-            subject_template = Template(subject)
-            rendered_subject = subject_template.render(**context)
-            
-            # Send email
-            return self.send_email(
-                subject=rendered_subject,
-                recipients=recipients,
-                text_body=text_body,
-                html_body=html_body,
-                sender=sender,
-                sender_name=sender_name,
-                cc=cc,
-                bcc=bcc,
-                reply_to=reply_to,
-                attachments=attachments
-            )
-            
-        except FileNotFoundError as e:
+            rendered = self.templates.render(template_name, context, subject=subject)
+        except TemplateNotFound:
             logger.error(f'Email template not found: {template_name}')
             return False
         except Exception as e:
             logger.error(f'Error rendering email template: {str(e)}')
             return False
+        
+        return self.send_email(
+            subject=rendered.subject,
+            recipients=recipients,
+            text_body=rendered.text_body,
+            html_body=rendered.html_body,
+            sender=sender,
+            sender_name=sender_name,
+            cc=cc,
+            bcc=bcc,
+            reply_to=reply_to,
+            attachments=attachments
+        )
+    
+    def send_template_emails(
+        self,
+        template_name: str,
+        subject: str,
+        recipients: List[str],
+        contexts: List[Dict[str, Any]],
+        shared: Optional[Dict[str, Any]] = None,
+        sender: Optional[str] = None,
+        sender_name: Optional[str] = None
+    ) -> List[Optional[Exception]]:
+        """
+        Render a template for many recipients and send the emails concurrently.
+        
+        Args:
+            template_name: Name of the template file (without extension)
+            subject: Email subject (can include template variables)
+            recipients: Recipient of each email
+            contexts: Context variables for each email, matching `recipients`
+            shared: Context variables common to every email
+            sender: Sender email address
+            sender_name: Sender name
+            
+        Returns:
+            list: None for each delivered email, or the exception it failed with
+        """
+        rendered = self.templates.render_batch(template_name, contexts, subject=subject, shared=shared)
+        messages = [
+            self.create_message(
+                subject=email.subject,
+                recipients=recipient,
+                text_body=email.text_body,
+                html_body=email.html_body,
+                sender=sender,
+                sender_name=sender_name
+            )
+            for recipient, email in zip(recipients, rendered)
+        ]
+        return self.send_messages(messages)
 
 # Create a default instance
 email_service = EmailService()
@@ -0,0 +1,162 @@
+"""
+Compiled, cached email template rendering.
+
+Templates under the email template folder are compiled once when the app
+starts and kept for the life of the process, so bulk sends pay only for
+rendering. Templates and subjects that do not depend on the context are
+rendered once and reused as plain strings.
+"""
+import logging
+import os
+from collections import namedtuple
+from typing import Any, Dict, List, Optional
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, TemplateNotFound, meta, select_autoescape
+
+logger = logging.getLogger(__name__)
+
+RenderedEmail = namedtuple('RenderedEmail', ['subject', 'text_body', 'html_body'])
+
+class EmailTemplateEngine:
+    """Renders `<name>.txt` / `<name>.html` email templates from one folder."""
+
+    def __init__(self, folder: str, auto_reload: bool = False, bytecode_cache: Optional[str] = None):
+        """
+        Initialize the engine.
+
+        Args:
+            folder: Directory holding the email templates
+            auto_reload: Recompile templates whose file changed (development only)
+            bytecode_cache: Directory to share compiled bytecode between processes
+        """
+        self.folder = folder
+        self.env = Environment(
+            loader=FileSystemLoader(folder),
+            autoescape=select_autoescape(['html']),
+            auto_reload=auto_reload,
+            cache_size=-1,
+            bytecode_cache=FileSystemBytecodeCache(bytecode_cache) if bytecode_cache else None
+        )
+        self._subject_env = Environment(autoescape=False)
+        self._templates = {}
+        self._static = {}
+        self._subjects = {}
+        self._stats = {'compiled': 0, 'rendered': 0}
+
+    def precompile(self) -> int:
+        """
+        Compile every template in the folder ahead of the first send.
+
+        Returns:
+            int: Number of templates compiled
+        """
+        if not os.path.isdir(self.folder):
+            return 0
+        names = self.env.list_templates(extensions=['txt', 'html'])
+        for name in names:
+            self._load(name)
+        return len(names)
+
+    def _load(self, filename: str):
+        if filename in self._templates:
+            return self._templates[filename]
+        try:
+            source = self.env.loader.get_source(self.env, filename)[0]
+        except TemplateNotFound:
+            if not self.env.auto_reload:
+                self._templates[filename] = None
+            return None
+
+        template = self.env.get_template(filename)
+        if self.env.auto_reload:
+            # Go through Jinja's own cache, which checks the file for changes
+            return template
+        self._stats['compiled'] += 1
+        # A template without variables renders the same for every recipient
+        if not meta.find_undeclared_variables(self.env.parse(source)):
+            self._static[filename] = template.render()
+        self._templates[filename] = template
+        return template
+
+    def _get(self, template_name: str):
+        text = self._load(f'{template_name}.txt')
+        html = self._load(f'{template_name}.html')
+        if text is None and html is None:
+            raise TemplateNotFound(template_name)
+        return text, html
+
+    def _subject(self, subject: Optional[str]):
+        # Subjects without template syntax are used as they are
+        if not subject or ('{{' not in subject and '{%' not in subject):
+            return None
+        template = self._subjects.get(subject)
+        if template is None:
+            template = self._subjects[subject] = self._subject_env.from_string(subject)
+        return template
+
+    def _render(self, template, filename, context):
+        if template is None:
+            return None
+        if filename in self._static:
+            return self._static[filename]
+        return template.render(context)
+
+    def render(self, template_name: str, context: Optional[Dict[str, Any]] = None, subject: Optional[str] = None) -> RenderedEmail:
+        """
+        Render one email.
+
+        Args:
+            template_name: Name of the template (without extension)
+            context: Context variables for the template
+            subject: Email subject (can include template variables)
+
+        Returns:
+            RenderedEmail: Rendered subject, text body and HTML body; a body
+            is None when its template does not exist
+
+        Raises:
+            TemplateNotFound: If neither a .txt nor an .html template exists
+        """
+        return self.render_batch(template_name, [context or {}], subject=subject)[0]
+
+    def render_batch(
+        self,
+        template_name: str,
+        contexts: List[Dict[str, Any]],
+        subject: Optional[str] = None,
+        shared: Optional[Dict[str, Any]] = None
+    ) -> List[RenderedEmail]:
+        """
+        Render the same template for many recipients.
+
+        Args:
+            template_name: Name of the template (without extension)
+            contexts: Context variables for each email
+            subject: Email subject (can include template variables)
+            shared: Context variables common to every email
+
+        Returns:
+            list: RenderedEmail for each context, in order
+
+        Raises:
+            TemplateNotFound: If neither a .txt nor an .html template exists
+        """
+        text, html = self._get(template_name)
+        text_name, html_name = f'{template_name}.txt', f'{template_name}.html'
+        subject_template = self._subject(subject)
+
+        rendered = []
+        for context in contexts:
+            if shared:
+                context = {**shared, **context}
+            rendered.append(RenderedEmail(
+                subject_template.render(context) if subject_template else subject,
+                self._render(text, text_name, context),
+                self._render(html, html_name, context)
+            ))
+        self._stats['rendered'] += len(rendered)
+        return rendered
+
+    def metrics(self) -> Dict[str, int]:
+        """Get counts of compiled templates, static templates and rendered emails."""
+        return dict(self._stats, static=len(self._static))
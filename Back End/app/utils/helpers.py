@@ -1,6 +1,7 @@
 import os
 import uuid
 import re
+import base64
 from werkzeug.utils import secure_filename
 from flask import current_app
 from datetime import datetime
@@ -9,8 +10,12 @@ from functools import wraps
 
 def allowed_file(filename):
     """Check if the file extension is allowed."""
+    allowed = current_app.config['ALLOWED_EXTENSIONS']
+    if isinstance(allowed, dict):
+        # Grouped by kind, as in config.Config
+        allowed = set().union(*allowed.values())
     return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+           filename.rsplit('.', 1)[1].lower() in allowed
 
 def save_uploaded_file(file, subfolder='uploads', prefix=''):
     """
@@ -169,6 +174,20 @@ def get_pagination_params(request):
     except (ValueError, TypeError):
         return 1, 10  # Default values
 
+def encode_cursor(created_at, record_id):
+    """Encode a (created_at, id) keyset position as an opaque URL-safe cursor"""
+    payload = json.dumps([created_at.isoformat(), record_id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor, raising ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, record_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(record_id)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
 def generate_slug(text):
     """Generate a URL-friendly slug from a string"""
     if not text:
@@ -0,0 +1,164 @@
+"""
+JWT revocation blocklist with a per-worker Bloom filter in front of Redis.
+
+Revoked JTIs live in Redis under ``jwt_blocklist:{jti}`` as before. Each worker
+keeps a Bloom filter of those JTIs, rebuilt from the keys at startup and kept
+current through a Redis pub/sub channel, so only filter hits (real revocations
+and rare false positives) cost a Redis round trip.
+"""
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+BLOCKLIST_PREFIX = 'jwt_blocklist:'
+BLOCKLIST_CHANNEL = 'jwt_blocklist:revoked'
+
+class BloomFilter:
+    """A fixed-size Bloom filter backed by a bytearray."""
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        """
+        Initialize the filter.
+
+        Args:
+            capacity: Expected number of items
+            error_rate: Target false-positive rate at capacity
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: two 64-bit halves of one digest give every probe
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        """Add an item to the filter."""
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class TokenBlocklist:
+    """Redis JWT blocklist fronted by a Bloom filter synced over pub/sub."""
+
+    def __init__(self, redis_client, capacity=100000, error_rate=0.001,
+                 rebuild_interval=3600, retry_interval=5):
+        """
+        Initialize the blocklist.
+
+        Args:
+            redis_client: A Redis client instance
+            capacity: Expected number of live revoked tokens
+            error_rate: Target false-positive rate of the filter
+            rebuild_interval: Seconds between rebuilds that drop expired JTIs
+            retry_interval: Seconds to wait before resubscribing after a Redis error
+        """
+        self.redis = redis_client
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.retry_interval = retry_interval
+        self._filter = BloomFilter(capacity, error_rate)
+        self._lock = threading.Lock()
+        # Until the filter has been built and the subscription is live, every
+        # check goes to Redis so no revocation can be missed
+        self._synced = False
+        self._next_rebuild = 0
+        self._listener_pid = None
+
+    def rebuild(self):
+        """Rebuild the filter from the blocklist keys currently in Redis."""
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        for key in self.redis.scan_iter(match=f'{BLOCKLIST_PREFIX}*', count=1000):
+            jti = key[len(BLOCKLIST_PREFIX):]
+            if jti:
+                bloom.add(jti)
+
+        with self._lock:
+            self._filter = bloom
+        self._next_rebuild = time.monotonic() + self.rebuild_interval
+        self._synced = True
+        logger.info(f"Rebuilt JWT blocklist filter with {bloom.count} revoked tokens")
+
+    def _add_local(self, jti):
+        with self._lock:
+            self._filter.add(jti)
+            overfull = self._filter.count > self.capacity
+        # Past capacity the false-positive rate climbs; rebuilding drops the
+        # JTIs whose keys have already expired
+        if overfull:
+            self._next_rebuild = 0
+
+    def revoke(self, jti, expires_delta=timedelta(hours=24)):
+        """
+        Revoke a token and notify every worker.
+
+        Args:
+            jti: The token's unique identifier
+            expires_delta: How long the revocation is kept
+        """
+        self.redis.set(f'{BLOCKLIST_PREFIX}{jti}', 'true', ex=expires_delta)
+        self.redis.publish(BLOCKLIST_CHANNEL, jti)
+        self._add_local(jti)
+
+    def is_revoked(self, jti):
+        """Check whether a token has been revoked, touching Redis only on filter hits."""
+        self.ensure_listening()
+        if self._synced and jti not in self._filter:
+            return False
+        return self.redis.get(f'{BLOCKLIST_PREFIX}{jti}') is not None
+
+    def ensure_listening(self):
+        """Start the pub/sub listener in this process if it is not already running."""
+        # Checked per process so forked workers start their own listener
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._lock:
+            if self._listener_pid == pid:
+                return
+            self._synced = False
+            self._listener_pid = pid
+            thread = threading.Thread(target=self._listen, name='jwt-blocklist-listener', daemon=True)
+            thread.start()
+
+    def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                pubsub.subscribe(BLOCKLIST_CHANNEL)
+                # Wait for the subscription to be confirmed before scanning, so
+                # revocations published during the rebuild are still delivered
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message['type'] == 'subscribe':
+                        break
+                self.rebuild()
+
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message['type'] == 'message':
+                        self._add_local(message['data'])
+                    if time.monotonic() >= self._next_rebuild:
+                        self.rebuild()
+            except Exception as e:
+                self._synced = False
+                logger.warning(f"JWT blocklist subscription lost: {str(e)}. Retrying in {self.retry_interval}s")
+                time.sleep(self.retry_interval)
+            finally:
+                pubsub.close()
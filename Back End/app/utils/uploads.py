@@ -0,0 +1,132 @@
+"""
+Streaming upload handling.
+
+Uploads are copied from the request stream to a temporary file in fixed-size
+chunks. Size and SHA-256 are computed during the copy, the MIME type is
+sniffed from the first bytes only, and the copy stops as soon as the size
+limit is exceeded. The finished file is then renamed into place atomically,
+so a worker never holds more than one chunk of an upload in memory and
+readers never see a partial file.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+from collections import namedtuple
+from typing import BinaryIO, Optional
+
+import magic
+
+from .storage import FileTooLargeError, StorageError
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+SNIFF_SIZE = 2048
+
+# Uploads in progress, kept inside the upload folder so the final rename stays on one filesystem
+INCOMING_FOLDER = '.incoming'
+
+# Sniffed types too vague to trust over the file extension (e.g. .docx and .xlsx are zip archives)
+GENERIC_MIME_TYPES = {'application/octet-stream', 'application/zip', 'text/plain', 'application/x-empty'}
+
+ReceivedUpload = namedtuple('ReceivedUpload', ['path', 'size', 'sha256', 'mime_type'])
+
+def sniff_mime_type(head: bytes, filename: str = '') -> str:
+    """
+    Detect a MIME type from the first bytes of a file.
+
+    Args:
+        head: Leading bytes of the file
+        filename: File name, used when the content alone is ambiguous
+
+    Returns:
+        str: Detected MIME type
+    """
+    detected = magic.from_buffer(head, mime=True) if head else 'application/x-empty'
+    if detected in GENERIC_MIME_TYPES:
+        guessed = mimetypes.guess_type(filename)[0]
+        if guessed:
+            return guessed
+    return detected or 'application/octet-stream'
+
+def receive_upload(
+    stream: BinaryIO,
+    temp_dir: str,
+    max_size: int,
+    filename: str = '',
+    chunk_size: int = CHUNK_SIZE
+) -> ReceivedUpload:
+    """
+    Copy an upload stream to a temporary file.
+
+    Args:
+        stream: Readable binary stream, e.g. `FileStorage.stream`
+        temp_dir: Directory for the temporary file; keep it on the same
+            filesystem as the final location so the rename is atomic
+        max_size: Maximum size in bytes
+        filename: Original file name, used to refine the MIME type
+        chunk_size: Bytes read from the stream at a time
+
+    Returns:
+        ReceivedUpload: Temporary file path, size, SHA-256 hex digest and MIME type
+
+    Raises:
+        FileTooLargeError: As soon as more than `max_size` bytes are read
+        StorageError: If the temporary file cannot be written
+    """
+    os.makedirs(temp_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix='.part')
+    sha256 = hashlib.sha256()
+    size = 0
+    head = b''
+
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(f"File size exceeds maximum allowed size of {max_size} bytes")
+                if len(head) < SNIFF_SIZE:
+                    head += chunk[:SNIFF_SIZE - len(head)]
+                sha256.update(chunk)
+                out.write(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+    except FileTooLargeError:
+        _remove(temp_path)
+        raise
+    except Exception as e:
+        _remove(temp_path)
+        logger.error(f"Error receiving upload: {str(e)}")
+        raise StorageError(f"Failed to receive file: {str(e)}")
+
+    return ReceivedUpload(temp_path, size, sha256.hexdigest(), sniff_mime_type(head, filename))
+
+def commit_upload(upload: ReceivedUpload, destination: str) -> ReceivedUpload:
+    """
+    Atomically move a received upload to its final path.
+
+    Returns:
+        ReceivedUpload: The upload, with `path` set to `destination`
+    """
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    os.replace(upload.path, destination)
+    return upload._replace(path=destination)
+
+def discard_upload(upload: Optional[ReceivedUpload]):
+    """Delete a received upload that will not be committed."""
+    if upload is not None:
+        _remove(upload.path)
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error(f"Error removing temporary upload {path}: {str(e)}")
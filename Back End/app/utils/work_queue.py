@@ -0,0 +1,77 @@
+"""
+Helpers for database-backed work queues drained by several workers.
+
+A batch is claimed with one atomic statement,
+
+    UPDATE queue SET <claim> WHERE id IN (
+        SELECT id FROM queue WHERE <ready> ORDER BY ... LIMIT n
+        FOR UPDATE SKIP LOCKED
+    ) RETURNING ...
+
+so concurrent workers on Postgres take disjoint batches without waiting on
+each other's row locks. SQLite omits the locking clause but serializes
+writers, which makes the UPDATE atomic there too. Claimed items are then
+processed concurrently on a bounded thread pool.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select, update
+
+logger = logging.getLogger(__name__)
+
+def claim_batch(session, queue, ready, order_by, batch_size, values, returning):
+    """
+    Atomically claim up to `batch_size` ready rows of a queue table.
+
+    The caller commits to release the row locks once the claim is recorded.
+
+    Args:
+        session: SQLAlchemy session to execute in
+        queue: The queue Table (or table clause), with an `id` column
+        ready: List of conditions a row must meet to be claimed
+        order_by: Columns that decide which ready rows are claimed first
+        batch_size: Maximum number of rows to claim
+        values: Column values that mark a row as claimed
+        returning: Columns to return for each claimed row
+
+    Returns:
+        list: Claimed rows, in `id` order
+    """
+    candidates = select(queue.c.id).where(*ready).order_by(*order_by).limit(batch_size).with_for_update(skip_locked=True)
+    rows = session.execute(
+        update(queue).where(queue.c.id.in_(candidates)).values(**values).returning(*returning)
+        .execution_options(synchronize_session=False)
+    ).all()
+    return sorted(rows, key=lambda row: row.id)
+
+def run_concurrently(items, handler, max_workers=8):
+    """
+    Call `handler(item)` for every item on a bounded thread pool.
+
+    Args:
+        items: Work items
+        handler: Callable run for each item; raising marks the item failed
+        max_workers: Maximum number of concurrent calls
+
+    Returns:
+        tuple: (succeeded items, list of (failed item, exception))
+    """
+    succeeded, failed = [], []
+    if not items:
+        return succeeded, failed
+
+    def run(item):
+        try:
+            handler(item)
+            return item, None
+        except Exception as e:
+            return item, e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        for item, error in executor.map(run, items):
+            if error is None:
+                succeeded.append(item)
+            else:
+                failed.append((item, error))
+    return succeeded, failed
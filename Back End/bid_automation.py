@@ -6,6 +6,7 @@ from sqlalchemy import and_
 from flask import current_app
 from app.extensions import db
 from app.models import Job, Bid, Notification, JobStatus, BidStatus, User, UserRole
+from app.services.notification_coalescing import notify_coalesced
 import threading
 
 class BidAutomation:
@@ -269,6 +270,7 @@ class BidAutomation:
         with app.app_context():
             try:
                 admins = User.query.filter_by(role=UserRole.ADMIN).all()
+                window = current_app.config.get('NOTIFICATION_COALESCE_WINDOW', 600)
                 
                 for admin in admins:
                     message = (
@@ -277,19 +279,24 @@ class BidAutomation:
                         f"Please review manually."
                     )
                     
-                    notification = Notification(
-                        user_id=admin.id,
-                        title="Manual Review Required",
-                        message=message,
-                        notification_type="admin_action_required",
+                    # Repeated reviews of the same project merge into one notification
+                    notify_coalesced(
+                        db.session, Notification, admin.id, "admin_action_required", f"manual_review:{project.id}",
+                        "Manual Review Required", message,
+                        aggregate=lambda count: (
+                            "Manual Review Required",
+                            f"Project '{project.title}' has bids but none meet the minimum score "
+                            f"after {count} evaluations. Best bid score: {best_score:.1f}/100. "
+                            f"Please review manually."
+                        ),
                         content=json.dumps({
                             "project_id": project.id,
                             "best_bid_id": best_bid.id if best_bid else None,
                             "best_score": best_score,
                             "action_required": "manual_review"
-                        })
+                        }),
+                        window=window
                     )
-                    db.session.add(notification)
                 
                 db.session.commit()
                 app.logger.info(f"Notified admin about project {project.id} needing manual review")
@@ -13,6 +13,16 @@ class Config:
     # File upload configuration
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    UPLOAD_CHUNK_SIZE = 64 * 1024  # Bytes copied from an upload stream to disk at a time
+    DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD')  # None, 'x-accel' (nginx) or 'x-sendfile'
+    DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/protected-uploads/')  # internal nginx location for UPLOAD_FOLDER
+    PROJECT_UPLOAD_WORKERS = 4  # Documents of a new project written to storage concurrently
+    RESUMABLE_UPLOAD_MAX_SIZE = 1024 * 1024 * 1024  # Largest file accepted through resumable upload sessions
+    RESUMABLE_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Bytes per chunk; keep below MAX_CONTENT_LENGTH
+    RESUMABLE_UPLOAD_TTL = 86400  # Seconds an upload session stays open after its last chunk
+    IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', 2))  # Processes rendering image variants per worker
+    IMAGE_VARIANT_QUALITY = 80  # WebP/JPEG encoder quality for image variants
+    IMAGE_VARIANT_TIMEOUT = 30  # Seconds a request waits for a variant to render
     ALLOWED_EXTENSIONS = {
         'images': {'jpg', 'jpeg', 'png', 'gif', 'webp'},
         'documents': {'pdf', 'doc', 'docx', 'txt', 'rtf'},
@@ -29,10 +39,66 @@ class Config:
     # Redis configuration
     REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
     JWT_BLOCKLIST_ENABLED = True  # Enable Redis-based JWT blacklist when Redis is available
+    JWT_BLOCKLIST_FILTER_CAPACITY = 100000  # Revoked tokens the per-worker Bloom filter is sized for
+    JWT_BLOCKLIST_FILTER_ERROR_RATE = 0.001
+    
+    # SMTP connection pool
+    MAIL_POOL_SIZE = 4  # Authenticated SMTP sessions kept open per process
+    MAIL_POOL_MAX_MESSAGES = 100  # Messages sent on a session before it is recycled
+    MAIL_POOL_MAX_IDLE = 60  # Seconds an idle session is kept
+    MAIL_ASYNC_CONCURRENCY = 20  # Messages in flight per process through the async delivery engine
+    
+    # Email templates, compiled once at startup
+    MAIL_TEMPLATE_FOLDER = None  # Defaults to app/templates/emails
+    MAIL_TEMPLATE_AUTO_RELOAD = False  # Recompile templates when their file changes
+    MAIL_TEMPLATE_BYTECODE_CACHE = os.environ.get('MAIL_TEMPLATE_BYTECODE_CACHE')  # Directory shared by workers
+    
+    # Notification stream (Server-Sent Events) configuration
+    SSE_MAX_CONNECTIONS_PER_WORKER = int(os.environ.get('SSE_MAX_CONNECTIONS_PER_WORKER', 100))
+    SSE_HEARTBEAT_INTERVAL = 15  # Seconds between keep-alive comments on idle streams
+    SSE_POLL_INTERVAL = 5  # Seconds between database polls when Redis is unavailable
     
     # Celery configuration
     CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
     CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
+    LAST_ACTIVE_FLUSH_INTERVAL = 60  # Seconds between bulk writes of buffered last-active timestamps
+    OUTBOX_DISPATCH_INTERVAL = 10  # Seconds between notification outbox dispatch runs
+    OUTBOX_BATCH_SIZE = 100
+    OUTBOX_MAX_ATTEMPTS = 5  # Deliveries are marked failed after this many attempts
+    OUTBOX_MAX_WORKERS = 8  # Outbox messages sent concurrently per dispatcher
+    EMAIL_QUEUE_BATCH_SIZE = 100  # Queued emails claimed per send_scheduled_emails run
+    EMAIL_QUEUE_MAX_ATTEMPTS = 5  # Queued emails are marked failed after this many attempts
+    EMAIL_RETRY_BASE_DELAY = 60  # Seconds before the first retry of a queued email; doubles per attempt
+    EMAIL_RETRY_MAX_DELAY = 3600
+    EMAIL_QUEUE_LEASE = 300  # Seconds before an email stuck in 'sending' is reclaimed
+    
+    # Notification coalescing
+    NOTIFICATION_COALESCE_WINDOW = 600  # Seconds during which same-group notifications are merged
+    NOTIFICATION_DIGEST_INTERVAL = 900  # Seconds between email/SMS digests of coalesced notifications
+    
+    # Notification retention
+    NOTIFICATION_RETENTION_DAYS = 90  # Read notifications older than this are removed
+    NOTIFICATION_RETENTION_CHUNK_SIZE = 1000  # Rows deleted per transaction
+    NOTIFICATION_RETENTION_PAUSE = 0.1  # Seconds between chunks
+    NOTIFICATION_ARCHIVE_MODE = os.environ.get('NOTIFICATION_ARCHIVE_MODE')  # 'table', 'jsonl' or unset
+    NOTIFICATION_ARCHIVE_PATH = os.environ.get('NOTIFICATION_ARCHIVE_PATH')  # gzipped JSONL file for 'jsonl'
+    
+    # Attachment integrity check
+    ATTACHMENT_INTEGRITY_INTERVAL = 21600  # Seconds between checks for missing attachment files
+    ATTACHMENT_INTEGRITY_BATCH_SIZE = 500  # Attachments checked per transaction
+    ATTACHMENT_INTEGRITY_PAUSE = 0.1  # Seconds between batches
+    
+    # Orphaned file reconciliation
+    ORPHAN_RECONCILE_INTERVAL = 86400  # Seconds between runs quarantining unreferenced files in UPLOAD_FOLDER
+    ORPHAN_MIN_AGE = 3600  # Seconds a file must have existed before it is treated as an orphan
+    ORPHAN_QUARANTINE_DAYS = 7  # Days quarantined files are kept before deletion
+    ORPHAN_RECONCILE_BATCH_SIZE = 1000  # Hashes and paths read per query, and files between checkpoints
+    ORPHAN_REPORT_FOLDER = os.environ.get('ORPHAN_REPORT_FOLDER')  # JSONL reports and checkpoint; default UPLOAD_FOLDER/.reconcile
+    
+    # Document text search
+    DOCUMENT_INDEX_INTERVAL = 60  # Seconds between runs indexing newly stored PDFs
+    DOCUMENT_INDEX_BATCH_SIZE = 20  # PDFs indexed per run
+    DOCUMENT_INDEX_WORKERS = int(os.environ.get('DOCUMENT_INDEX_WORKERS', 0)) or None  # Extraction processes; default one per CPU
     
     # Google OAuth and Places API configuration
     GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID')
@@ -55,9 +121,18 @@ class Config:
     CLOUDINARY_API_KEY = os.environ.get('CLOUDINARY_API_KEY')
     CLOUDINARY_API_SECRET = os.environ.get('CLOUDINARY_API_SECRET')
     CLOUDINARY_URL = os.environ.get('CLOUDINARY_URL')
+    CLOUDINARY_LARGE_FILE_SIZE = 100 * 1024 * 1024  # Files above this are uploaded in chunks
     
     # Storage configuration
-    STORAGE_PROVIDER = os.environ.get('STORAGE_PROVIDER', 'local')  # 'local' or 'cloudinary'
+    STORAGE_PROVIDER = os.environ.get('STORAGE_PROVIDER', 'local')  # 'local', 'cloudinary' or 'filesystem' (offload only)
+    STORAGE_OFFLOAD = os.environ.get('STORAGE_OFFLOAD', 'false').lower() == 'true'  # Stage uploads locally and push them to STORAGE_PROVIDER in the background
+    STORAGE_OFFLOAD_INTERVAL = 30  # Seconds between offload runs
+    STORAGE_OFFLOAD_BATCH_SIZE = 20  # Staged blobs pushed per run
+    STORAGE_OFFLOAD_WORKERS = 4  # Blobs pushed concurrently
+    STORAGE_OFFLOAD_MAX_ATTEMPTS = 8  # Blobs stay local after this many failed pushes
+    STORAGE_OFFLOAD_RETRY_DELAY = 60  # Seconds before the first retry of a failed push; doubles per attempt
+    REMOTE_STORAGE_ROOT = os.environ.get('REMOTE_STORAGE_ROOT')  # Directory of the 'filesystem' provider
+    REMOTE_STORAGE_URL = os.environ.get('REMOTE_STORAGE_URL')  # URL prefix the 'filesystem' provider's directory is served under
     
     @staticmethod
     def init_app(app):
@@ -65,6 +140,7 @@ class Config:
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    MAIL_TEMPLATE_AUTO_RELOAD = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL') or \
         'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data-dev.sqlite')
 
@@ -93,6 +93,40 @@ def db_session(db):
     connection.close()
     db.session = old_session
 
+@pytest.fixture
+def make_user(app):
+    """
+    Create users committed outside the transactional fixtures, for code
+    under test that commits on its own.
+    
+    Yields a factory taking an email, a role and any other User fields, inside
+    an app context. The users are deleted after the test, once the fixtures
+    built on this one have removed their own rows.
+    """
+    with app.app_context():
+        created = []
+        
+        def make(email, role=UserRole.CUSTOMER, **fields):
+            fields.setdefault('name', email.split('@')[0])
+            fields.setdefault('location', 'Nairobi')
+            user = User(email=email, _password='x', role=role, **fields)
+            _db.session.add(user)
+            _db.session.commit()
+            created.append(user.id)
+            return user
+        
+        yield make
+        
+        _db.session.rollback()
+        User.query.filter(User.id.in_(created)).delete(synchronize_session=False)
+        _db.session.commit()
+
+@pytest.fixture
+def upload_folder(app, tmp_path, monkeypatch):
+    """Point UPLOAD_FOLDER at a temporary directory for the test."""
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    return tmp_path
+
 @pytest.fixture
 def test_customer(db_session):
    
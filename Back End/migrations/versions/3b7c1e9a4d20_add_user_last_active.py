@@ -0,0 +1,28 @@
+"""Add users.last_active
+
+Revision ID: 3b7c1e9a4d20
+Revises: 01577dbde027
+Create Date: 2026-10-19 09:12:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7c1e9a4d20'
+down_revision = '01577dbde027'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_active', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_users_last_active'), ['last_active'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_last_active'))
+        batch_op.drop_column('last_active')
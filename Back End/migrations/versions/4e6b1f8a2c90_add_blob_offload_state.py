@@ -0,0 +1,30 @@
+"""Add remote offload state to blobs
+
+Revision ID: 4e6b1f8a2c90
+Revises: 7b2e94c1d8a6
+Create Date: 2026-10-19 22:41:17.904532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e6b1f8a2c90'
+down_revision = '7b2e94c1d8a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('offload_attempts', sa.Integer(), nullable=False, server_default='0', comment='Failed pushes of the staged copy to remote storage'))
+        batch_op.add_column(sa.Column('offload_next_at', sa.DateTime(), nullable=True, comment='When the staged copy may next be pushed to remote storage'))
+        batch_op.add_column(sa.Column('offload_error', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.drop_column('offload_error')
+        batch_op.drop_column('offload_next_at')
+        batch_op.drop_column('offload_attempts')
@@ -0,0 +1,45 @@
+"""Add content-addressed blobs
+
+Revision ID: 5f1c9d3a7b82
+Revises: e2b86d4f0a37
+Create Date: 2026-10-19 19:12:08.604317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f1c9d3a7b82'
+down_revision = 'e2b86d4f0a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('blobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('mime_type', sa.String(length=100), nullable=True),
+    sa.Column('storage_key', sa.String(length=255), nullable=False, comment='Cloudinary public_id or local file path'),
+    sa.Column('public_url', sa.String(length=512), nullable=True),
+    sa.Column('ref_count', sa.Integer(), nullable=False, comment='Attachments referencing this blob'),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('sha256')
+    )
+    with op.batch_alter_table('attachments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('blob_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_attachments_blob_id'), ['blob_id'], unique=False)
+        batch_op.create_foreign_key('fk_attachments_blob_id_blobs', 'blobs', ['blob_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('attachments', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_attachments_blob_id_blobs', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_attachments_blob_id'))
+        batch_op.drop_column('blob_id')
+
+    op.drop_table('blobs')
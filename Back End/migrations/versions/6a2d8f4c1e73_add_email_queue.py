@@ -0,0 +1,53 @@
+"""Add email queue
+
+Revision ID: 6a2d8f4c1e73
+Revises: 4e6b1f8a2c90
+Create Date: 2026-10-19 23:52:08.216743
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a2d8f4c1e73'
+down_revision = '4e6b1f8a2c90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('email_queue',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('subject', sa.String(length=255), nullable=False),
+    sa.Column('recipient_email', sa.String(length=255), nullable=False),
+    sa.Column('recipient_name', sa.String(length=100), nullable=True),
+    sa.Column('sender_email', sa.String(length=255), nullable=True),
+    sa.Column('sender_name', sa.String(length=100), nullable=True),
+    sa.Column('template_name', sa.String(length=100), nullable=True),
+    sa.Column('context', sa.JSON(), nullable=True),
+    sa.Column('text_body', sa.Text(), nullable=True),
+    sa.Column('html_body', sa.Text(), nullable=True),
+    sa.Column('priority', sa.String(length=10), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('scheduled_at', sa.DateTime(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_attempt_at', sa.DateTime(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.Column('notification_user_id', sa.Integer(), nullable=True),
+    sa.Column('notification_title', sa.String(length=200), nullable=True),
+    sa.Column('notification_message', sa.Text(), nullable=True),
+    sa.Column('notification_data', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['notification_user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_email_queue_status_scheduled', 'email_queue', ['status', 'scheduled_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_email_queue_status_scheduled', table_name='email_queue')
+    op.drop_table('email_queue')
@@ -0,0 +1,36 @@
+"""Add notification inbox indexes
+
+Revision ID: 8e4f2a61c9b3
+Revises: 3b7c1e9a4d20
+Create Date: 2026-10-19 10:02:17.540931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4f2a61c9b3'
+down_revision = '3b7c1e9a4d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_notifications_user_read_created',
+        'notifications',
+        ['user_id', 'read', sa.text('created_at DESC'), 'id'],
+        unique=False
+    )
+    op.create_index(
+        'ix_notifications_user_created',
+        'notifications',
+        ['user_id', sa.text('created_at DESC'), 'id'],
+        unique=False
+    )
+
+
+def downgrade():
+    op.drop_index('ix_notifications_user_created', table_name='notifications')
+    op.drop_index('ix_notifications_user_read_created', table_name='notifications')
@@ -0,0 +1,28 @@
+"""Add attachment listing index and missing-file flag
+
+Revision ID: 9c4e7a2d51f3
+Revises: 5f1c9d3a7b82
+Create Date: 2026-10-19 20:03:47.915526
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e7a2d51f3'
+down_revision = '5f1c9d3a7b82'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('attachments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('missing_at', sa.DateTime(), nullable=True, comment='When the integrity check last found the stored file missing'))
+        batch_op.create_index('ix_attachments_job_created', ['job_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('attachments', schema=None) as batch_op:
+        batch_op.drop_index('ix_attachments_job_created')
+        batch_op.drop_column('missing_at')
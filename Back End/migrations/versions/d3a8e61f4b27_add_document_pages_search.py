@@ -0,0 +1,67 @@
+"""Add document pages with a full-text search index
+
+Revision ID: d3a8e61f4b27
+Revises: 9c4e7a2d51f3
+Create Date: 2026-10-19 21:12:05.380214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a8e61f4b27'
+down_revision = '9c4e7a2d51f3'
+branch_labels = None
+depends_on = None
+
+
+SEARCH_INDEX = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE document_pages_fts USING fts5("
+        "text, content='document_pages', content_rowid='id', tokenize='porter unicode61')",
+        "CREATE TRIGGER document_pages_fts_insert AFTER INSERT ON document_pages BEGIN "
+        "INSERT INTO document_pages_fts(rowid, text) VALUES (new.id, new.text); END",
+        "CREATE TRIGGER document_pages_fts_delete AFTER DELETE ON document_pages BEGIN "
+        "INSERT INTO document_pages_fts(document_pages_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+        "CREATE TRIGGER document_pages_fts_update AFTER UPDATE OF text ON document_pages BEGIN "
+        "INSERT INTO document_pages_fts(document_pages_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+        "INSERT INTO document_pages_fts(rowid, text) VALUES (new.id, new.text); END",
+    ],
+    'postgresql': [
+        "ALTER TABLE document_pages ADD COLUMN search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', text)) STORED",
+        "CREATE INDEX ix_document_pages_search_vector ON document_pages USING gin (search_vector)",
+    ],
+}
+
+
+def upgrade():
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('page_count', sa.Integer(), nullable=True, comment='Pages of a PDF, set once its text is being indexed'))
+        batch_op.add_column(sa.Column('text_indexed_at', sa.DateTime(), nullable=True, comment='When every page of the text was indexed'))
+
+    op.create_table('document_pages',
+    sa.Column('blob_id', sa.Integer(), nullable=False),
+    sa.Column('page_number', sa.Integer(), nullable=False, comment='1-based'),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['blob_id'], ['blobs.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('blob_id', 'page_number', name='uq_document_pages_blob_page')
+    )
+
+    for statement in SEARCH_INDEX.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS document_pages_fts')
+    op.drop_table('document_pages')
+
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.drop_column('text_indexed_at')
+        batch_op.drop_column('page_count')
@@ -0,0 +1,34 @@
+"""Add notification coalescing columns
+
+Revision ID: e2b86d4f0a37
+Revises: a7f3c28e5b14
+Create Date: 2026-10-19 17:31:56.207148
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b86d4f0a37'
+down_revision = 'a7f3c28e5b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('group_key', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('group_count', sa.Integer(), server_default='1', nullable=False))
+        batch_op.add_column(sa.Column('digest_pending', sa.Boolean(), server_default=sa.false(), nullable=False))
+        batch_op.create_index(batch_op.f('ix_notifications_digest_pending'), ['digest_pending'], unique=False)
+        batch_op.create_index('ix_notifications_user_group', ['user_id', 'group_key', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_notifications_user_group')
+        batch_op.drop_index(batch_op.f('ix_notifications_digest_pending'))
+        batch_op.drop_column('digest_pending')
+        batch_op.drop_column('group_count')
+        batch_op.drop_column('group_key')
@@ -170,7 +170,10 @@ class Attachment(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     file_url = db.Column(db.String(255), nullable=False)
-    uploaded_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    uploaded_at = db.Column('created_at', db.DateTime, default=lambda: datetime.now(timezone.utc))
+    mime_type = db.Column(db.String(100))
+    file_size = db.Column(db.Integer)
+    missing_at = db.Column(db.DateTime)
     uploaded_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     filename = db.Column(db.String(255), nullable=False)
     job_id = db.Column(db.Integer, db.ForeignKey('jobs.id'))
@@ -222,6 +225,9 @@ class Notification(db.Model):
     title = db.Column(db.String(200), nullable=False)
     message = db.Column(db.Text, nullable=False)
     notification_type = db.Column(db.String(50))
+    group_key = db.Column(db.String(100))
+    group_count = db.Column(db.Integer, nullable=False, default=1)
+    digest_pending = db.Column(db.Boolean, nullable=False, default=False, index=True)
     
 
 class ProjectStatusHistory(db.Model):
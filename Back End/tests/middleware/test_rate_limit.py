@@ -33,25 +33,44 @@ class MockRedis:
     def expire(self, key, time):
         self.ttl_store[key] = time
         return True
+    
+    def script_load(self, script):
+        return 'sha'
+    
+    def register_script(self, script):
+        """Emulate the sliding-window Lua script against the in-memory store."""
+        def run(keys, args):
+            now = int(time.time() * 1000)
+            limits = [(int(args[i * 2 + 1]), int(args[i * 2 + 2]) * 1000) for i in range(len(keys))]
+            hits = {
+                key: [t for t in self.store.get(key, []) if t > now - window]
+                for key, (_, window) in zip(keys, limits)
+            }
+            allowed = int(all(len(hits[key]) < limit for key, (limit, _) in zip(keys, limits)))
+            result = [allowed]
+            for key, (limit, window) in zip(keys, limits):
+                if allowed:
+                    hits[key].append(now)
+                    self.ttl_store[key] = window // 1000
+                self.store[key] = hits[key]
+                oldest = hits[key][0] if hits[key] else now
+                result.extend([max(0, limit - len(hits[key])), oldest + window - now])
+            return result
+        return run
 
 # Create a mock for the redis_client
 mock_redis = MockRedis()
 
-# Create a mock Redis client module
-mock_redis_module = MagicMock()
-mock_redis_module.get_redis_client.return_value = mock_redis
-
-# Patch the redis_client in the rate_limit module before importing it
-with patch.dict('sys.modules', {'app.redis_client': mock_redis_module}):
-    # Also patch the redis_client import in the rate_limit module
-    with patch('app.middleware.rate_limit.redis_client', mock_redis):
-        from app.middleware.rate_limit import (
-            RateLimitExceeded,
-            get_rate_limit,
-            init_rate_limit,
-            get_remote_address,
-            get_rate_limit_key
-        )
+from app.middleware.rate_limit import (
+    RateLimitExceeded,
+    get_rate_limit,
+    init_rate_limit,
+    get_remote_address,
+    get_rate_limit_key,
+    LocalTokenBucketLimiter,
+    RateLimitPolicies
+)
+import redis
 
 # Patch the redis_client in the app.extensions module
 @pytest.fixture(autouse=True)
@@ -61,6 +80,9 @@ def setup_mock_redis(monkeypatch):
     mock_redis.store = {}
     mock_redis.ttl_store = {}
     monkeypatch.setattr('app.extensions.redis_client', mock_redis)
+    monkeypatch.setattr('app.middleware.rate_limit._limiter', None)
+    monkeypatch.setattr('app.middleware.rate_limit._local_limiter', LocalTokenBucketLimiter())
+    monkeypatch.setattr('app.middleware.rate_limit._redis_retry_at', 0)
     return mock_redis
 
 @pytest.fixture
@@ -138,12 +160,132 @@ def test_rate_limit_decorator(client, setup_mock_redis):
     
     # Third request should be rate limited
     response = client.get('/limited')
-    # Check if rate limited (status 429) or still within limit (status 200)
-    if response.status_code == 429:
-        assert 'Rate limit exceeded' in response.json['message']
-        assert 'X-RateLimit-Remaining' in response.headers
-        assert 'X-RateLimit-Limit' in response.headers
-        assert 'X-RateLimit-Reset' in response.headers
+    assert response.status_code == 429
+    assert 'Rate limit exceeded' in response.json['message']
+    assert response.headers['X-RateLimit-Remaining'] == '0'
+    assert 'X-RateLimit-Limit' in response.headers
+    assert 'X-RateLimit-Reset' in response.headers
+
+def test_rate_limit_single_round_trip(client, setup_mock_redis, monkeypatch):
+    """Requests are checked by the script alone, without GET/INCR/TTL calls."""
+    for command in ('get', 'setex', 'incr', 'ttl', 'expire'):
+        monkeypatch.setattr(setup_mock_redis, command, MagicMock(side_effect=AssertionError(command)))
+    
+    response = client.get('/limited')
+    assert response.status_code == 200
+    assert response.headers['X-RateLimit-Remaining'] == '1'
+
+def test_rate_limit_without_redis(client, monkeypatch):
+    """The in-process limiter enforces limits when Redis is not configured."""
+    monkeypatch.setattr('app.extensions.redis_client', None)
+    
+    assert client.get('/limited').status_code == 200
+    assert client.get('/limited').status_code == 200
+    response = client.get('/limited')
+    assert response.status_code == 429
+    assert response.headers['X-RateLimit-Remaining'] == '0'
+
+def test_rate_limit_redis_unreachable(client, setup_mock_redis, monkeypatch):
+    """Redis errors fall back to the in-process limiter instead of failing the request."""
+    def failing_register(script):
+        def run(keys, args):
+            raise redis.ConnectionError('Connection refused')
+        return run
+    monkeypatch.setattr(setup_mock_redis, 'register_script', failing_register)
+    
+    assert client.get('/limited').status_code == 200
+    assert client.get('/limited').status_code == 200
+    assert client.get('/limited').status_code == 429
+
+def test_local_limiter_refill_and_prune(monkeypatch):
+    """Buckets refill over the window and idle ones are pruned."""
+    now = [1000.0]
+    monkeypatch.setattr('app.middleware.rate_limit.time.monotonic', lambda: now[0])
+    limiter = LocalTokenBucketLimiter(shards=4, prune_interval=3600)
+    
+    assert limiter.hit('k', 2, 10)['remaining'] == 1
+    assert limiter.hit('k', 2, 10)['allowed']
+    assert not limiter.hit('k', 2, 10)['allowed']
+    
+    # One token comes back after per/limit seconds
+    now[0] += 5
+    assert limiter.hit('k', 2, 10)['allowed']
+    assert not limiter.hit('k', 2, 10)['allowed']
+    
+    now[0] += 10
+    assert limiter.prune() == 1
+    assert limiter.hit('k', 2, 10)['remaining'] == 1
+
+def test_policies_longest_prefix():
+    """The most specific pattern wins regardless of configuration order."""
+    policies = RateLimitPolicies({
+        'bid': {'limit': 100, 'per': 60},
+        'bid.submit': {'limit': 5, 'per': 60},
+        'api.v1.*': {'limit': 10, 'per': 60},
+    })
+    
+    assert policies.resolve('bid.submit_bid')[0]['limit'] == 5
+    assert policies.resolve('bid.list_bids')[0]['limit'] == 100
+    assert policies.resolve('api.v1.resource')[0]['limit'] == 10
+    assert policies.resolve('auth.me') == []
+    # Resolved endpoints are memoized
+    assert policies.resolve('bid.submit_bid') is policies.resolve('bid.submit_bid')
+
+def test_policies_dimensions():
+    """IP, user and role limits are combined into one set of checks."""
+    policies = RateLimitPolicies({
+        'bid.': [
+            {'limit': 100, 'per': 60},
+            {'limit': 30, 'per': 60, 'by': 'user', 'roles': ['professional']},
+            {'limit': 1000, 'per': 60, 'by': 'role'},
+        ],
+    })
+    
+    assert policies.checks_for('bid.submit_bid', '1.2.3.4') == [
+        ('rate_limit:bid.submit_bid:1.2.3.4', 100, 60)
+    ]
+    assert policies.checks_for('bid.submit_bid', '1.2.3.4', user_id=7, roles=['professional']) == [
+        ('rate_limit:bid.submit_bid:1.2.3.4', 100, 60),
+        ('rate_limit:bid.submit_bid:user:7', 30, 60),
+        ('rate_limit:bid.submit_bid:role:professional', 1000, 60),
+    ]
+    assert len(policies.checks_for('bid.submit_bid', '1.2.3.4', user_id=8, roles=['customer'])) == 2
+    
+    with pytest.raises(ValueError):
+        RateLimitPolicies({'bid.': {'limit': 1, 'per': 1, 'by': 'tenant'}})
+
+def test_user_limit_checked_with_ip_limit(setup_mock_redis):
+    """A per-user limit is enforced alongside the IP limit in the same check."""
+    app = Flask(__name__)
+    app.config['RATE_LIMITS'] = {
+        'resource': [
+            {'limit': 10, 'per': 60},
+            {'limit': 1, 'per': 60, 'by': 'user'},
+        ],
+    }
+    
+    @app.before_request
+    def load_user():
+        g.user_id = 42
+        g.roles = ['customer']
+    
+    @app.route('/resource')
+    def resource():
+        return jsonify({'data': 'ok'})
+    
+    init_rate_limit(app)
+    client = app.test_client()
+    
+    response = client.get('/resource')
+    assert response.status_code == 200
+    assert response.headers['X-RateLimit-Limit'] == '1'
+    assert response.headers['X-RateLimit-Remaining'] == '0'
+    
+    response = client.get('/resource')
+    assert response.status_code == 429
+    assert response.json['limit'] == 1
+    # The denied request was not counted against the IP limit
+    assert len(setup_mock_redis.store['rate_limit:resource:127.0.0.1']) == 1
 
 def test_global_rate_limit(client, setup_mock_redis):
     """Test global rate limiting configuration."""
@@ -0,0 +1,324 @@
+"""Tests for the document routes."""
+import hashlib
+import io
+import os
+import pytest
+from flask_jwt_extended import create_access_token
+from app.extensions import db as _db
+from app.models import Attachment, Blob, UploadChunk, UploadSession
+from app.services.blob_storage import blob_key
+
+@pytest.fixture
+def uploader(make_user, upload_folder):
+    """A customer uploading into a temporary upload folder."""
+    user = make_user('uploader@example.com', name='Uploader')
+    user_id = user.id
+    token = create_access_token(identity=str(user_id))
+    yield user, {'Authorization': f'Bearer {token}'}
+    
+    Attachment.query.filter_by(uploaded_by=user_id).delete()
+    UploadChunk.query.delete()
+    UploadSession.query.filter_by(created_by=user_id).delete()
+    Blob.query.delete()
+    _db.session.commit()
+
+def _upload(app, headers, content, filename='drawing.pdf'):
+    response = app.test_client().post('/api/documents/upload', headers=headers, data={
+        'file': (io.BytesIO(content), filename, 'application/octet-stream'),
+        'document_type': 'job'
+    })
+    assert response.status_code == 201
+    return response.get_json()['attachment']
+
+def test_upload_is_stored_with_sniffed_type(app, uploader, tmp_path):
+    """The file is stored under its content hash with its sniffed type and no leftovers."""
+    user, headers = uploader
+    content = b'%PDF-1.4\n' + os.urandom(300 * 1024)
+    
+    attachment = _upload(app, headers, content)
+    
+    assert attachment['mime_type'] == 'application/pdf'
+    assert attachment['file_size'] == len(content)
+    assert attachment['file_url'] == blob_key(hashlib.sha256(content).hexdigest())
+    with open(tmp_path / attachment['file_url'], 'rb') as f:
+        assert f.read() == content
+    assert os.listdir(tmp_path / '.incoming') == []
+
+def test_duplicate_uploads_share_one_blob(app, uploader, tmp_path):
+    """Repeats only add a reference; the file goes with the last one."""
+    user, headers = uploader
+    content = b'%PDF-1.4\n' + os.urandom(64 * 1024)
+    
+    first = _upload(app, headers, content, 'boq.pdf')
+    second = _upload(app, headers, content, 'boq-copy.pdf')
+    
+    assert first['file_url'] == second['file_url']
+    blob = Blob.query.one()
+    assert blob.ref_count == 2
+    stored = tmp_path / blob.storage_key
+    
+    client = app.test_client()
+    assert client.delete(f"/api/documents/{first['id']}", headers=headers).status_code == 200
+    assert Blob.query.one().ref_count == 1
+    assert stored.exists()
+    
+    assert client.delete(f"/api/documents/{second['id']}", headers=headers).status_code == 200
+    assert Blob.query.count() == 0
+    assert not stored.exists()
+
+def test_download_supports_ranges_and_revalidation(app, uploader):
+    """Partial and conditional requests are answered without resending the file."""
+    user, headers = uploader
+    content = b'%PDF-1.4\n' + os.urandom(100 * 1024)
+    attachment = _upload(app, headers, content)
+    url = f"/api/documents/download/{attachment['id']}"
+    client = app.test_client()
+    
+    full = client.get(url, headers=headers)
+    assert full.status_code == 200
+    assert full.data == content
+    assert full.headers['Accept-Ranges'] == 'bytes'
+    assert full.headers['ETag'] == f'"{hashlib.sha256(content).hexdigest()}"'
+    
+    partial = client.get(url, headers={**headers, 'Range': 'bytes=1000-1999'})
+    assert partial.status_code == 206
+    assert partial.data == content[1000:2000]
+    assert partial.headers['Content-Range'] == f'bytes 1000-1999/{len(content)}'
+    
+    tail = client.get(url, headers={**headers, 'Range': 'bytes=-10'})
+    assert tail.data == content[-10:]
+    
+    unsatisfiable = client.get(url, headers={**headers, 'Range': f'bytes={len(content)}-'})
+    assert unsatisfiable.status_code == 416
+    
+    stale = client.get(url, headers={**headers, 'Range': 'bytes=0-9', 'If-Range': '"other"'})
+    assert stale.status_code == 200
+    assert stale.data == content
+    
+    cached = client.get(url, headers={**headers, 'If-None-Match': full.headers['ETag']})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+def test_download_can_be_offloaded_to_the_proxy(app, uploader, monkeypatch):
+    """With X-Accel-Redirect the response names the file and carries no body."""
+    user, headers = uploader
+    attachment = _upload(app, headers, b'%PDF-1.4\n' + os.urandom(1024))
+    monkeypatch.setitem(app.config, 'DOWNLOAD_OFFLOAD', 'x-accel')
+    
+    response = app.test_client().get(f"/api/documents/download/{attachment['id']}", headers=headers)
+    
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == f"/protected-uploads/{attachment['file_url']}"
+    assert response.data == b''
+
+def _jpeg(width, height):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 120, 40)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+def test_image_variant_is_rendered_once_and_cached(app, uploader, tmp_path):
+    """The first request renders the variant; later ones are served from the cache."""
+    from PIL import Image
+    user, headers = uploader
+    attachment = _upload(app, headers, _jpeg(1600, 900), 'site.jpg')
+    assert attachment['thumbnail_url'].endswith(f"/api/documents/{attachment['id']}/variants/thumb")
+    
+    client = app.test_client()
+    response = client.get(attachment['thumbnail_url'], headers={**headers, 'Accept': 'image/webp,*/*'})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    assert 'Accept' in response.vary
+    assert Image.open(io.BytesIO(response.data)).size == (200, 113)
+    
+    cached = tmp_path / 'variants'
+    rendered = sorted(str(p.relative_to(cached)) for p in cached.rglob('*.webp'))
+    assert len(rendered) == 1
+    again = client.get(attachment['thumbnail_url'], headers={
+        **headers, 'Accept': 'image/webp,*/*', 'If-None-Match': response.headers['ETag']
+    })
+    assert again.status_code == 304
+    
+    jpeg = client.get(f"/api/documents/{attachment['id']}/variants/medium?format=jpeg", headers=headers)
+    assert jpeg.mimetype == 'image/jpeg'
+    assert Image.open(io.BytesIO(jpeg.data)).size == (1280, 720)
+    assert client.get(f"/api/documents/{attachment['id']}/variants/huge", headers=headers).status_code == 400
+
+def test_variants_are_removed_with_their_blob(app, uploader, tmp_path):
+    """Deleting the last reference to an image also drops its cached variants."""
+    user, headers = uploader
+    attachment = _upload(app, headers, _jpeg(400, 400), 'tile.jpg')
+    client = app.test_client()
+    assert client.get(attachment['thumbnail_url'], headers=headers).status_code == 200
+    assert list((tmp_path / 'variants').rglob('*.jpg'))
+    
+    assert client.delete(f"/api/documents/{attachment['id']}", headers=headers).status_code == 200
+    assert not list((tmp_path / 'variants').rglob('*.jpg'))
+
+def test_search_finds_indexed_pdf_pages(app, uploader, tmp_path):
+    """Uploaded PDFs become searchable once indexed."""
+    from app.models import DocumentPage
+    from app.services.document_index import index_pending_documents
+    from tests.services.test_document_index import make_pdf
+    user, headers = uploader
+    attachment = _upload(app, headers, make_pdf(['Site plan', 'Structural steel schedule']), 'tender.pdf')
+    with app.app_context():
+        index_pending_documents(_db.session, str(tmp_path), max_workers=1)
+    
+    client = app.test_client()
+    response = client.get('/api/documents/search?q=steel', headers=headers)
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [(r['id'], r['page']) for r in results] == [(attachment['id'], 2)]
+    assert client.get('/api/documents/search', headers=headers).status_code == 400
+    
+    with app.app_context():
+        DocumentPage.query.delete()
+        _db.session.commit()
+
+def test_resumable_upload_survives_lost_and_repeated_chunks(app, uploader, tmp_path, monkeypatch):
+    """Chunks arrive in any order, retries are harmless, and only missing chunks need resending."""
+    monkeypatch.setitem(app.config, 'RESUMABLE_UPLOAD_CHUNK_SIZE', 64 * 1024)
+    user, headers = uploader
+    content = b'%PDF-1.4\n' + os.urandom(200 * 1024)
+    chunk = lambda i: content[i * 64 * 1024:(i + 1) * 64 * 1024]
+    client = app.test_client()
+    
+    response = client.post('/api/documents/uploads', headers=headers, json={
+        'filename': 'drawings.pdf', 'size': len(content), 'document_type': 'job'
+    })
+    assert response.status_code == 201
+    upload = response.get_json()['upload']
+    assert upload['chunk_count'] == 4
+    url = f"/api/documents/uploads/{upload['upload_id']}"
+    
+    assert client.put(f'{url}/chunks/3', headers=headers, data=chunk(3)).status_code == 200
+    assert client.put(f'{url}/chunks/0', headers=headers, data=chunk(0)).status_code == 200
+    # A retry of a chunk that already arrived
+    assert client.put(f'{url}/chunks/0', headers=headers, data=chunk(0)).status_code == 200
+    # A chunk cut short by a dropped connection is rejected and not recorded
+    assert client.put(f'{url}/chunks/1', headers=headers, data=chunk(1)[:1000]).status_code == 400
+    bad_digest = {**headers, 'X-Chunk-SHA256': hashlib.sha256(b'other').hexdigest()}
+    assert client.put(f'{url}/chunks/2', headers=bad_digest, data=chunk(2)).status_code == 400
+    
+    status = client.get(url, headers=headers).get_json()['upload']
+    assert status['missing'] == [1, 2]
+    assert status['ranges'] == [[0, 64 * 1024], [3 * 64 * 1024, len(content)]]
+    assert client.post(f'{url}/complete', headers=headers).status_code == 409
+    
+    for index in status['missing']:
+        digest = {**headers, 'X-Chunk-SHA256': hashlib.sha256(chunk(index)).hexdigest()}
+        assert client.put(f'{url}/chunks/{index}', headers=digest, data=chunk(index)).status_code == 200
+    response = client.post(f'{url}/complete', headers=headers, json={'sha256': hashlib.sha256(content).hexdigest()})
+    assert response.status_code == 201
+    attachment = response.get_json()['attachment']
+    
+    assert attachment['mime_type'] == 'application/pdf'
+    assert attachment['file_size'] == len(content)
+    with open(tmp_path / attachment['file_url'], 'rb') as f:
+        assert f.read() == content
+    assert os.listdir(tmp_path / '.incoming') == []
+    assert client.get(url, headers=headers).status_code == 404
+
+def test_resumable_upload_is_private_to_its_creator(app, uploader):
+    user, headers = uploader
+    client = app.test_client()
+    upload = client.post('/api/documents/uploads', headers=headers, json={
+        'filename': 'boq.xlsx', 'size': 10
+    }).get_json()['upload']
+    with app.app_context():
+        other = create_access_token(identity=str(user.id + 1000))
+    assert client.get(f"/api/documents/uploads/{upload['upload_id']}", headers={
+        'Authorization': f'Bearer {other}'
+    }).status_code == 404
+    assert client.delete(f"/api/documents/uploads/{upload['upload_id']}", headers=headers).status_code == 200
+    assert client.post('/api/documents/uploads', headers=headers, json={'filename': 'x.exe', 'size': 10}).status_code == 400
+
+def test_offloaded_upload_is_served_locally_until_pushed(app, uploader, tmp_path, monkeypatch):
+    """With offloading on, uploads never wait for the provider and switch to it once pushed."""
+    from app.services.storage_tiering import FilesystemProvider, offload_blobs
+    remote = tmp_path / 'remote'
+    monkeypatch.setitem(app.config, 'STORAGE_OFFLOAD', True)
+    monkeypatch.setitem(app.config, 'STORAGE_PROVIDER', 'filesystem')
+    monkeypatch.setitem(app.config, 'REMOTE_STORAGE_ROOT', str(remote))
+    monkeypatch.setitem(app.config, 'REMOTE_STORAGE_URL', 'https://cdn.example.com')
+    user, headers = uploader
+    content = b'Site diary, week 12'
+    
+    attachment = _upload(app, headers, content, 'diary.txt')
+    assert attachment['public_url'] is None
+    response = app.test_client().get(f"/api/documents/download/{attachment['id']}", headers=headers)
+    assert response.status_code == 200 and response.data == content
+    
+    with app.app_context():
+        offload_blobs(_db.session, str(tmp_path), FilesystemProvider(str(remote), 'https://cdn.example.com'))
+    response = app.test_client().get(f"/api/documents/download/{attachment['id']}", headers=headers)
+    assert response.get_json()['download_url'] == f"https://cdn.example.com/{attachment['file_url']}"
+    assert (remote / attachment['file_url']).read_bytes() == content
+    assert not (tmp_path / attachment['file_url']).exists()
+    
+    assert app.test_client().delete(f"/api/documents/{attachment['id']}", headers=headers).status_code == 200
+    assert not (remote / attachment['file_url']).exists()
+
+def test_resumable_upload_survives_a_failed_store(app, uploader, tmp_path, monkeypatch):
+    """If storing the assembled file fails, completing can be retried without resending chunks."""
+    import app.routes.document as document_routes
+    user, headers = uploader
+    content = b'%PDF-1.4\n' + os.urandom(5000)
+    client = app.test_client()
+    upload = client.post('/api/documents/uploads', headers=headers, json={
+        'filename': 'survey.pdf', 'size': len(content)
+    }).get_json()['upload']
+    url = f"/api/documents/uploads/{upload['upload_id']}"
+    assert client.put(f'{url}/chunks/0', headers=headers, data=content).status_code == 200
+    
+    store_blob = document_routes.store_blob
+    def unavailable(*args, **kwargs):
+        raise IOError('storage unavailable')
+    monkeypatch.setattr(document_routes, 'store_blob', unavailable)
+    response = client.post(f'{url}/complete', headers=headers)
+    assert response.status_code == 503
+    assert response.get_json()['upload']['missing'] == []
+    
+    monkeypatch.setattr(document_routes, 'store_blob', store_blob)
+    response = client.post(f'{url}/complete', headers=headers)
+    assert response.status_code == 201
+    with open(tmp_path / response.get_json()['attachment']['file_url'], 'rb') as f:
+        assert f.read() == content
+    assert os.listdir(tmp_path / '.incoming') == []
+
+def test_large_resumable_upload_is_sent_to_cloudinary_in_chunks(app, uploader, monkeypatch):
+    """Files too large for Cloudinary's plain upload API go through its chunked one."""
+    import cloudinary.uploader
+    from app.services.cloudinary_storage import cloudinary_storage
+    monkeypatch.setitem(app.config, 'STORAGE_PROVIDER', 'cloudinary')
+    monkeypatch.setitem(app.config, 'RESUMABLE_UPLOAD_CHUNK_SIZE', 64 * 1024)
+    monkeypatch.setattr(cloudinary_storage, 'max_content_length', 16 * 1024)
+    monkeypatch.setattr(cloudinary_storage, 'large_file_size', 100 * 1024)
+    sent = []
+    
+    def upload_large(file, public_id, **options):
+        sent.append(file.read())
+        return {'public_id': public_id, 'secure_url': f'https://res.cloudinary.com/test/{public_id}', 'url': ''}
+    
+    def upload(*args, **kwargs):
+        raise AssertionError('too large for the plain upload API')
+    
+    monkeypatch.setattr(cloudinary.uploader, 'upload_large', upload_large)
+    monkeypatch.setattr(cloudinary.uploader, 'upload', upload)
+    user, headers = uploader
+    content = b'%PDF-1.4\n' + os.urandom(150 * 1024)
+    client = app.test_client()
+    
+    upload_session = client.post('/api/documents/uploads', headers=headers, json={
+        'filename': 'drawings.pdf', 'size': len(content)
+    }).get_json()['upload']
+    url = f"/api/documents/uploads/{upload_session['upload_id']}"
+    for index in range(upload_session['chunk_count']):
+        chunk = content[index * 64 * 1024:(index + 1) * 64 * 1024]
+        assert client.put(f'{url}/chunks/{index}', headers=headers, data=chunk).status_code == 200
+    
+    response = client.post(f'{url}/complete', headers=headers)
+    assert response.status_code == 201
+    assert sent == [content]
+    assert response.get_json()['attachment']['public_url'].startswith('https://res.cloudinary.com/test/')
@@ -0,0 +1,192 @@
+"""Tests for the notification routes."""
+from datetime import datetime, timedelta
+import pytest
+from flask_jwt_extended import create_access_token
+from app.extensions import db as _db
+from app.models import Notification
+
+@pytest.fixture
+def inbox(make_user):
+    """A user with 25 notifications, every third one read."""
+    user = make_user('inbox@example.com', name='Inbox User')
+    
+    start = datetime(2026, 1, 1)
+    for i in range(25):
+        _db.session.add(Notification(
+            user_id=user.id,
+            title=f'Notification {i}',
+            message='Message',
+            content='Content',
+            read=(i % 3 == 0),
+            notification_type='bid',
+            created_at=start + timedelta(minutes=i)
+        ))
+    _db.session.commit()
+    
+    user_id = user.id
+    token = create_access_token(identity=str(user_id))
+    yield user, {'Authorization': f'Bearer {token}'}
+    
+    # By ID, since a stream may have closed the session the user was loaded in
+    Notification.query.filter_by(user_id=user_id).delete()
+    _db.session.commit()
+
+def test_keyset_pagination(app, inbox):
+    """Cursors walk the inbox newest first without gaps or repeats."""
+    user, headers = inbox
+    client = app.test_client()
+    
+    seen = []
+    url = '/api/notifications?limit=10'
+    while url:
+        data = client.get(url, headers=headers).get_json()
+        assert data['success']
+        assert 'total' not in data
+        seen.extend(n['title'] for n in data['notifications'])
+        url = f"/api/notifications?limit=10&before={data['next_cursor']}" if data['has_more'] else None
+    
+    assert seen == [f'Notification {i}' for i in reversed(range(25))]
+
+def test_newer_than_cursor_and_total(app, inbox):
+    """`after` returns newer notifications and totals are opt-in."""
+    user, headers = inbox
+    client = app.test_client()
+    
+    first = client.get('/api/notifications?limit=5&unread_only=true&include_total=true', headers=headers).get_json()
+    assert first['total'] == 16
+    assert first['unread_count'] == 16
+    assert [n['title'] for n in first['notifications']] == [
+        'Notification 23', 'Notification 22', 'Notification 20', 'Notification 19', 'Notification 17'
+    ]
+    
+    older = client.get(f"/api/notifications?limit=5&before={first['next_cursor']}", headers=headers).get_json()
+    newer = client.get(f"/api/notifications?limit=5&after={older['prev_cursor']}", headers=headers).get_json()
+    assert [n['title'] for n in newer['notifications']] == [
+        'Notification 21', 'Notification 20', 'Notification 19', 'Notification 18', 'Notification 17'
+    ]
+    assert newer['has_more']
+
+def test_invalid_cursor(app, inbox):
+    """Malformed cursors are rejected with a 400."""
+    user, headers = inbox
+    response = app.test_client().get('/api/notifications?before=not-a-cursor', headers=headers)
+    assert response.status_code == 400
+
+def test_unread_counter_maintained(app, inbox):
+    """Inserts, reads and deletes keep the unread counter in step without counting."""
+    user, headers = inbox
+    client = app.test_client()
+    
+    def unread_count():
+        return client.get('/api/notifications/unread-count', headers=headers).get_json()['count']
+    
+    assert unread_count() == 16
+    
+    unread = Notification.query.filter_by(user_id=user.id, read=False).order_by(Notification.id).all()
+    client.post(f'/api/notifications/{unread[0].id}/read', headers=headers)
+    assert unread_count() == 15
+    
+    client.delete(f'/api/notifications/{unread[1].id}', headers=headers)
+    assert unread_count() == 14
+    
+    client.post('/api/notifications/read-all', headers=headers)
+    assert unread_count() == 0
+
+def test_reconcile_unread_counts(app, inbox):
+    """Reconciliation corrects counters that drifted from the notifications table."""
+    from app.services.notification_counters import reconcile_unread_counts
+    user, headers = inbox
+    
+    user.unread_notifications = 3
+    _db.session.commit()
+    
+    assert reconcile_unread_counts() == 1
+    _db.session.refresh(user)
+    assert user.unread_notifications == 16
+
+def test_stream_replays_and_polls(app, inbox, monkeypatch):
+    """The stream replays missed notifications, then picks up new ones."""
+    from app import extensions
+    from app.services.notification_stream import notification_events
+    monkeypatch.setattr(extensions, 'redis_client', None)
+    user, headers = inbox
+    user_id = user.id
+    
+    ids = [n.id for n in Notification.query.filter_by(user_id=user.id).order_by(Notification.id)]
+    events = notification_events(user_id, last_event_id=ids[21], heartbeat_interval=0, poll_interval=0)
+    
+    assert next(events) == 'retry: 5000\n\n'
+    replayed = [next(events) for _ in range(3)]
+    assert [event.splitlines()[0] for event in replayed] == [f'id: {i}' for i in ids[22:]]
+    assert 'event: notification' in replayed[0]
+    assert next(events) == 'event: unread_count\ndata: {"count": 16}\n\n'
+    
+    _db.session.add(Notification(
+        user_id=user_id, title='Live', message='Message', content='Content', notification_type='bid'
+    ))
+    _db.session.commit()
+    
+    live = next(events)
+    assert '"title": "Live"' in live
+    assert next(events) == 'event: unread_count\ndata: {"count": 17}\n\n'
+    assert next(events) == ': heartbeat\n\n'
+    events.close()
+
+def test_new_stream_starts_from_latest(app, inbox, monkeypatch):
+    """A client without a Last-Event-ID is not replayed the inbox it loads itself."""
+    from app import extensions
+    from app.services.notification_stream import notification_events
+    monkeypatch.setattr(extensions, 'redis_client', None)
+    user, headers = inbox
+    user_id = user.id
+    
+    events = notification_events(user_id, heartbeat_interval=0, poll_interval=0)
+    
+    assert next(events) == 'retry: 5000\n\n'
+    assert next(events) == 'event: unread_count\ndata: {"count": 16}\n\n'
+    
+    _db.session.add(Notification(
+        user_id=user_id, title='Live', message='Message', content='Content', notification_type='bid'
+    ))
+    _db.session.commit()
+    
+    live = next(events)
+    assert live.startswith('id: ') and '"title": "Live"' in live
+    events.close()
+
+def test_stream_resyncs_clients_far_behind(app, inbox, monkeypatch):
+    """A client that missed more than REPLAY_LIMIT notifications is told to refetch."""
+    from app import extensions
+    from app.services import notification_stream
+    monkeypatch.setattr(extensions, 'redis_client', None)
+    monkeypatch.setattr(notification_stream, 'REPLAY_LIMIT', 10)
+    user, headers = inbox
+    user_id = user.id
+    
+    ids = [n.id for n in Notification.query.filter_by(user_id=user.id).order_by(Notification.id)]
+    events = notification_stream.notification_events(
+        user_id, last_event_id=ids[2], heartbeat_interval=0, poll_interval=0
+    )
+    
+    assert next(events) == 'retry: 5000\n\n'
+    assert next(events) == f'id: {ids[-1]}\nevent: resync\ndata: {{"last_event_id": {ids[-1]}}}\n\n'
+    assert next(events) == 'event: unread_count\ndata: {"count": 16}\n\n'
+    
+    _db.session.add(Notification(
+        user_id=user_id, title='Live', message='Message', content='Content', notification_type='bid'
+    ))
+    _db.session.commit()
+    
+    assert '"title": "Live"' in next(events)
+    events.close()
+
+def test_stream_connection_cap(app, inbox, monkeypatch):
+    """Streams beyond the per-worker cap are turned away with a 503."""
+    from app.services.notification_stream import stream_slots
+    user, headers = inbox
+    monkeypatch.setitem(app.config, 'SSE_MAX_CONNECTIONS_PER_WORKER', 0)
+    
+    response = app.test_client().get('/api/notifications/stream', headers=headers)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    assert stream_slots.active == 0
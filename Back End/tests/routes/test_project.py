@@ -0,0 +1,47 @@
+"""Tests for the project routes."""
+import io
+import pytest
+from flask_jwt_extended import create_access_token
+from app.extensions import db as _db
+from app.models import Attachment, Blob, Category, Job, ProjectStatusHistory
+
+@pytest.fixture
+def customer(make_user, upload_folder):
+    """A customer creating projects with documents in a temporary upload folder."""
+    user = make_user('projects@example.com', name='Projects')
+    category = Category(name='Renovation')
+    _db.session.add(category)
+    _db.session.commit()
+    
+    user_id, category_id = user.id, category.id
+    token = create_access_token(identity=str(user_id))
+    yield category_id, {'Authorization': f'Bearer {token}'}
+    
+    job_ids = [job.id for job in Job.query.filter_by(customer_id=user_id)]
+    Attachment.query.filter_by(uploaded_by=user_id).delete()
+    ProjectStatusHistory.query.filter(ProjectStatusHistory.project_id.in_(job_ids)).delete(synchronize_session=False)
+    Job.query.filter_by(customer_id=user_id).delete()
+    Blob.query.delete()
+    Category.query.filter_by(id=category_id).delete()
+    _db.session.commit()
+
+def test_create_project_stores_every_document(app, customer, tmp_path):
+    category_id, headers = customer
+    documents = [(io.BytesIO(f'%PDF-1.4\nsheet {n}'.encode()), f'sheet-{n}.pdf') for n in range(5)]
+    documents.append((io.BytesIO(b'%PDF-1.4\nsheet 0'), 'sheet-0-copy.pdf'))
+    
+    response = app.test_client().post('/api/projects', headers=headers, data={
+        'title': 'Kitchen', 'description': 'Refit', 'category_id': str(category_id),
+        'location': 'Nairobi', 'budget': '5000', 'documents': documents
+    })
+    
+    assert response.status_code == 201
+    project_id = response.get_json()['project']['id']
+    with app.app_context():
+        attachments = Attachment.query.filter_by(job_id=project_id).order_by(Attachment.id).all()
+        assert [a.filename for a in attachments] == [f'sheet-{n}.pdf' for n in range(5)] + ['sheet-0-copy.pdf']
+        assert attachments[0].blob_id == attachments[-1].blob_id
+        assert Blob.query.count() == 5
+        for attachment in attachments:
+            assert attachment.mime_type == 'application/pdf'
+            assert (tmp_path / attachment.file_url).read_bytes().startswith(b'%PDF-1.4')
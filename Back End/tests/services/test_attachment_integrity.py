@@ -0,0 +1,72 @@
+"""Tests for the attachment integrity check."""
+from datetime import datetime
+import pytest
+from app.extensions import db as _db
+from app.models import Attachment
+from app.services.attachment_integrity import check_attachment_files
+
+@pytest.fixture
+def stored_attachments(make_user, tmp_path):
+    """A user with one complete, one unsized, one missing, one restored and one remote attachment."""
+    user = make_user('integrity@example.com', name='Integrity User')
+    (tmp_path / 'complete.txt').write_bytes(b'complete')
+    (tmp_path / 'unsized.gif').write_bytes(b'GIF89a' + b'\x00' * 100)
+    (tmp_path / 'restored.txt').write_bytes(b'back again')
+    rows = {
+        'complete': dict(file_url='complete.txt', file_size=8, mime_type='text/plain'),
+        'unsized': dict(file_url='unsized.gif'),
+        'missing': dict(file_url='gone.txt', file_size=4, mime_type='text/plain'),
+        'restored': dict(file_url='restored.txt', file_size=10, mime_type='text/plain', missing_at=datetime.utcnow()),
+        'remote': dict(file_url='remote/key', public_url='https://cdn.example.com/remote/key'),
+    }
+    attachments = {}
+    for name, fields in rows.items():
+        attachment = Attachment(filename=f'{name}.bin', uploaded_by=user.id, user_id=user.id, **fields)
+        _db.session.add(attachment)
+        attachments[name] = attachment
+    _db.session.commit()
+
+    ids = {name: attachment.id for name, attachment in attachments.items()}
+    yield ids
+
+    Attachment.query.filter(Attachment.id.in_(ids.values())).delete(synchronize_session=False)
+    _db.session.commit()
+
+def test_flags_missing_and_backfills(app, stored_attachments, tmp_path):
+    """Missing files are flagged, restored ones cleared and unsized rows backfilled."""
+    report = check_attachment_files(_db.session, str(tmp_path), batch_size=2)
+
+    assert report == {'checked': 4, 'missing': 1, 'restored': 1, 'backfilled': 1}
+    _db.session.expire_all()
+    get = lambda name: _db.session.get(Attachment, stored_attachments[name])
+    assert get('missing').missing_at is not None
+    assert get('restored').missing_at is None
+    assert get('complete').missing_at is None
+    assert get('unsized').file_size == 106
+    assert get('unsized').mime_type == 'image/gif'
+    assert get('remote').missing_at is None
+
+def test_second_run_reports_no_changes(app, stored_attachments, tmp_path):
+    """Already-flagged attachments are not counted again."""
+    check_attachment_files(_db.session, str(tmp_path))
+    report = check_attachment_files(_db.session, str(tmp_path))
+
+    assert report == {'checked': 4, 'missing': 0, 'restored': 0, 'backfilled': 0}
+
+def test_resolves_absolute_and_legacy_paths(app, stored_attachments, tmp_path):
+    """Absolute paths and paths relative to the upload folder's parent are found."""
+    uploads = tmp_path / 'uploads'
+    (uploads / 'project_1').mkdir(parents=True)
+    (uploads / 'project_1' / 'plan.txt').write_bytes(b'plan')
+    (uploads / 'absolute.txt').write_bytes(b'absolute')
+    Attachment.query.filter_by(id=stored_attachments['complete']).update({'file_url': 'uploads/project_1/plan.txt'})
+    Attachment.query.filter_by(id=stored_attachments['restored']).update({'file_url': str(uploads / 'absolute.txt')})
+    _db.session.commit()
+
+    check_attachment_files(_db.session, str(uploads))
+
+    _db.session.expire_all()
+    get = lambda name: _db.session.get(Attachment, stored_attachments[name])
+    assert get('complete').missing_at is None
+    assert get('restored').missing_at is None
+    assert get('missing').missing_at is not None
@@ -0,0 +1,104 @@
+"""Tests for content-addressed blob storage."""
+import hashlib
+import io
+import threading
+import time
+import pytest
+from app.extensions import db as _db
+from app.models import Blob
+from app.services.blob_storage import SESSION_REMOVALS_KEY, LocalBlobStore, blob_key, release_blob, store_blob, store_blobs
+from app.utils.uploads import receive_upload
+
+class SlowStore(LocalBlobStore):
+    """A local store whose writes take as long as a remote upload."""
+
+    def __init__(self, root, delay=0.2, fail=()):
+        super().__init__(root)
+        self.delay = delay
+        self.fail = fail
+        self.puts = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.lock = threading.Lock()
+
+    def put(self, upload, key):
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.puts.append(key)
+        if upload.sha256 in self.fail:
+            raise IOError('upload rejected')
+        return super().put(upload, key)
+
+@pytest.fixture
+def blob_session(app):
+    with app.app_context():
+        yield _db.session
+        _db.session.rollback()
+        Blob.query.delete()
+        _db.session.commit()
+
+def _receive(tmp_path, content):
+    return receive_upload(io.BytesIO(content), str(tmp_path / '.incoming'), 1024 * 1024)
+
+def test_new_content_is_written_concurrently(blob_session, tmp_path):
+    contents = [f'document {n}'.encode() for n in range(6)]
+    store = SlowStore(str(tmp_path))
+    
+    results = store_blobs(blob_session, [(_receive(tmp_path, content), store) for content in contents], max_workers=6)
+    
+    assert store.peak_in_flight == 6
+    assert [blob.sha256 for blob, stored in results] == [hashlib.sha256(c).hexdigest() for c in contents]
+    assert all(stored for _, stored in results)
+    for content in contents:
+        assert (tmp_path / blob_key(hashlib.sha256(content).hexdigest())).read_bytes() == content
+
+def test_repeated_and_failed_content(blob_session, tmp_path):
+    """Content repeated in a batch is written once; a failed write leaves only its item out."""
+    bad = hashlib.sha256(b'bad').hexdigest()
+    store = SlowStore(str(tmp_path), delay=0, fail={bad})
+    items = [(_receive(tmp_path, content), store) for content in (b'same', b'same', b'bad', b'other')]
+    
+    results = store_blobs(blob_session, items)
+    blob_session.commit()
+    
+    assert len(store.puts) == 3
+    assert results[2] is None
+    assert results[0][0].id == results[1][0].id and results[0][1] and not results[1][1]
+    assert results[0][0].ref_count == 2
+    assert list((tmp_path / '.incoming').iterdir()) == []
+
+def test_released_blob_is_removed_after_commit(blob_session, tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    blob, _ = store_blob(blob_session, _receive(tmp_path, b'tender'), store)
+    blob_session.commit()
+    
+    assert release_blob(blob_session, blob.id, store)
+    blob_session.commit()
+    
+    assert Blob.query.count() == 0
+    assert not (tmp_path / blob_key(hashlib.sha256(b'tender').hexdigest())).exists()
+
+def test_content_uploaded_again_before_removal_is_kept(blob_session, tmp_path):
+    """An upload that revives a released blob before its removal runs keeps the file."""
+    store = LocalBlobStore(str(tmp_path))
+    blob, _ = store_blob(blob_session, _receive(tmp_path, b'tender'), store)
+    blob_session.commit()
+    release_blob(blob_session, blob.id, store)
+    removals = blob_session.info.pop(SESSION_REMOVALS_KEY)
+    blob_session.commit()
+    
+    revived, stored = store_blob(blob_session, _receive(tmp_path, b'tender'), store)
+    blob_session.commit()
+    # The removal of the earlier release runs after the revival has committed
+    blob_session.info[SESSION_REMOVALS_KEY] = removals
+    blob_session.commit()
+    
+    assert revived.id == blob.id and not stored
+    assert Blob.query.one().ref_count == 1
+    assert (tmp_path / blob.storage_key).read_bytes() == b'tender'
@@ -0,0 +1,155 @@
+"""Tests for document text indexing and search."""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+from app.extensions import db as _db
+from app.models import UserRole, Job, JobStatus, Bid, Attachment, Blob, DocumentPage
+from app.services.blob_storage import LocalBlobStore, blob_key, release_blob
+from app.services.document_index import (
+    extract_pages, index_document, index_pending_documents, missing_ranges, search_documents
+)
+
+def make_pdf(pages):
+    """A minimal PDF with one line of Helvetica text per page."""
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for page_text in pages:
+        stream = f'BT /F1 12 Tf 72 720 Td ({page_text}) Tj ET'
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+        objects.append(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>'
+        )
+        kids.append(f'{len(objects)} 0 R')
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n{body}\nendobj\n'.encode()
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets).encode()
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return out
+
+def _store(tmp_path, content):
+    sha256 = hashlib.sha256(content).hexdigest()
+    path = tmp_path / blob_key(sha256)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    blob = Blob(sha256=sha256, size=len(content), mime_type='application/pdf', storage_key=blob_key(sha256), ref_count=1)
+    _db.session.add(blob)
+    _db.session.flush()
+    return blob
+
+@pytest.fixture
+def tender(make_user, tmp_path):
+    """A customer's open job with an indexed-to-be tender PDF, a bidder and an outsider."""
+    customer = make_user('tender-owner@example.com')
+    bidder = make_user('tender-bidder@example.com', UserRole.PROFESSIONAL)
+    outsider = make_user('tender-outsider@example.com', UserRole.PROFESSIONAL)
+    admin = make_user('tender-admin@example.com', UserRole.ADMIN)
+
+    job = Job(
+        title='Clinic extension', description='Tender', budget=100000, location='Nairobi',
+        customer_id=customer.id, status=JobStatus.OPEN
+    )
+    _db.session.add(job)
+    _db.session.flush()
+    _db.session.add(Bid(job_id=job.id, professional_id=bidder.id, amount=90000, proposal='Bid', timeline_weeks=6))
+
+    pages = [f'Page {n} general conditions' for n in range(1, 21)]
+    pages[12] = 'Bill of quantities for reinforced concrete foundations'
+    blob = _store(tmp_path, make_pdf(pages))
+    attachment = Attachment(
+        file_url=blob.storage_key, filename='tender.pdf', mime_type='application/pdf',
+        uploaded_by=customer.id, user_id=customer.id, job_id=job.id, blob_id=blob.id
+    )
+    _db.session.add(attachment)
+    _db.session.commit()
+
+    users = {'customer': customer, 'bidder': bidder, 'outsider': outsider, 'admin': admin}
+    yield {'users': users, 'job': job, 'blob': blob, 'attachment': attachment, 'root': str(tmp_path)}
+
+    _db.session.rollback()
+    DocumentPage.query.delete()
+    Attachment.query.filter_by(job_id=job.id).delete()
+    Bid.query.filter_by(job_id=job.id).delete()
+    Job.query.filter_by(id=job.id).delete()
+    Blob.query.delete()
+    _db.session.commit()
+
+def test_extract_pages_by_range(tender):
+    path = os.path.join(tender['root'], tender['blob'].storage_key)
+    pages = extract_pages(path, 12, 14)
+    assert [number for number, _ in pages] == [13, 14]
+    assert 'reinforced concrete' in pages[0][1]
+
+def test_index_resumes_with_missing_ranges(tender):
+    """Ranges already stored are not extracted again."""
+    blob = tender['blob']
+    path = os.path.join(tender['root'], blob.storage_key)
+    blob.page_count = 20
+    _db.session.commit()
+    assert missing_ranges(_db.session, blob.id, 20) == [(0, 8), (8, 16), (16, 20)]
+
+    from app.services.document_index import store_pages
+    store_pages(_db.session, blob.id, extract_pages(path, 8, 16))
+    assert missing_ranges(_db.session, blob.id, 20) == [(0, 8), (16, 20)]
+
+    assert index_document(_db.session, blob, path) == 12
+    assert DocumentPage.query.filter_by(blob_id=blob.id).count() == 20
+    assert blob.text_indexed_at is not None
+
+def test_index_on_process_pool(tender):
+    blob = tender['blob']
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        indexed = index_document(_db.session, blob, os.path.join(tender['root'], blob.storage_key), executor, 4)
+    assert indexed == 20
+    assert blob.page_count == 20
+
+def test_search_is_scoped_to_accessible_documents(tender):
+    index_pending_documents(_db.session, tender['root'], max_workers=2)
+    users = tender['users']
+
+    for name in ('customer', 'bidder', 'admin'):
+        hits = search_documents(_db.session, users[name], 'concrete foundation')
+        assert [(hit['id'], hit['page']) for hit in hits] == [(tender['attachment'].id, 13)]
+        assert '**concrete**' in hits[0]['snippet']
+    assert search_documents(_db.session, users['outsider'], 'concrete') == []
+    assert search_documents(_db.session, users['admin'], 'concrete', job_id=tender['job'].id + 1) == []
+
+    # Awarding the job narrows access to the winning contractor
+    tender['job'].status = JobStatus.AWARDED
+    tender['job'].assigned_contractor_id = users['outsider'].id
+    _db.session.commit()
+    assert search_documents(_db.session, users['bidder'], 'concrete') == []
+    assert len(search_documents(_db.session, users['outsider'], 'concrete')) == 1
+
+def test_search_terms_are_not_query_syntax(tender):
+    index_pending_documents(_db.session, tender['root'], max_workers=1)
+    admin = tender['users']['admin']
+    assert len(search_documents(_db.session, admin, 'concrete" foundations* (')) == 1
+    assert search_documents(_db.session, admin, '"*') == []
+
+def test_unreadable_documents_are_not_retried(tender):
+    blob = tender['blob']
+    with open(os.path.join(tender['root'], blob.storage_key), 'wb') as f:
+        f.write(b'not a pdf')
+
+    assert index_pending_documents(_db.session, tender['root'], max_workers=1)['failed'] == 1
+    assert index_pending_documents(_db.session, tender['root'], max_workers=1) == {'documents': 0, 'pages': 0, 'failed': 0}
+
+def test_pages_are_removed_with_their_blob(tender):
+    index_pending_documents(_db.session, tender['root'], max_workers=1)
+    blob_id = tender['blob'].id
+    _db.session.delete(tender['attachment'])
+    _db.session.flush()
+    release_blob(_db.session, blob_id, LocalBlobStore(tender['root']))
+    _db.session.commit()
+
+    assert DocumentPage.query.filter_by(blob_id=blob_id).count() == 0
+    assert search_documents(_db.session, tender['users']['admin'], 'concrete') == []
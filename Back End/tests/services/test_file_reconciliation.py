@@ -0,0 +1,122 @@
+"""Tests for reconciling the upload folder against the database."""
+import hashlib
+import json
+import os
+import pytest
+from app.extensions import db as _db
+from app.models import Attachment, Blob
+from app.services import file_reconciliation
+from app.services.blob_storage import blob_key
+from app.services.file_reconciliation import reconcile_upload_folder
+
+OLD = 1_600_000_000
+
+def _write(path, content=b'x', recent=False):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    if not recent:
+        os.utime(path, (OLD, OLD))
+
+@pytest.fixture
+def folder(make_user, tmp_path):
+    """An upload folder with referenced files, orphans of every kind and work in progress."""
+    root = tmp_path / 'uploads'
+    user = make_user('reconcile@example.com', name='Reconcile')
+
+    shas = sorted(hashlib.sha256(f'content {n}'.encode()).hexdigest() for n in range(5))
+    for sha in shas:
+        _write(root / blob_key(sha))
+    for sha in shas[:3]:
+        _db.session.add(Blob(sha256=sha, size=1, mime_type='text/plain', storage_key=blob_key(sha), ref_count=1))
+    variants = [root / 'variants' / sha[:2] / sha[2:4] / sha for sha in (shas[0], shas[4])]
+    for variant in variants:
+        _write(variant / 'thumb.webp')
+        os.utime(variant, (OLD, OLD))
+    _write(root / 'blobs' / 'aa' / 'stray.tmp')
+
+    _write(root / 'project_documents' / 'kept.pdf')
+    _write(root / 'project_documents' / 'lost.pdf')
+    _write(root / 'project_1_legacy.txt')
+    _write(root / 'project_documents' / 'just-saved.pdf', recent=True)
+    _write(root / '.incoming' / 'upload.part')
+    for file_url in ('project_documents/kept.pdf', 'uploads/project_1_legacy.txt'):
+        _db.session.add(Attachment(file_url=file_url, filename='f', uploaded_by=user.id, user_id=user.id))
+    _db.session.commit()
+
+    yield {'root': root, 'shas': shas, 'variants': variants}
+
+    _db.session.rollback()
+    Attachment.query.filter_by(uploaded_by=user.id).delete()
+    Blob.query.delete()
+    _db.session.commit()
+
+def _report(result):
+    with open(result['report']) as f:
+        return [json.loads(line) for line in f]
+
+def _orphans(shas):
+    return {
+        blob_key(shas[3]), blob_key(shas[4]), 'blobs/aa/stray.tmp',
+        f'variants/{shas[4][:2]}/{shas[4][2:4]}/{shas[4]}', 'project_documents/lost.pdf'
+    }
+
+def test_orphans_are_quarantined_and_reported(folder):
+    root, shas = folder['root'], folder['shas']
+
+    result = reconcile_upload_folder(_db.session, str(root), batch_size=2)
+
+    quarantine = root / '.quarantine' / result['run_id']
+    for relpath in _orphans(shas):
+        assert not (root / relpath).exists()
+        assert (quarantine / relpath).exists()
+    for relpath in [blob_key(sha) for sha in shas[:3]] + ['project_documents/kept.pdf', 'project_1_legacy.txt',
+                                                           'project_documents/just-saved.pdf', '.incoming/upload.part']:
+        assert (root / relpath).exists()
+    assert (folder['variants'][0] / 'thumb.webp').exists()
+
+    lines = _report(result)
+    assert {line['path'] for line in lines if line.get('action') == 'quarantined'} == _orphans(shas)
+    assert lines[-1]['summary']['quarantined'] == 5 and lines[-1]['summary']['recent'] == 1
+    assert not (root / '.reconcile' / 'checkpoint.json').exists()
+
+def test_dry_run_changes_nothing(folder):
+    root, shas = folder['root'], folder['shas']
+    result = reconcile_upload_folder(_db.session, str(root), dry_run=True)
+
+    assert result['orphaned'] == 5 and result['quarantined'] == 0
+    assert all((root / relpath).exists() for relpath in _orphans(shas))
+    assert not (root / '.quarantine').exists()
+
+def test_interrupted_run_resumes_from_its_checkpoint(folder, monkeypatch):
+    root, shas = folder['root'], folder['shas']
+    content_hash = file_reconciliation._content_hash
+    calls = []
+
+    def interrupted(parts, entry, is_dir):
+        calls.append(parts)
+        if len(calls) == 4:
+            raise KeyboardInterrupt
+        return content_hash(parts, entry, is_dir)
+
+    monkeypatch.setattr(file_reconciliation, '_content_hash', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        reconcile_upload_folder(_db.session, str(root), batch_size=1)
+    checkpoint = json.loads((root / '.reconcile' / 'checkpoint.json').read_text())
+    assert checkpoint['phase'] == 'blobs'
+
+    monkeypatch.setattr(file_reconciliation, '_content_hash', content_hash)
+    result = reconcile_upload_folder(_db.session, str(root), batch_size=1)
+
+    assert result['run_id'] == checkpoint['run_id']
+    quarantined = [line['path'] for line in _report(result) if line.get('action') == 'quarantined']
+    assert sorted(quarantined) == sorted(_orphans(shas))
+
+def test_quarantine_is_purged_after_its_retention(folder):
+    root = folder['root']
+    _write(root / '.quarantine' / '20200101T000000Z' / 'blobs' / 'old')
+
+    result = reconcile_upload_folder(_db.session, str(root), quarantine_days=7)
+
+    assert result['purged'] == 1
+    assert not (root / '.quarantine' / '20200101T000000Z').exists()
+    assert (root / '.quarantine' / result['run_id']).exists()
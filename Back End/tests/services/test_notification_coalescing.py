@@ -0,0 +1,79 @@
+"""Tests for notification coalescing and digests."""
+from datetime import datetime, timedelta
+import pytest
+from app.extensions import db as _db
+from app.models import User, Notification, OutboxMessage
+from app.services.notification_coalescing import notify_coalesced, send_notification_digests
+
+@pytest.fixture
+def customer(make_user):
+    """A customer with an email address and phone number."""
+    user = make_user('coalesce@example.com', name='Coalesce User', phone='+254700000001')
+    user_id = user.id
+    yield user
+
+    OutboxMessage.query.delete()
+    Notification.query.filter_by(user_id=user_id).delete()
+    _db.session.commit()
+
+def _new_bid(user, project_id=1):
+    notification = notify_coalesced(
+        _db.session, Notification, user.id, 'new_bid', f'project:{project_id}',
+        'New Bid Received', 'A new bid has been submitted for your project: Project X',
+        aggregate=lambda count: ('New Bids Received', f'{count} new bids on Project X')
+    )
+    _db.session.commit()
+    return notification
+
+def test_notifications_merge_within_window(app, customer):
+    """Same-group notifications merge into one row with a running count."""
+    for _ in range(12):
+        _new_bid(customer)
+    _new_bid(customer, project_id=2)
+
+    rows = Notification.query.filter_by(user_id=customer.id).order_by(Notification.id).all()
+    assert len(rows) == 2
+    assert rows[0].group_count == 12
+    assert rows[0].message == '12 new bids on Project X'
+    assert rows[1].group_count == 1
+    assert rows[1].title == 'New Bid Received'
+
+    from app.services.notification_counters import get_unread_count
+    assert get_unread_count(customer.id) == 2
+
+def test_read_or_expired_groups_start_a_new_row(app, customer):
+    """A group closes once it is read or older than the window."""
+    first = _new_bid(customer)
+    first.read = True
+    _db.session.commit()
+    second = _new_bid(customer)
+    assert second.id != first.id
+
+    second.created_at = datetime.utcnow() - timedelta(hours=1)
+    _db.session.commit()
+    third = _new_bid(customer)
+    assert third.id != second.id
+    assert Notification.query.filter_by(user_id=customer.id).count() == 3
+
+def test_digest_sends_one_message_per_channel(app, customer):
+    """Pending notifications go out as a single email and SMS, once."""
+    for _ in range(3):
+        _new_bid(customer)
+    _new_bid(customer, project_id=2)
+
+    assert send_notification_digests(_db.session, Notification, User) == 1
+    messages = OutboxMessage.query.order_by(OutboxMessage.channel).all()
+    assert [m.channel for m in messages] == ['email', 'sms']
+    assert messages[0].subject == 'You have 4 new notifications'
+    assert '3 new bids on Project X' in messages[0].body
+    assert len(messages[1].body) <= 160
+
+    assert send_notification_digests(_db.session, Notification, User) == 0
+    assert OutboxMessage.query.count() == 2
+
+def test_digest_skips_channels_without_a_sender(app, customer):
+    """No SMS digest is queued when the dispatcher cannot send SMS."""
+    _new_bid(customer)
+
+    assert send_notification_digests(_db.session, Notification, User, channels=('email',)) == 1
+    assert [m.channel for m in OutboxMessage.query.all()] == ['email']
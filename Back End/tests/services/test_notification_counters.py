@@ -0,0 +1,85 @@
+"""Tests for reseeding and reconciling unread counters in Redis."""
+import threading
+import pytest
+from app import extensions
+from app.extensions import db as _db
+from app.models import Notification
+from app.services import notification_counters as counters
+
+fakeredis = pytest.importorskip('fakeredis')
+
+@pytest.fixture
+def reader(make_user, monkeypatch):
+    """A user with two unread notifications, and a Redis without their counter."""
+    monkeypatch.setattr(extensions, 'redis_client', fakeredis.FakeRedis())
+    user_id = make_user('counter@example.com', name='Counter User').id
+    for i in range(2):
+        _add(user_id, i)
+    _db.session.commit()
+    extensions.redis_client.flushall()
+
+    yield user_id
+
+    Notification.query.filter_by(user_id=user_id).delete()
+    _db.session.commit()
+
+def _add(user_id, i):
+    _db.session.add(Notification(user_id=user_id, title=f'Note {i}', message='Hello', content='Hello'))
+
+def _cached(user_id):
+    value = extensions.redis_client.get(counters._unread_key(user_id))
+    return None if value is None else int(value)
+
+def test_reseed_skips_counts_changed_during_the_read(app, reader, monkeypatch):
+    """An increment committed between reading the column and seeding is not lost."""
+    script = counters._script
+
+    def interleaved(client, source):
+        if source == counters.SEED_SCRIPT:
+            def commit_elsewhere():
+                with app.app_context():
+                    _add(reader, 'concurrent')
+                    _db.session.commit()
+                    _db.session.remove()
+            thread = threading.Thread(target=commit_elsewhere)
+            thread.start()
+            thread.join()
+        return script(client, source)
+
+    monkeypatch.setattr(counters, '_script', interleaved)
+    assert counters.get_unread_count(reader) == 2
+    assert _cached(reader) is None
+
+    monkeypatch.setattr(counters, '_script', script)
+    assert counters.get_unread_count(reader) == 3
+    assert _cached(reader) == 3
+
+def test_reseed_waits_for_transactions_in_flight(app, reader):
+    """A counter is not seeded while a transaction changing it is uncommitted."""
+    _add(reader, 'pending')
+    _db.session.flush()
+
+    assert counters.get_unread_count(reader) == 3
+    assert _cached(reader) is None
+
+    _db.session.commit()
+    assert counters.get_unread_count(reader) == 3
+    _add(reader, 'next')
+    _db.session.commit()
+    assert _cached(reader) == 4
+
+def test_rolled_back_writers_release_the_counter(app, reader):
+    _add(reader, 'discarded')
+    _db.session.flush()
+    _db.session.rollback()
+
+    assert counters.get_unread_count(reader) == 2
+    assert _cached(reader) == 2
+
+def test_reconcile_drops_every_checked_key(app, reader):
+    """Drift in Redis alone is cleared even when the column is correct."""
+    extensions.redis_client.set(counters._unread_key(reader), 9)
+
+    assert counters.reconcile_unread_counts() == 0
+    assert _cached(reader) is None
+    assert counters.get_unread_count(reader) == 2
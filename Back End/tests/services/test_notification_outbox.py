@@ -0,0 +1,98 @@
+"""Tests for the notification outbox."""
+import threading
+from datetime import datetime, timedelta
+import pytest
+from app.extensions import db as _db
+from app.models import Notification, OutboxMessage
+from app.services.notification_outbox import dispatch_outbox, enqueue_notification_delivery
+
+@pytest.fixture
+def recipient(make_user):
+    """A user with an email address and phone number."""
+    user = make_user('outbox@example.com', name='Outbox User', phone='+254700000000')
+    yield user
+
+    OutboxMessage.query.delete()
+    Notification.query.filter_by(user_id=user.id).delete()
+    _db.session.commit()
+
+def _notify(user, title='Bid Accepted'):
+    notification = Notification(
+        user_id=user.id, title=title, message='Your bid was accepted', content='Content', notification_type='bid'
+    )
+    _db.session.add(notification)
+    enqueue_notification_delivery(_db.session, notification, email=user.email, phone=user.phone)
+    return notification
+
+def test_outbox_rows_share_the_notification_transaction(app, recipient):
+    """Deliveries are only queued if the notification commits, and only once."""
+    _notify(recipient)
+    _db.session.rollback()
+    assert OutboxMessage.query.count() == 0
+
+    notification = _notify(recipient)
+    enqueue_notification_delivery(_db.session, notification, email=recipient.email)
+    _db.session.commit()
+
+    messages = OutboxMessage.query.order_by(OutboxMessage.channel).all()
+    assert [(m.channel, m.recipient) for m in messages] == [
+        ('email', 'outbox@example.com'), ('sms', '+254700000000')
+    ]
+    assert messages[1].body == 'Bid Accepted: Your bid was accepted'
+    assert Notification.query.filter_by(user_id=recipient.id).count() == 1
+
+def test_dispatch_sends_and_retries(app, recipient):
+    """Sent messages are not resent; failures back off until they give up."""
+    _notify(recipient)
+    _db.session.commit()
+
+    delivered = []
+    def send_email(recipient, subject, body):
+        delivered.append((recipient, subject))
+    def send_sms(recipient, subject, body):
+        raise RuntimeError('provider unavailable')
+    senders = {'email': send_email, 'sms': send_sms}
+
+    results = dispatch_outbox(_db.session, senders, max_attempts=2)
+    assert results == {'sent': 1, 'retried': 1, 'failed': 0}
+    assert delivered == [('outbox@example.com', 'Bid Accepted')]
+
+    sms = OutboxMessage.query.filter_by(channel='sms').one()
+    assert sms.status == 'pending'
+    assert sms.attempts == 1
+    assert sms.last_error == 'provider unavailable'
+
+    # Nothing is due until the backoff elapses
+    sms.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    _db.session.commit()
+
+    results = dispatch_outbox(_db.session, senders, max_attempts=2)
+    assert results == {'sent': 0, 'retried': 0, 'failed': 1}
+    assert delivered == [('outbox@example.com', 'Bid Accepted')]
+    assert OutboxMessage.query.filter_by(channel='sms').one().status == 'failed'
+    assert OutboxMessage.query.filter_by(channel='email').one().status == 'sent'
+
+def test_dispatch_only_claims_handled_channels(app, recipient):
+    """A dispatcher leaves messages for channels it cannot send alone."""
+    _notify(recipient)
+    _db.session.commit()
+
+    results = dispatch_outbox(_db.session, {'email': lambda *args: None})
+    assert results['sent'] == 1
+
+    sms = OutboxMessage.query.filter_by(channel='sms').one()
+    assert sms.status == 'pending'
+    assert sms.attempts == 0
+
+def test_dispatch_sends_concurrently(app, recipient):
+    """A claimed batch is sent on several threads at once."""
+    for i in range(4):
+        _notify(recipient, title=f'Notification {i}')
+    _db.session.commit()
+
+    # Every email waits for the others, so this only passes if all four are in flight together
+    barrier = threading.Barrier(4, timeout=5)
+    senders = {'email': lambda *args: barrier.wait()}
+
+    results = dispatch_outbox(_db.session, senders, max_workers=4)
+    assert results == {'sent': 4, 'retried': 0, 'failed': 0}
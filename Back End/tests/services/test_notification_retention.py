@@ -0,0 +1,79 @@
+"""Tests for notification retention."""
+import gzip
+import json
+import zlib
+from datetime import datetime, timedelta
+import pytest
+from app.extensions import db as _db
+from app.models import Notification, NotificationArchive
+from app.services.notification_retention import JsonlArchive, TableArchive, get_archive, purge_notifications
+
+@pytest.fixture
+def old_notifications(make_user):
+    """A user with 10 old read, 2 old unread and 3 recent read notifications."""
+    user = make_user('retention@example.com', name='Retention User')
+
+    old = datetime.utcnow() - timedelta(days=120)
+    recent = datetime.utcnow() - timedelta(days=5)
+    rows = [(old, True)] * 10 + [(old, False)] * 2 + [(recent, True)] * 3
+    for i, (created_at, read) in enumerate(rows):
+        _db.session.add(Notification(
+            user_id=user.id,
+            title=f'Notification {i}',
+            message='Message',
+            content='Content',
+            read=read,
+            notification_type='bid',
+            created_at=created_at
+        ))
+    _db.session.commit()
+
+    user_id = user.id
+    yield user
+
+    NotificationArchive.query.delete()
+    Notification.query.filter_by(user_id=user_id).delete()
+    _db.session.commit()
+
+def test_purge_in_chunks(app, old_notifications):
+    """Only old read notifications are removed, a chunk at a time."""
+    report = purge_notifications(older_than_days=90, chunk_size=4, pause=0)
+
+    assert report['deleted'] == 10
+    assert report['chunks'] == 3
+    assert report['archived'] == 0
+    remaining = Notification.query.filter_by(user_id=old_notifications.id).all()
+    assert len(remaining) == 5
+    assert sum(1 for n in remaining if not n.read) == 2
+
+def test_purge_respects_max_chunks(app, old_notifications):
+    """A run can be capped and resumed later."""
+    assert purge_notifications(chunk_size=4, pause=0, max_chunks=1)['deleted'] == 4
+    assert purge_notifications(chunk_size=4, pause=0)['deleted'] == 6
+
+def test_archive_to_table(app, old_notifications):
+    """Archived rows keep their ID and a compressed copy of the row."""
+    report = purge_notifications(chunk_size=4, pause=0, archive=TableArchive())
+
+    assert report['archived'] == report['deleted'] == 10
+    archived = NotificationArchive.query.order_by(NotificationArchive.id).first()
+    payload = json.loads(zlib.decompress(archived.payload))
+    assert payload['id'] == archived.id
+    assert payload['title'] == 'Notification 0'
+    assert archived.user_id == old_notifications.id
+
+def test_archive_to_jsonl(app, old_notifications, tmp_path):
+    """JSONL archives hold one notification per line across chunks."""
+    path = tmp_path / 'notifications.jsonl.gz'
+    purge_notifications(chunk_size=4, pause=0, archive=JsonlArchive(str(path)))
+
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        titles = [json.loads(line)['title'] for line in archive]
+    assert titles == [f'Notification {i}' for i in range(10)]
+
+def test_get_archive():
+    """Archive modes come from configuration."""
+    assert get_archive(None) is None
+    assert isinstance(get_archive('table'), TableArchive)
+    with pytest.raises(ValueError):
+        get_archive('jsonl')
@@ -0,0 +1,76 @@
+"""Tests for resumable upload sessions."""
+import io
+import os
+from datetime import datetime, timedelta
+import pytest
+from app.extensions import db as _db
+from app.models import UploadChunk, UploadSession
+from app.services.resumable_uploads import (
+    ResumableUploadError, create_upload_session, expire_upload_sessions, upload_path, upload_status, write_chunk
+)
+
+@pytest.fixture
+def owner(make_user):
+    user = make_user('resumable@example.com', name='Resumable')
+    user_id = user.id
+    yield user
+
+    UploadChunk.query.delete()
+    UploadSession.query.filter_by(created_by=user_id).delete()
+    _db.session.commit()
+
+def _session(owner, root, size=10 * 1024 * 1024, chunk_size=1024 * 1024):
+    return create_upload_session(
+        _db.session, root, owner.id, 'plans.pdf', size, chunk_size, ttl=60, user_id=owner.id
+    )
+
+def test_temporary_file_is_sparse(owner, tmp_path):
+    """The full size is reserved up front without allocating blocks."""
+    upload = _session(owner, str(tmp_path))
+    path = upload_path(str(tmp_path), upload.token)
+    
+    assert os.path.getsize(path) == 10 * 1024 * 1024
+    assert os.stat(path).st_blocks * 512 < 1024 * 1024
+
+def test_chunks_are_written_at_their_offset(owner, tmp_path):
+    upload = _session(owner, str(tmp_path), size=2500, chunk_size=1000)
+    
+    write_chunk(_db.session, upload, str(tmp_path), 2, io.BytesIO(b'c' * 500), ttl=60, piece_size=128)
+    write_chunk(_db.session, upload, str(tmp_path), 0, io.BytesIO(b'a' * 1000), ttl=60, piece_size=128)
+    with pytest.raises(ResumableUploadError):
+        write_chunk(_db.session, upload, str(tmp_path), 1, io.BytesIO(b'b' * 1001), ttl=60)
+    with pytest.raises(ResumableUploadError):
+        write_chunk(_db.session, upload, str(tmp_path), 3, io.BytesIO(b''), ttl=60)
+    
+    with open(upload_path(str(tmp_path), upload.token), 'rb') as f:
+        data = f.read()
+    assert data[:1000] == b'a' * 1000 and data[2000:] == b'c' * 500
+    status = upload_status(_db.session, upload)
+    assert status['ranges'] == [[0, 1000], [2000, 2500]]
+    assert status['missing'] == [1]
+
+def test_expired_sessions_are_removed_with_their_files(owner, tmp_path):
+    stale = _session(owner, str(tmp_path), size=100)
+    fresh = _session(owner, str(tmp_path), size=100)
+    write_chunk(_db.session, stale, str(tmp_path), 0, io.BytesIO(b'x' * 100), ttl=60)
+    stale.expires_at = datetime.utcnow() - timedelta(minutes=1)
+    _db.session.commit()
+    stale_path, stale_id = upload_path(str(tmp_path), stale.token), stale.id
+    
+    assert expire_upload_sessions(_db.session, str(tmp_path)) == 1
+    
+    assert not os.path.exists(stale_path)
+    assert os.path.exists(upload_path(str(tmp_path), fresh.token))
+    assert UploadChunk.query.filter_by(session_id=stale_id).count() == 0
+    assert UploadSession.query.filter_by(created_by=owner.id).count() == 1
+
+def test_failed_retry_of_a_received_chunk_marks_it_missing(owner, tmp_path):
+    """A retry that fails its checks has overwritten the chunk, so it must be sent again."""
+    upload = _session(owner, str(tmp_path), size=2000, chunk_size=1000)
+    write_chunk(_db.session, upload, str(tmp_path), 0, io.BytesIO(b'a' * 1000), ttl=60)
+    write_chunk(_db.session, upload, str(tmp_path), 1, io.BytesIO(b'b' * 1000), ttl=60)
+    
+    with pytest.raises(ResumableUploadError):
+        write_chunk(_db.session, upload, str(tmp_path), 0, io.BytesIO(b'X' * 100), ttl=60)
+    
+    assert upload_status(_db.session, upload)['missing'] == [0]
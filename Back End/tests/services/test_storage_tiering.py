@@ -0,0 +1,100 @@
+"""Tests for offloading staged blobs to remote storage."""
+import hashlib
+import pytest
+from app.extensions import db as _db
+from app.models import Blob
+from app.services.blob_storage import blob_key, release_blob
+from app.services.storage_tiering import FilesystemProvider, TieredBlobStore, offload_blobs
+
+class FlakyProvider(FilesystemProvider):
+    """Fails the first `failures` pushes."""
+
+    def __init__(self, root, failures):
+        super().__init__(root, 'https://cdn.example.com')
+        self.failures = failures
+
+    def push(self, path, key, mime_type, filename):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('provider unavailable')
+        return super().push(path, key, mime_type, filename)
+
+@pytest.fixture
+def staged(app, tmp_path):
+    """Stages blobs in a local upload folder, with a remote directory beside it."""
+    with app.app_context():
+        local, remote = tmp_path / 'uploads', tmp_path / 'remote'
+
+        def stage(content, mime_type='text/plain'):
+            sha256 = hashlib.sha256(content).hexdigest()
+            path = local / blob_key(sha256)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(content)
+            blob = Blob(sha256=sha256, size=len(content), mime_type=mime_type, storage_key=blob_key(sha256), ref_count=1)
+            _db.session.add(blob)
+            _db.session.commit()
+            return blob
+
+        yield stage, local, remote
+        _db.session.rollback()
+        Blob.query.delete()
+        _db.session.commit()
+
+def test_pushed_blobs_swap_in_their_url_and_leave_disk(staged):
+    stage, local, remote = staged
+    blobs = [stage(f'schedule {n}'.encode()) for n in range(3)]
+    provider = FilesystemProvider(str(remote), 'https://cdn.example.com/')
+
+    assert offload_blobs(_db.session, str(local), provider, max_workers=3) == {'offloaded': 3, 'retried': 0, 'failed': 0}
+
+    for blob in blobs:
+        _db.session.refresh(blob)
+        assert blob.public_url == f'https://cdn.example.com/{blob.storage_key}'
+        assert (remote / blob.storage_key).read_bytes().startswith(b'schedule')
+        assert not (local / blob.storage_key).exists()
+    assert offload_blobs(_db.session, str(local), provider) == {'offloaded': 0, 'retried': 0, 'failed': 0}
+
+def test_failed_pushes_back_off_and_keep_the_local_copy(staged):
+    stage, local, remote = staged
+    blob = stage(b'site plan')
+    provider = FlakyProvider(str(remote), failures=2)
+
+    assert offload_blobs(_db.session, str(local), provider, base_delay=3600)['retried'] == 1
+    _db.session.refresh(blob)
+    assert blob.public_url is None and blob.offload_attempts == 1
+    assert 'provider unavailable' in blob.offload_error
+    assert (local / blob.storage_key).exists()
+    # Not due again until its retry delay has passed
+    assert offload_blobs(_db.session, str(local), provider)['retried'] == 0
+
+    blob.offload_next_at = None
+    _db.session.commit()
+    assert offload_blobs(_db.session, str(local), provider, max_attempts=2)['failed'] == 1
+    blob.offload_next_at = None
+    _db.session.commit()
+    # Given up on after max_attempts
+    assert offload_blobs(_db.session, str(local), provider, max_attempts=2)['offloaded'] == 0
+    assert offload_blobs(_db.session, str(local), provider, max_attempts=3)['offloaded'] == 1
+
+def test_pdfs_wait_for_their_text_index(staged):
+    stage, local, remote = staged
+    blob = stage(b'%PDF-1.4 tender', mime_type='application/pdf')
+    provider = FilesystemProvider(str(remote), 'https://cdn.example.com')
+
+    assert offload_blobs(_db.session, str(local), provider)['offloaded'] == 0
+    blob.page_count = 0
+    blob.text_indexed_at = blob.created_at
+    _db.session.commit()
+    assert offload_blobs(_db.session, str(local), provider)['offloaded'] == 1
+
+def test_deleting_an_offloaded_blob_removes_the_remote_copy(staged):
+    stage, local, remote = staged
+    blob = stage(b'bill of quantities')
+    provider = FilesystemProvider(str(remote), 'https://cdn.example.com')
+    offload_blobs(_db.session, str(local), provider)
+    key = blob.storage_key
+
+    release_blob(_db.session, blob.id, TieredBlobStore(str(local), provider))
+    _db.session.commit()
+
+    assert not (remote / key).exists()
@@ -0,0 +1,43 @@
+"""Tests for the write-behind last-active buffer."""
+from datetime import datetime
+import pytest
+from app.extensions import db as _db
+from app.models import User
+from app.utils.activity import LastActiveBuffer
+
+@pytest.fixture
+def user(make_user):
+    """Create a user outside of the transactional fixtures, since flushing commits."""
+    return make_user('active@example.com', name='Active User')
+
+def test_flush_keeps_latest_timestamp(app, user, monkeypatch):
+    """Buffered timestamps are written in bulk and never move backwards."""
+    monkeypatch.setattr('app.extensions.redis_client', None)
+    buffer = LastActiveBuffer(min_interval=0, flush_interval=3600)
+    
+    buffer.record(user.id, timestamp=2000000000)
+    buffer.record(user.id, timestamp=1900000000)
+    assert buffer.pending_for([user.id]) == {user.id: datetime(2033, 5, 18, 3, 33, 20)}
+    
+    assert buffer.flush() == 1
+    assert buffer.pending_for([user.id]) == {}
+    _db.session.refresh(user)
+    assert user.last_active == datetime(2033, 5, 18, 3, 33, 20)
+    
+    # An older buffered timestamp does not overwrite a newer stored one
+    buffer.record(user.id, timestamp=1800000000)
+    buffer.flush()
+    _db.session.refresh(user)
+    assert user.last_active == datetime(2033, 5, 18, 3, 33, 20)
+
+def test_record_is_throttled_per_user(monkeypatch):
+    """Repeated activity within min_interval is not buffered again."""
+    monkeypatch.setattr('app.extensions.redis_client', None)
+    buffer = LastActiveBuffer(min_interval=60, flush_interval=3600)
+    
+    buffer.record(1, timestamp=1000)
+    buffer.record(1, timestamp=1030)
+    assert buffer._pending == {1: 1000}
+    
+    buffer.record(1, timestamp=1061)
+    assert buffer._pending == {1: 1061}
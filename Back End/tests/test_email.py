@@ -0,0 +1,169 @@
+"""Tests for the pooled and async SMTP email delivery, against a local aiosmtpd server."""
+import asyncio
+import socket
+import pytest
+from flask import Flask
+from app.utils.email import EmailService
+
+aiosmtpd_controller = pytest.importorskip('aiosmtpd.controller')
+
+class RecordingHandler:
+    """Records each delivered message and the client connection it arrived on."""
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((session.peer, envelope.rcpt_tos))
+        return '250 Message accepted for delivery'
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    controller = aiosmtpd_controller.Controller(handler, hostname='127.0.0.1', port=_free_port())
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+def _service(controller, **config):
+    app = Flask('email-test')
+    app.config.update(
+        MAIL_SERVER=controller.hostname,
+        MAIL_PORT=controller.port,
+        MAIL_USE_TLS=False,
+        MAIL_DEFAULT_SENDER='noreply@example.com',
+        **config
+    )
+    return EmailService(app)
+
+def _send(service, count):
+    for i in range(count):
+        assert service.send_email(subject=f'Message {i}', recipients=f'user{i}@example.com', text_body='Hello')
+
+def test_sessions_are_reused_and_recycled(smtp_server):
+    """Messages share one session until it has sent MAIL_POOL_MAX_MESSAGES."""
+    controller, handler = smtp_server
+    service = _service(controller, MAIL_POOL_MAX_MESSAGES=10)
+
+    _send(service, 25)
+
+    assert len(handler.messages) == 25
+    assert len({peer for peer, _ in handler.messages}) == 3
+    metrics = service.pool_metrics()
+    assert metrics['created'] == 3
+    assert metrics['recycled'] == 2
+    assert metrics['reused'] == 22
+    assert metrics['messages'] == 25
+    assert metrics['idle'] == 1
+    service.pool.close()
+
+def test_dropped_session_is_replaced(smtp_server):
+    """A session the server dropped is discarded and the message retried."""
+    controller, handler = smtp_server
+    service = _service(controller)
+    _send(service, 1)
+
+    server, _, _ = service.pool._idle[0]
+    server.close()
+    _send(service, 1)
+
+    assert len(handler.messages) == 2
+    metrics = service.pool_metrics()
+    assert metrics['created'] == 2
+    assert metrics['errors'] == 1
+    service.pool.close()
+
+def test_pooled_sends_share_one_session(smtp_server):
+    """Pooled messages share one session instead of a connect-login-quit per message."""
+    controller, handler = smtp_server
+    pooled = _service(controller)
+    unpooled = _service(controller, MAIL_POOL_MAX_MESSAGES=1)
+
+    _send(unpooled, 50)
+    _send(pooled, 50)
+
+    assert len(handler.messages) == 100
+    assert pooled.pool_metrics()['created'] == 1
+    assert unpooled.pool_metrics()['created'] == 50
+    pooled.pool.close()
+
+class SlowHandler(RecordingHandler):
+    """Takes `delay` seconds to accept each message and refuses @blocked.example.com."""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.endswith('@blocked.example.com'):
+            return '550 Mailbox unavailable'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.delay)
+        return await super().handle_DATA(server, session, envelope)
+
+@pytest.fixture
+def slow_smtp_server():
+    handler = SlowHandler(delay=0.05)
+    controller = aiosmtpd_controller.Controller(handler, hostname='127.0.0.1', port=_free_port())
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+def _messages(service, count, domain='example.com'):
+    return [
+        service.create_message(subject=f'Message {i}', recipients=f'user{i}@{domain}', text_body='Hello')
+        for i in range(count)
+    ]
+
+def test_async_engine_keeps_many_messages_in_flight(slow_smtp_server):
+    """One process sends dozens of messages at once, bounded by MAIL_ASYNC_CONCURRENCY."""
+    controller, handler = slow_smtp_server
+    service = _service(controller, MAIL_ASYNC_CONCURRENCY=20)
+
+    results = service.send_messages(_messages(service, 60))
+
+    assert results == [None] * 60
+    assert len(handler.messages) == 60
+    metrics = service.async_engine.metrics()
+    assert metrics['peak_in_flight'] == 20
+    assert metrics['connections'] == 20
+    service.async_engine.close()
+    service.pool.close()
+
+def test_async_engine_reports_failures_per_message(slow_smtp_server):
+    """A refused message fails on its own without affecting the rest."""
+    controller, handler = slow_smtp_server
+    service = _service(controller)
+
+    messages = _messages(service, 3) + _messages(service, 2, domain='blocked.example.com')
+    results = service.send_messages(messages)
+
+    assert results[:3] == [None] * 3
+    assert all(isinstance(error, Exception) for error in results[3:])
+    assert service.async_engine.metrics()['failed'] == 2
+    service.async_engine.close()
+
+def test_template_emails_are_rendered_and_sent_as_a_batch(smtp_server, tmp_path):
+    """Each recipient gets their own rendering of one compiled template."""
+    controller, handler = smtp_server
+    (tmp_path / 'reminder.txt').write_text('Hi {{ name }}')
+    service = _service(controller, MAIL_TEMPLATE_FOLDER=str(tmp_path))
+
+    results = service.send_template_emails(
+        'reminder', 'Reminder for {{ name }}',
+        recipients=['a@example.com', 'b@example.com'],
+        contexts=[{'name': 'A'}, {'name': 'B'}]
+    )
+
+    assert results == [None, None]
+    assert sorted(rcpt for _, rcpt in handler.messages) == [['a@example.com'], ['b@example.com']]
+    assert service.templates.metrics()['rendered'] == 2
+    service.async_engine.close()
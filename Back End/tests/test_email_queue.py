@@ -0,0 +1,52 @@
+"""Tests for claiming and delivering rows of the email queue."""
+from datetime import datetime, timedelta
+import pytest
+from app.extensions import db as _db
+from app.models import EmailQueue
+
+pytest.importorskip('celery')
+
+@pytest.fixture(autouse=True)
+def app_context(app):
+    with app.app_context():
+        yield
+        EmailQueue.query.delete()
+        _db.session.commit()
+
+def _queue(subject, priority='normal', **values):
+    email = EmailQueue(
+        subject=subject, recipient_email='user@example.com', sender_email='noreply@example.com', text_body='Hello',
+        priority=priority, scheduled_at=values.pop('scheduled_at', datetime.utcnow()), **values
+    )
+    _db.session.add(email)
+    _db.session.commit()
+    return email
+
+def test_claims_due_emails_by_priority(app):
+    """High priority email is claimed first, and emails scheduled for later are left."""
+    from app.tasks.email_tasks import claim_queued_emails
+    _queue('Low', priority='low')
+    _queue('Normal')
+    _queue('High', priority='high')
+    _queue('Later', scheduled_at=datetime.utcnow() + timedelta(hours=1))
+
+    assert {email.subject for email in claim_queued_emails(batch_size=2)} == {'High', 'Normal'}
+    assert [email.subject for email in claim_queued_emails(batch_size=10)] == ['Low']
+    assert claim_queued_emails(batch_size=10) == []
+    assert EmailQueue.query.filter_by(subject='Later').one().status == 'pending'
+
+def test_failed_delivery_is_retried_with_backoff(app, monkeypatch):
+    """A failed send goes back to pending with a later scheduled time."""
+    from app.tasks.email_tasks import claim_queued_emails, deliver_claimed_emails
+    from app.utils.email import email_service
+    email = _queue('Hello')
+    monkeypatch.setattr(email_service, 'send_messages', lambda messages: [RuntimeError('refused')] * len(messages))
+
+    outcome = deliver_claimed_emails(claim_queued_emails())
+
+    assert outcome == {'sent': [], 'retried': [email.id], 'failed': []}
+    _db.session.refresh(email)
+    assert email.status == 'pending'
+    assert email.attempts == 1
+    assert email.last_error == 'refused'
+    assert email.scheduled_at > datetime.utcnow()
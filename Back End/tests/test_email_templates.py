@@ -0,0 +1,76 @@
+"""Tests for compiled email template rendering."""
+import os
+import pytest
+from flask import Flask
+from jinja2 import TemplateNotFound
+from app.utils.email import EmailService
+from app.utils.email_templates import EmailTemplateEngine
+
+EMAIL_TEMPLATES = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'app', 'templates', 'emails')
+
+@pytest.fixture
+def engine(tmp_path):
+    """An engine over a folder with a personalized and a static template."""
+    (tmp_path / 'bid_accepted.txt').write_text('Hi {{ name }}, your bid of {{ amount }} was accepted.')
+    (tmp_path / 'bid_accepted.html').write_text('<p>Hi {{ name }}, your bid of {{ amount }} was accepted.</p>')
+    (tmp_path / 'maintenance.txt').write_text('The site is down for maintenance tonight.')
+    return EmailTemplateEngine(str(tmp_path))
+
+def test_templates_are_compiled_once(engine):
+    """Every template is compiled at startup and never again."""
+    assert engine.precompile() == 3
+    assert engine.metrics()['compiled'] == 3
+    assert engine.metrics()['static'] == 1
+
+    rendered = engine.render_batch(
+        'bid_accepted',
+        [{'name': 'Amina', 'amount': 100}, {'name': '<b>Otieno</b>', 'amount': 250}],
+        subject='Bid accepted, {{ name }}',
+        shared={'amount': 0}
+    )
+    assert rendered[0].subject == 'Bid accepted, Amina'
+    assert rendered[0].text_body == 'Hi Amina, your bid of 100 was accepted.'
+    # Only the HTML body is escaped
+    assert rendered[1].subject == 'Bid accepted, <b>Otieno</b>'
+    assert rendered[1].html_body == '<p>Hi &lt;b&gt;Otieno&lt;/b&gt;, your bid of 250 was accepted.</p>'
+
+    static = engine.render('maintenance', {'name': 'Amina'}, subject='Maintenance')
+    assert static == ('Maintenance', 'The site is down for maintenance tonight.', None)
+    assert engine.metrics() == {'compiled': 3, 'rendered': 3, 'static': 1}
+
+def test_missing_template(engine):
+    """A template with neither a .txt nor an .html file is an error."""
+    with pytest.raises(TemplateNotFound):
+        engine.render('missing')
+
+    app = Flask('email-test')
+    app.config.update(MAIL_TEMPLATE_FOLDER=engine.folder, MAIL_DEFAULT_SENDER='noreply@example.com')
+    assert EmailService(app).send_template_email('missing', 'Subject', 'user@example.com') is False
+
+def test_render_batch_reuses_compiled_templates(monkeypatch):
+    """10k personalized reminder emails read and compile each template file once."""
+    engine = EmailTemplateEngine(EMAIL_TEMPLATES)
+    loads = []
+    get_source = engine.env.loader.get_source
+
+    def counting_get_source(environment, name):
+        loads.append(name)
+        return get_source(environment, name)
+
+    monkeypatch.setattr(engine.env.loader, 'get_source', counting_get_source)
+    contexts = [{'user': {'name': f'User {i}'}, 'days_inactive': 30 + i % 60} for i in range(10000)]
+
+    rendered = engine.render_batch('user_inactive_reminder', contexts, subject='We miss you, {{ user.name }}!')
+
+    assert len(rendered) == 10000
+    assert rendered[42].subject == 'We miss you, User 42!'
+    assert 'You haven\'t logged in for 72 days' in rendered[42].text_body
+    assert set(loads) == {'user_inactive_reminder.txt', 'user_inactive_reminder.html'}
+    assert engine.metrics()['compiled'] == 2
+    assert len(engine._subjects) == 1
+
+    # Later batches render from the compiled templates without touching the files
+    loads.clear()
+    engine.render_batch('user_inactive_reminder', contexts[:10], subject='We miss you, {{ user.name }}!')
+    assert loads == []
+    assert engine.metrics()['compiled'] == 2
@@ -0,0 +1,127 @@
+"""Tests for image variant rendering."""
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+import pytest
+from app.services.image_variants import (
+    ImageVariants, VariantError, missing_variants, render_variants, variant_key
+)
+
+SHA = 'ab' * 32
+
+@pytest.fixture
+def photo(tmp_path):
+    path = tmp_path / 'photo.jpg'
+    Image.new('RGB', (4000, 3000), (10, 90, 160)).save(path, 'JPEG', quality=90)
+    return str(path)
+
+def test_render_variants_never_upscales(tmp_path, photo):
+    """Each target is bounded by its edge, and smaller sources keep their size."""
+    targets = [
+        (200, 'WEBP', str(tmp_path / 'thumb.webp')),
+        (1280, 'JPEG', str(tmp_path / 'medium.jpg')),
+        (8000, 'JPEG', str(tmp_path / 'huge.jpg'))
+    ]
+    assert render_variants(photo, targets) == (4000, 3000)
+    
+    assert Image.open(tmp_path / 'thumb.webp').size == (200, 150)
+    assert Image.open(tmp_path / 'medium.jpg').size == (1280, 960)
+    assert Image.open(tmp_path / 'huge.jpg').size == (4000, 3000)
+
+def test_transparent_images_flatten_to_white_jpeg(tmp_path):
+    source = tmp_path / 'logo.png'
+    Image.new('RGBA', (50, 50), (0, 0, 0, 0)).save(source)
+    
+    render_variants(str(source), [(200, 'JPEG', str(tmp_path / 'logo.jpg'))])
+    
+    assert Image.open(tmp_path / 'logo.jpg').getpixel((25, 25)) == (255, 255, 255)
+
+def test_render_variants_rejects_non_images(tmp_path):
+    source = tmp_path / 'notes.jpg'
+    source.write_bytes(b'not an image')
+    with pytest.raises(VariantError):
+        render_variants(str(source), [(200, 'JPEG', str(tmp_path / 'out.jpg'))])
+
+def test_missing_variants_skips_cached_files(tmp_path):
+    cached = tmp_path / variant_key(SHA, 'thumb', 'webp')
+    cached.parent.mkdir(parents=True)
+    cached.write_bytes(b'cached')
+    
+    keys, targets = missing_variants(str(tmp_path), SHA, sizes=['thumb', 'small'])
+    
+    assert keys['thumb']['webp'] == variant_key(SHA, 'thumb', 'webp')
+    assert len(targets) == 3
+    assert str(cached) not in [path for _, _, path in targets]
+
+def test_concurrent_requests_share_one_render(tmp_path, photo):
+    """Requests for a variant that is being rendered wait for that render."""
+    submitted = []
+    release = threading.Event()
+    
+    class Pool:
+        def submit(self, fn, *args):
+            submitted.append(args)
+            future = Future()
+            def run():
+                release.wait(5)
+                future.set_result(fn(*args))
+            threading.Thread(target=run).start()
+            return future
+    
+    variants = ImageVariants()
+    variants._executor = Pool()
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(variants.get(str(tmp_path), SHA, photo, 'thumb', 'jpeg')))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(10)
+    
+    assert len(submitted) == 1
+    assert len(set(results)) == 1 and len(results) == 5
+    assert Image.open(results[0]).size == (200, 150)
+    assert variants._inflight == {}
+
+def test_process_pool_renders_variants(tmp_path, photo):
+    """The default pool renders in separate processes."""
+    variants = ImageVariants(max_workers=1)
+    try:
+        keys = variants.generate(str(tmp_path), SHA, photo, sizes=['thumb', 'small'])
+    finally:
+        variants.shutdown()
+    
+    assert Image.open(tmp_path / keys['small']['webp']).size == (640, 480)
+    assert Image.open(tmp_path / keys['thumb']['jpeg']).size == (200, 150)
+
+def test_broken_pool_is_replaced(tmp_path, photo):
+    """A render lost to a dead pool process is retried once on a fresh pool."""
+    class BrokenPool:
+        def submit(self, fn, *args):
+            future = Future()
+            future.set_exception(BrokenProcessPool('A process in the pool was terminated abruptly'))
+            return future
+        def shutdown(self, wait=True):
+            pass
+    
+    variants = ImageVariants(max_workers=1)
+    variants._executor = BrokenPool()
+    try:
+        path = variants.get(str(tmp_path), SHA, photo, 'thumb', 'jpeg')
+    finally:
+        variants.shutdown()
+    
+    assert Image.open(path).size == (200, 150)
+
+def test_missing_source_is_not_a_variant_error(tmp_path):
+    """A missing source raises FileNotFoundError without reaching the pool."""
+    variants = ImageVariants()
+    with pytest.raises(FileNotFoundError):
+        variants.get(str(tmp_path), SHA, str(tmp_path / 'gone.jpg'), 'thumb', 'jpeg')
+    with pytest.raises(FileNotFoundError):
+        render_variants(str(tmp_path / 'gone.jpg'), [(200, 'JPEG', str(tmp_path / 'out.jpg'))])
+    assert variants._executor is None
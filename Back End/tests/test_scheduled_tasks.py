@@ -0,0 +1,33 @@
+"""Tests for the Celery beat tasks."""
+from datetime import datetime, timedelta
+import pytest
+from app.extensions import db as _db
+from app.models import EmailQueue, Notification
+
+pytest.importorskip('celery')
+
+def test_beat_schedule_tasks_are_registered(app):
+    from app.tasks import scheduled, file_tasks
+    from app.tasks.celery import init_celery
+
+    celery = init_celery(app)
+
+    for name, entry in celery.conf.beat_schedule.items():
+        assert entry['task'] in celery.tasks, name
+
+def test_inactive_users_without_activity_fall_back_to_sign_up(make_user):
+    """Users never seen active are judged by when they signed up."""
+    from app.tasks.scheduled import notify_inactive_users
+    users = [
+        make_user(f'{name}@example.com', created_at=datetime.utcnow() - timedelta(days=days))
+        for name, days in (('dormant', 40), ('newcomer', 2))
+    ]
+
+    assert notify_inactive_users() == {'notified': 1, 'total_inactive': 1}
+    notification = Notification.query.filter_by(notification_type='inactive_user').one()
+    assert notification.user_id == users[0].id
+    assert notify_inactive_users()['notified'] == 0
+
+    EmailQueue.query.delete()
+    Notification.query.filter_by(notification_type='inactive_user').delete()
+    _db.session.commit()
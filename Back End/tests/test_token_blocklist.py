@@ -0,0 +1,57 @@
+"""Tests for the Bloom-filter fronted JWT blocklist."""
+import uuid
+from unittest.mock import MagicMock
+from app.utils.token_blocklist import BloomFilter, TokenBlocklist, BLOCKLIST_CHANNEL
+
+def make_blocklist(revoked=()):
+    """Create a blocklist over a mock Redis holding the given revoked JTIs."""
+    store = {f'jwt_blocklist:{jti}': 'true' for jti in revoked}
+    redis_client = MagicMock()
+    redis_client.get.side_effect = store.get
+    redis_client.scan_iter.side_effect = lambda match, count: list(store)
+    blocklist = TokenBlocklist(redis_client, capacity=1000)
+    # Pretend the listener is already running in this process
+    blocklist.ensure_listening = lambda: None
+    return blocklist, redis_client
+
+def test_bloom_filter_membership():
+    """Added items are always found and unrelated items rarely are."""
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    added = [uuid.uuid4().hex for _ in range(1000)]
+    for jti in added:
+        bloom.add(jti)
+    
+    assert all(jti in bloom for jti in added)
+    false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+    assert false_positives < 300
+
+def test_unsynced_blocklist_checks_redis():
+    """Before the filter is built every check is confirmed in Redis."""
+    blocklist, redis_client = make_blocklist(revoked=['revoked-jti'])
+    
+    assert blocklist.is_revoked('revoked-jti')
+    assert not blocklist.is_revoked('valid-jti')
+    assert redis_client.get.call_count == 2
+
+def test_filter_miss_skips_redis():
+    """Once built, tokens missing from the filter never touch Redis."""
+    blocklist, redis_client = make_blocklist(revoked=['revoked-jti'])
+    blocklist.rebuild()
+    
+    assert not blocklist.is_revoked('valid-jti')
+    redis_client.get.assert_not_called()
+    
+    assert blocklist.is_revoked('revoked-jti')
+    redis_client.get.assert_called_once_with('jwt_blocklist:revoked-jti')
+
+def test_revoke_publishes_and_updates_filter():
+    """Revoking stores the key, notifies other workers and updates the local filter."""
+    blocklist, redis_client = make_blocklist()
+    blocklist.rebuild()
+    
+    blocklist.revoke('new-jti')
+    
+    redis_client.set.assert_called_once()
+    assert redis_client.set.call_args[0][0] == 'jwt_blocklist:new-jti'
+    redis_client.publish.assert_called_once_with(BLOCKLIST_CHANNEL, 'new-jti')
+    assert 'new-jti' in blocklist._filter
@@ -0,0 +1,67 @@
+"""Tests for streaming upload handling."""
+import hashlib
+import io
+import os
+import tracemalloc
+import pytest
+from app.utils.storage import FileTooLargeError
+from app.utils.uploads import commit_upload, receive_upload, sniff_mime_type
+
+class CountingStream(io.RawIOBase):
+    """Yields `size` bytes of a repeating pattern and counts how many were read."""
+
+    def __init__(self, size, head=b''):
+        self.remaining = size
+        self.head = head
+        self.read_bytes = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self.remaining)
+        data = (self.head + b'x' * n)[:n]
+        self.head = self.head[n:]
+        buffer[:n] = data
+        self.remaining -= n
+        self.read_bytes += n
+        return n
+
+def test_upload_is_streamed_in_bounded_memory(tmp_path):
+    """A 16 MB upload is hashed and stored without holding it in memory."""
+    size = 16 * 1024 * 1024
+    stream = io.BufferedReader(CountingStream(size, head=b'%PDF-1.4\n'), buffer_size=64 * 1024)
+
+    tracemalloc.start()
+    upload = receive_upload(stream, str(tmp_path / 'incoming'), max_size=size, filename='plan.pdf')
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert peak < 512 * 1024
+    assert upload.size == size
+    assert upload.mime_type == 'application/pdf'
+    digest = hashlib.sha256()
+    with open(upload.path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    assert upload.sha256 == digest.hexdigest()
+
+    stored = commit_upload(upload, str(tmp_path / 'jobs' / 'plan.pdf'))
+    assert os.path.getsize(stored.path) == size
+    assert os.listdir(tmp_path / 'incoming') == []
+
+def test_oversized_upload_is_aborted_early(tmp_path):
+    """Reading stops at the first chunk past the limit and nothing is left behind."""
+    stream = CountingStream(100 * 1024 * 1024)
+
+    with pytest.raises(FileTooLargeError):
+        receive_upload(stream, str(tmp_path), max_size=1024 * 1024, chunk_size=64 * 1024)
+
+    assert stream.read_bytes <= 1024 * 1024 + 64 * 1024
+    assert os.listdir(tmp_path) == []
+
+def test_mime_type_is_sniffed_from_content():
+    """Content decides the type; the extension only refines generic results."""
+    assert sniff_mime_type(b'GIF89a\x01\x00\x01\x00\x80' + b'\0' * 32, 'photo.pdf') == 'image/gif'
+    assert sniff_mime_type(b'name,amount\nCement,100\n', 'boq.csv') == 'text/csv'
+    assert sniff_mime_type(b'', 'empty.txt') == 'text/plain'
@@ -0,0 +1,56 @@
+"""Tests for work queue claiming."""
+from datetime import datetime
+import pytest
+from app.extensions import db as _db
+from app.models import OutboxMessage
+from app.utils.work_queue import claim_batch, run_concurrently
+
+@pytest.fixture
+def queue(app):
+    """Ten pending outbox messages."""
+    with app.app_context():
+        for i in range(10):
+            _db.session.add(OutboxMessage(
+                channel='email', recipient=f'user{i}@example.com', body='Hello',
+                status='pending', next_attempt_at=datetime(2026, 1, 1)
+            ))
+        _db.session.commit()
+        yield OutboxMessage.__table__
+        OutboxMessage.query.delete()
+        _db.session.commit()
+
+def _claim(table, worker):
+    rows = claim_batch(
+        _db.session, table,
+        ready=[table.c.status == 'pending', table.c.claimed_by.is_(None)],
+        order_by=[table.c.id],
+        batch_size=4,
+        values={'claimed_by': worker},
+        returning=[table.c.id, table.c.recipient]
+    )
+    _db.session.commit()
+    return rows
+
+def test_claims_are_disjoint(app, queue):
+    """Successive claims never hand out the same row twice."""
+    first = _claim(queue, 'worker-1')
+    second = _claim(queue, 'worker-2')
+    third = _claim(queue, 'worker-3')
+
+    assert [len(first), len(second), len(third)] == [4, 4, 2]
+    ids = [row.id for row in first + second + third]
+    assert len(set(ids)) == 10
+    assert ids == sorted(ids)
+    assert OutboxMessage.query.filter_by(claimed_by='worker-2').count() == 4
+    assert _claim(queue, 'worker-4') == []
+
+def test_run_concurrently_collects_failures():
+    """Failures are returned alongside their item instead of aborting the batch."""
+    def handler(item):
+        if item % 3 == 0:
+            raise ValueError(item)
+
+    succeeded, failed = run_concurrently(list(range(1, 10)), handler, max_workers=3)
+    assert succeeded == [1, 2, 4, 5, 7, 8]
+    assert [item for item, _ in failed] == [3, 6, 9]
+    assert run_concurrently([], handler) == ([], [])